@@ -15,45 +15,554 @@ WeChat: rggboom
 import sys
 import os
 import json
+import re
+import argparse
+import atexit
+import gc
+import hashlib
+import io
+import itertools
+import linecache
+import mmap
+import shutil
+import signal
+import threading
+import time
+import tracemalloc
+import warnings
+import zipfile
+import zlib
+import numpy as np
 import yaml
+from collections import ChainMap, Counter, OrderedDict, deque
+from collections.abc import Mapping
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
+from html import escape as html_escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QGridLayout, QLabel, QLineEdit, 
                             QTextEdit, QComboBox, QPushButton, QTableWidget, 
                             QTableWidgetItem, QTabWidget, QGroupBox, QSpinBox,
                             QDateEdit, QFileDialog, QMessageBox, QSplitter,
-                            QHeaderView, QAbstractItemView, QCheckBox)
-from PyQt5.QtCore import Qt, QDate, pyqtSignal
-from PyQt5.QtGui import QFont, QIcon
+                            QHeaderView, QAbstractItemView, QCheckBox,
+                            QTableView, QTreeView, QInputDialog, QTextBrowser)
+from PyQt5.QtCore import (Qt, QDate, QTimer, pyqtSignal, QAbstractTableModel,
+                          QAbstractProxyModel, QAbstractItemModel, QModelIndex, QUrl)
+from PyQt5.QtGui import QFont, QIcon, QDesktopServices
 from docx import Document
+from docx.document import _Body
 from docx.shared import Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docx.table import Table
 from docx.oxml.shared import OxmlElement, qn
+from lxml import etree
+
+# 统计图表为可选功能，未安装 matplotlib 时报告中不输出图表
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    matplotlib.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'PingFang SC', 'Noto Sans CJK SC',
+                                              'WenQuanYi Micro Hei', 'DejaVu Sans']
+    matplotlib.rcParams['axes.unicode_minus'] = False
+except ImportError:
+    matplotlib = None
+
+# 证据截图缩小和重新压缩为可选功能，未安装 Pillow 时按原图插入
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 程序启动时间（主模块加载完成），用于统计界面首次绘制和可交互耗时
+STARTUP_TIME = time.perf_counter()
+
+class Metrics:
+    """运行指标（计数器、直方图、仪表），以 Prometheus 文本格式导出
+
+    未启用时各记录方法直接返回，不产生额外开销。子进程中记录的指标通过 drain()
+    随任务结果返回，由主进程 merge() 汇总（仪表取最大值）。
+    """
+    
+    TIME_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+    MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 512, 1024, 2048, 4096))
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    
+    # 指标名 -> (类型, 说明, 直方图分桶)
+    DEFINITIONS = {
+        'ssreport_report_jobs_total': ('counter', '报告任务数（status=success/failure）', None),
+        'ssreport_report_seconds': ('histogram', '报告任务耗时（秒），从构建模型到全部版本写出', TIME_BUCKETS),
+        'ssreport_documents_total': ('counter', '写出的Word文档数', None),
+        'ssreport_document_seconds': ('histogram', '单个文档渲染耗时（秒）', TIME_BUCKETS),
+        'ssreport_document_rss_bytes': ('histogram', '文档保存前的进程常驻内存（字节），近似单个文档的内存峰值',
+                                        MEMORY_BUCKETS),
+        'ssreport_findings_total': ('counter', '渲染的漏洞数', None),
+        'ssreport_cache_requests_total': ('counter', '缓存查询次数（cache=vulnwiki/chart/evidence/section，result=hit/miss）', None),
+        'ssreport_vulnwiki_load_seconds': ('gauge', '漏洞库加载耗时（秒）', None),
+        'ssreport_vulnwiki_entries': ('gauge', '漏洞库条目数', None),
+        'ssreport_template_load_seconds': ('gauge', '模板加载耗时（秒）', None),
+        'ssreport_templates': ('gauge', '模板数', None),
+        'ssreport_daemon_jobs_total': ('counter', '守护进程处理的项目文件数（status=success/failure）', None),
+        'ssreport_daemon_job_seconds': ('histogram', '守护进程从提交到完成一个项目文件的耗时（秒）', TIME_BUCKETS),
+        'ssreport_daemon_running_jobs': ('gauge', '守护进程正在生成的项目文件数', None),
+        'ssreport_gui_event_latency_seconds': ('histogram', '界面事件循环延迟（秒），即心跳定时器晚于预定时间触发的时长',
+                                               LATENCY_BUCKETS),
+        'ssreport_gui_stalls_total': ('counter', '界面卡顿次数（slot=卡顿期间执行的槽函数）', None),
+        'ssreport_gui_stall_seconds': ('histogram', '界面卡顿时长（秒）', LATENCY_BUCKETS),
+    }
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.values = {}      # (指标名, 标签) -> 数值（计数器和仪表）
+        self.histograms = {}  # (指标名, 标签) -> [各分桶计数, 总和, 次数]
+    
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+    
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+    
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        buckets = self.DEFINITIONS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+    
+    def time(self, name, **labels):
+        """统计代码块耗时到直方图"""
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(name, labels)
+    
+    @contextmanager
+    def _timer(self, name, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    
+    def drain(self):
+        """取出并清空已记录的指标（子进程随任务结果返回），未启用时返回None"""
+        if not self.enabled:
+            return None
+        with self.lock:
+            snapshot = (self.values, self.histograms)
+            self.values, self.histograms = {}, {}
+        return snapshot
+    
+    def merge(self, snapshot):
+        """汇总子进程的指标"""
+        if not self.enabled or not snapshot:
+            return
+        values, histograms = snapshot
+        with self.lock:
+            for key, value in values.items():
+                if self.DEFINITIONS[key[0]][0] == 'counter':
+                    self.values[key] = self.values.get(key, 0) + value
+                else:
+                    self.values[key] = max(self.values.get(key, value), value)
+            for key, (counts, total, count) in histograms.items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = [[0] * len(counts), 0.0, 0]
+                histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+                histogram[1] += total
+                histogram[2] += count
+    
+    @staticmethod
+    def format_labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ''
+        escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+    
+    def render(self):
+        """Prometheus 文本格式"""
+        with self.lock:
+            values = dict(self.values)
+            histograms = {key: (list(counts), total, count) for key, (counts, total, count) in self.histograms.items()}
+        lines = []
+        for name, (kind, text, buckets) in self.DEFINITIONS.items():
+            if kind == 'histogram':
+                samples = sorted((key, value) for key, value in histograms.items() if key[0] == name)
+            else:
+                samples = sorted((key, value) for key, value in values.items() if key[0] == name)
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (_, labels), value in samples:
+                if kind != 'histogram':
+                    lines.append(f'{name}{self.format_labels(labels)} {value}')
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{self.format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_bucket{self.format_labels(labels, [("le", "+Inf")])} {count}')
+                lines.append(f'{name}_sum{self.format_labels(labels)} {total}')
+                lines.append(f'{name}_count{self.format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+    
+    def write_textfile(self, path):
+        """写入文本文件（供 node_exporter textfile collector 采集），先写临时文件再替换"""
+        try:
+            with open(f'{path}.{os.getpid()}.tmp', 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(f'{path}.{os.getpid()}.tmp', path)
+        except Exception as e:
+            print(f"写入指标文件失败: {e}")
+    
+    def serve(self, port, host=''):
+        """在后台线程提供 HTTP /metrics 接口，返回服务器对象"""
+        metrics = self
+        
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+# 设置 SSREPORT_METRICS=1 或 SSREPORT_METRICS_FILE 时启用指标（子进程继承环境变量）；
+# 批量运行时在主进程退出时写出 SSREPORT_METRICS_FILE
+METRICS = Metrics(enabled=bool(os.environ.get('SSREPORT_METRICS') or os.environ.get('SSREPORT_METRICS_FILE')))
+if os.environ.get('SSREPORT_METRICS_FILE') and multiprocessing.current_process().name == 'MainProcess':
+    atexit.register(METRICS.write_textfile, os.environ['SSREPORT_METRICS_FILE'])
+
+class VulnNameResolver:
+    """漏洞名称解析器
+
+    将导入数据中的漏洞名称（如"SQL注入"、"跨站脚本"）映射到漏洞库条目。
+    预先为漏洞库名称建立字符二元组倒排索引，批量解析时每个名称只需
+    查询索引；人工确认过的映射写入别名缓存，之后可直接O(1)命中。
+    """
+    
+    OWASP_PREFIX = re.compile(r'^a\d{2}:\d{4}-')
+    PUNCTUATION = re.compile(r'[\s\-_/:：、,，.。()（）\[\]【】]+')
+    SUFFIXES = ('漏洞', '攻击')
+    
+    def __init__(self, names, alias_file="config/vuln_alias.json"):
+        self.alias_file = alias_file
+        self.aliases = {}
+        self.exact = {}
+        self.grams = []
+        self.index = {}
+        self.targets = []
+        self.load_aliases()
+        self.build_index(names)
+    
+    @classmethod
+    def normalize(cls, name):
+        """规范化名称：小写、去除OWASP编号、标点和通用后缀"""
+        text = cls.OWASP_PREFIX.sub('', name.strip().lower())
+        text = cls.PUNCTUATION.sub('', text)
+        for suffix in cls.SUFFIXES:
+            if text.endswith(suffix) and len(text) > len(suffix):
+                text = text[:-len(suffix)]
+        return text
+    
+    @staticmethod
+    def ngrams(text):
+        """字符二元组（单字名称退化为一元组）"""
+        if len(text) < 2:
+            return {text} if text else set()
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+    
+    def build_index(self, names):
+        """建立规范名称表和二元组倒排索引"""
+        for name in names:
+            # "跨站脚本攻击(XSS)" 同时以主体和括号内缩写作为检索键
+            keys = [name]
+            match = re.match(r'^(.*?)[(（]([^()（）]+)[)）]\s*$', name)
+            if match:
+                keys.extend(match.groups())
+            for key in keys:
+                normalized = self.normalize(key)
+                if not normalized:
+                    continue
+                self.exact.setdefault(normalized, name)
+                target_id = len(self.targets)
+                self.targets.append(name)
+                grams = self.ngrams(normalized)
+                self.grams.append(len(grams))
+                for gram in grams:
+                    self.index.setdefault(gram, []).append(target_id)
+    
+    def load_aliases(self):
+        """加载已确认的别名缓存"""
+        try:
+            with open(self.alias_file, 'r', encoding='utf-8') as f:
+                self.aliases = json.load(f)
+        except FileNotFoundError:
+            self.aliases = {}
+        except Exception as e:
+            self.aliases = {}
+            print(f"加载漏洞别名缓存失败: {e}")
+    
+    def save_aliases(self):
+        """保存别名缓存"""
+        try:
+            with open(self.alias_file, 'w', encoding='utf-8') as f:
+                json.dump(self.aliases, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"保存漏洞别名缓存失败: {e}")
+    
+    def lookup(self, name):
+        """O(1)查找：别名缓存或规范名称完全一致，未命中返回None"""
+        if name in self.aliases:
+            return self.aliases[name]
+        return self.exact.get(self.normalize(name))
+    
+    def suggest(self, name, limit=3, threshold=0.4):
+        """基于二元组Dice系数给出候选条目 [(漏洞库名称, 相似度), ...]"""
+        grams = self.ngrams(self.normalize(name))
+        if not grams:
+            return []
+        shared = {}
+        for gram in grams:
+            for target_id in self.index.get(gram, ()):
+                shared[target_id] = shared.get(target_id, 0) + 1
+        best = {}
+        for target_id, count in shared.items():
+            score = 2.0 * count / (len(grams) + self.grams[target_id])
+            target = self.targets[target_id]
+            if score >= threshold and score > best.get(target, 0):
+                best[target] = score
+        return sorted(best.items(), key=lambda item: -item[1])[:limit]
+    
+    def resolve_many(self, names):
+        """批量解析名称
+
+        返回 {名称: (匹配条目或None, 相似度, 候选列表)}，重复名称只解析一次。
+        """
+        results = {}
+        for name in dict.fromkeys(names):
+            target = self.lookup(name)
+            if target:
+                results[name] = (target, 1.0, [(target, 1.0)])
+                continue
+            candidates = self.suggest(name)
+            if candidates:
+                results[name] = (candidates[0][0], candidates[0][1], candidates)
+            else:
+                results[name] = (None, 0.0, [])
+        return results
+    
+    def learn(self, mapping):
+        """记录人工确认的映射 {导入名称: 漏洞库名称} 并持久化"""
+        changed = False
+        for name, target in mapping.items():
+            if target and name != target and self.aliases.get(name) != target:
+                self.aliases[name] = target
+                changed = True
+        if changed:
+            self.save_aliases()
+
+class MappedLibrary(Mapping):
+    """只读的共享漏洞库映像
+
+    漏洞库序列化为紧凑的只读文件：魔数、索引长度、索引（名称 -> [偏移, 长度]）、
+    逐条 JSON 编码的条目。各工作进程 mmap 同一文件，条目数据只在操作系统页缓存中
+    保存一份；按名称查询时只解码该条目，进程私有内存只有索引和用到的条目。
+    """
+    
+    MAGIC = b'SSVWIKI1'
+    HEADER = 16
+    DECODED_LIMIT = 4096
+    
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:8] != self.MAGIC:
+            raise ValueError(f'不是漏洞库映像文件: {path}')
+        index_length = int.from_bytes(self.buffer[8:self.HEADER], 'little')
+        self.base = self.HEADER + index_length
+        self.index = json.loads(self.buffer[self.HEADER:self.base])
+        self.decoded = {}
+    
+    @classmethod
+    def write(cls, vulnerabilities, path):
+        """将漏洞库写入映像文件（先写临时文件再原子替换）"""
+        index, chunks, offset = {}, [], 0
+        for name, vuln in vulnerabilities.items():
+            data = json.dumps(vuln, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+            index[name] = [offset, len(data)]
+            chunks.append(data)
+            offset += len(data)
+        index_data = json.dumps(index, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(cls.MAGIC + len(index_data).to_bytes(cls.HEADER - 8, 'little'))
+            f.write(index_data)
+            f.writelines(chunks)
+        os.replace(path + '.tmp', path)
+        return path
+    
+    def __getitem__(self, name):
+        vuln = self.decoded.get(name)
+        if vuln is None:
+            offset, length = self.index[name]
+            start = self.base + offset
+            vuln = json.loads(self.buffer[start:start + length])
+            if len(self.decoded) < self.DECODED_LIMIT:
+                self.decoded[name] = vuln
+        return vuln
+    
+    def __contains__(self, name):
+        return name in self.index
+    
+    def __iter__(self):
+        return iter(self.index)
+    
+    def __len__(self):
+        return len(self.index)
 
 class VulnerabilityManager:
     """漏洞库管理器"""
     
-    def __init__(self, vuln_file="config/VulnWiki.yml"):
+    # 漏洞数据中可覆盖漏洞库文本的字段 → 漏洞库字段
+    # （desc/harm/fix/level 来自 vuln_tree.json，risk_level 为界面中设置的风险等级，优先于 level）
+    OVERRIDE_FIELDS = {'desc': 'description', 'harm': 'harm', 'fix': 'suggustion',
+                       'level': 'risklevel', 'risk_level': 'risklevel'}
+    
+    def __init__(self, vuln_file="config/VulnWiki.yml", alias_file="config/vuln_alias.json", load=True):
         self.vuln_file = vuln_file
+        self.alias_file = alias_file
         self.vulnerabilities = {}
-        self.load_vulnerabilities()
+        self.resolver = VulnNameResolver([], alias_file)
+        if load:
+            self.load_vulnerabilities()
     
     def load_vulnerabilities(self):
-        """加载漏洞库"""
+        """加载漏洞库（可在后台线程调用，加载完成后一次性替换）"""
+        start = time.perf_counter()
+        vulnerabilities = {}
         try:
             with open(self.vuln_file, 'r', encoding='utf-8') as f:
                 data = yaml.safe_load(f)
                 if data and 'vulnerabilities' in data:
                     for vuln in data['vulnerabilities']:
                         if vuln.get('name'):
-                            self.vulnerabilities[vuln['name']] = vuln
+                            vulnerabilities[vuln['name']] = vuln
         except Exception as e:
             print(f"加载漏洞库失败: {e}")
+        resolver = VulnNameResolver(vulnerabilities.keys(), self.alias_file)
+        self.vulnerabilities, self.resolver = vulnerabilities, resolver
+        METRICS.set('ssreport_vulnwiki_load_seconds', time.perf_counter() - start)
+        METRICS.set('ssreport_vulnwiki_entries', len(vulnerabilities))
+    
+    @classmethod
+    def mapped(cls, image_path, alias_file="config/vuln_alias.json"):
+        """基于漏洞库映像文件创建（工作进程共享同一份只读数据）"""
+        manager = cls(alias_file=alias_file, load=False)
+        manager.vulnerabilities = MappedLibrary(image_path)
+        manager.resolver = VulnNameResolver(manager.vulnerabilities.keys(), alias_file)
+        METRICS.set('ssreport_vulnwiki_entries', len(manager.vulnerabilities))
+        return manager
+    
+    def write_image(self, cache_dir="cache/vulnwiki"):
+        """将已加载的漏洞库写入映像文件，返回文件路径
+
+        文件名取漏洞库文件内容的哈希，漏洞库未修改时直接复用已有映像；
+        其他（旧版本漏洞库的）映像删除，仍被其他进程打开而无法删除的跳过。
+        """
+        with open(self.vuln_file, 'rb') as f:
+            key = hashlib.sha1(f.read()).hexdigest()
+        path = os.path.join(cache_dir, f'{key}.bin')
+        if not os.path.exists(path):
+            MappedLibrary.write(self.vulnerabilities, path)
+        prune_cache_dir(cache_dir, '*.bin', 0, keep=(path,))
+        return path
     
     def get_vulnerability(self, name):
-        """获取漏洞信息"""
-        return self.vulnerabilities.get(name, {})
+        """获取漏洞信息（名称不在漏洞库中时按别名解析）"""
+        vuln = self.vulnerabilities.get(name)
+        if vuln is None:
+            vuln = self.vulnerabilities.get(self.resolver.lookup(name), {})
+        return vuln
+    
+    def overrides(self, vuln):
+        """漏洞单独修改过的漏洞库字段 {漏洞库字段: 文本}
+
+        空字符串视为未修改（导入的 vuln_tree.json 中未填写的字段为空字符串）；
+        有意清空的文本字段记录在 cleared 列表中，覆盖为空文本。
+        """
+        overrides = {}
+        cleared = vuln.get('cleared') or ()
+        for key, field in self.OVERRIDE_FIELDS.items():
+            if vuln.get(key):
+                overrides[field] = vuln[key]
+            elif key in cleared:
+                overrides[field] = ''
+        return overrides
+    
+    def resolve_finding(self, vuln):
+        """漏洞的最终文本
+
+        未修改时直接返回共享的漏洞库条目；修改过时只在条目上叠加修改的字段（写时复制），
+        漏洞数据中只保存修改过的字段，内存与修改数量成正比。
+        """
+        entry = self.get_vulnerability(vuln.get('name', ''))
+        overrides = self.overrides(vuln)
+        return ChainMap(overrides, entry) if overrides else entry
+    
+    def risk_level(self, vuln):
+        """风险等级（优先使用漏洞单独设置的值，否则从漏洞库获取）"""
+        return (vuln.get('risk_level') or vuln.get('level')
+                or self.get_vulnerability(vuln['name']).get('risklevel', '未知'))
+    
+    def canonical_name(self, name):
+        """漏洞类型：能解析到漏洞库时使用漏洞库名称"""
+        if name in self.vulnerabilities:
+            return name
+        return self.resolver.lookup(name) or name
+    
+    def resolve_names(self, names):
+        """批量将导入的漏洞名称映射到漏洞库条目"""
+        return self.resolver.resolve_many(names)
     
     def get_all_vulnerabilities(self):
         """获取所有漏洞"""
@@ -62,149 +571,3939 @@ class VulnerabilityManager:
 class TemplateManager:
     """模板管理器"""
     
-    def __init__(self, template_dir="config/templates"):
-        self.template_dir = template_dir
-        self.templates = {}
-        self.load_templates()
+    def __init__(self, template_dir="config/templates", load=True):
+        self.template_dir = template_dir
+        self.templates = {}
+        if load:
+            self.load_templates()
+    
+    def load_templates(self):
+        """加载模板（可在后台线程调用，加载完成后一次性替换）"""
+        start = time.perf_counter()
+        templates = {}
+        template_path = Path(self.template_dir)
+        if template_path.exists():
+            for json_file in template_path.glob("*.json"):
+                try:
+                    with open(json_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                        template_name = json_file.stem
+                        templates[template_name] = data
+                except Exception as e:
+                    print(f"加载模板 {json_file} 失败: {e}")
+        self.templates = templates
+        METRICS.set('ssreport_template_load_seconds', time.perf_counter() - start)
+        METRICS.set('ssreport_templates', len(templates))
+    
+    def get_template(self, name):
+        """获取模板"""
+        return self.templates.get(name, {})
+    
+    def get_all_templates(self):
+        """获取所有模板"""
+        return list(self.templates.keys())
+
+class FindingStore:
+    """漏洞数据存储
+
+    维护 单位 → 系统 → 漏洞 的层级数据（即报告生成使用的 vulnerability_data）
+    及其扁平行索引。所有修改都表示为操作(op)并经 apply 执行，事务内的操作
+    合并为一批，提交时统一通知监听者 listener(ops, label)。
+    """
+    
+    def __init__(self, data=None):
+        self.data = data if data is not None else []
+        self.rows = []
+        self.row_of = {}
+        self.listeners = []
+        self._depth = 0
+        self._pending = []
+        self._label = ''
+        self.rebuild()
+    
+    def rebuild(self):
+        """重建扁平行索引 rows[i] = (unit, system, vuln, ui, si, vi)"""
+        self.rows = [
+            (unit, system, vuln, ui, si, vi)
+            for ui, unit in enumerate(self.data)
+            for si, system in enumerate(unit['systems'])
+            for vi, vuln in enumerate(system['vulns'])
+        ]
+        self.row_of = {id(row[2]): i for i, row in enumerate(self.rows)}
+    
+    def find_unit(self, name):
+        """按名称查找单位下标，不存在返回-1"""
+        for ui, unit in enumerate(self.data):
+            if unit['unit'] == name:
+                return ui
+        return -1
+    
+    def find_system(self, ui, name):
+        """按名称查找单位下的系统下标，不存在返回-1"""
+        for si, system in enumerate(self.data[ui]['systems']):
+            if system['system'] == name:
+                return si
+        return -1
+    
+    @contextmanager
+    def transaction(self, label=''):
+        """批量事务：事务内的操作在最外层提交时一次性通知"""
+        if self._depth == 0:
+            self._label = label
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._commit()
+    
+    def _commit(self):
+        ops, self._pending = self._pending, []
+        if not ops:
+            return
+        if any(op['op'] != 'update_vulns' for op in ops):
+            self.rebuild()
+        for listener in list(self.listeners):
+            listener(ops, self._label)
+    
+    def apply(self, op):
+        """执行一个操作"""
+        handler = getattr(self, f"_apply_{op['op']}")
+        handler(op)
+        self._pending.append(op)
+        if self._depth == 0:
+            self._label = ''
+            self._commit()
+    
+    def replay(self, ops):
+        """重放操作（用于恢复，不通知监听者）"""
+        for op in ops:
+            getattr(self, f"_apply_{op['op']}")(op)
+        self.rebuild()
+    
+    # 删除单位/系统时在操作中记录删除时的名称和内容（systems/vulns），其逆操作据此原样恢复；
+    # 操作中保存的列表不与数据共享，同一批中之后的操作不会改变它
+    
+    def _apply_add_unit(self, op):
+        systems = [{'system': system['system'], 'vulns': list(system['vulns'])} for system in op.get('systems', ())]
+        self.data.insert(op['index'], {'unit': op['name'], 'systems': systems})
+    
+    def _apply_add_system(self, op):
+        self.data[op['unit']]['systems'].insert(op['index'], {'system': op['name'],
+                                                              'vulns': list(op.get('vulns', ()))})
+    
+    def _apply_remove_unit(self, op):
+        unit = self.data.pop(op['index'])
+        op['name'] = unit['unit']
+        op['systems'] = [{'system': system['system'], 'vulns': list(system['vulns'])} for system in unit['systems']]
+    
+    def _apply_remove_system(self, op):
+        system = self.data[op['unit']]['systems'].pop(op['index'])
+        op['name'] = system['system']
+        op['vulns'] = list(system['vulns'])
+    
+    def _group_items(self, items):
+        groups = {}
+        for item in items:
+            groups.setdefault((item[0], item[1]), []).append(item)
+        return groups
+    
+    def _apply_add_vulns(self, op):
+        # 下标为插入后的位置，按系统分组后一次归并，O(系统漏洞数)
+        for (ui, si), items in self._group_items(op['items']).items():
+            vulns = self.data[ui]['systems'][si]['vulns']
+            items.sort(key=lambda item: item[2])
+            if len(items) == 1:
+                vulns.insert(items[0][2], items[0][3])
+                continue
+            if items[0][2] == len(vulns) and items[-1][2] == len(vulns) + len(items) - 1:
+                vulns.extend(item[3] for item in items)
+                continue
+            merged = []
+            remaining = iter(vulns)
+            for _, _, vi, vuln in items:
+                while len(merged) < vi:
+                    merged.append(next(remaining))
+                merged.append(vuln)
+            merged.extend(remaining)
+            vulns[:] = merged
+    
+    def _apply_remove_vulns(self, op):
+        for (ui, si), items in self._group_items(op['items']).items():
+            vulns = self.data[ui]['systems'][si]['vulns']
+            if len(items) == 1:
+                del vulns[items[0][2]]
+                continue
+            removed = {item[2] for item in items}
+            vulns[:] = [vuln for vi, vuln in enumerate(vulns) if vi not in removed]
+    
+    def _apply_update_vulns(self, op):
+        for ui, si, vi, fields, _ in op['items']:
+            vuln = self.data[ui]['systems'][si]['vulns'][vi]
+            for key, value in fields.items():
+                if value is None:
+                    vuln.pop(key, None)
+                else:
+                    vuln[key] = value
+    
+    def add_unit(self, name):
+        """添加单位，返回单位下标"""
+        self.apply({'op': 'add_unit', 'index': len(self.data), 'name': name})
+        return len(self.data) - 1
+    
+    def add_system(self, ui, name):
+        """在指定单位下添加系统，返回系统下标"""
+        systems = self.data[ui]['systems']
+        self.apply({'op': 'add_system', 'unit': ui, 'index': len(systems), 'name': name})
+        return len(systems) - 1
+    
+    def add_vulnerabilities(self, ui, si, vulns):
+        """在指定系统末尾追加漏洞"""
+        start = len(self.data[ui]['systems'][si]['vulns'])
+        self.apply({'op': 'add_vulns',
+                    'items': [[ui, si, start + k, vuln] for k, vuln in enumerate(vulns)]})
+    
+    def update_rows(self, rows, fields):
+        """批量修改指定行的漏洞字段"""
+        items = []
+        for row in rows:
+            _, _, vuln, ui, si, vi = self.rows[row]
+            old = {key: vuln.get(key) for key in fields}
+            if old != fields:
+                items.append([ui, si, vi, dict(fields), old])
+        if items:
+            self.apply({'op': 'update_vulns', 'items': items})
+    
+    def remove_rows(self, rows):
+        """批量删除指定行的漏洞"""
+        items = [[r[3], r[4], r[5], r[2]] for r in (self.rows[row] for row in rows)]
+        if items:
+            self.apply({'op': 'remove_vulns', 'items': items})
+    
+    def move_rows(self, rows, ui, si):
+        """批量将指定行的漏洞移动到另一系统末尾"""
+        vulns = [self.rows[row][2] for row in sorted(rows)
+                 if self.rows[row][3:5] != (ui, si)]
+        if not vulns:
+            return
+        keep = set(map(id, vulns))
+        with self.transaction('移动漏洞'):
+            self.remove_rows([row for row in rows if id(self.rows[row][2]) in keep])
+            self.add_vulnerabilities(ui, si, vulns)
+
+class UndoStack:
+    """撤销/重做栈
+
+    记录 FindingStore 每次提交的操作（一个事务即一个撤销项），撤销时执行其逆操作。
+    操作本身就是增量，不保存整份数据快照；栈的容量按估算内存而非步数限制。
+    """
+    
+    INVERSE_OPS = {
+        'add_unit': 'remove_unit', 'remove_unit': 'add_unit',
+        'add_system': 'remove_system', 'remove_system': 'add_system',
+        'add_vulns': 'remove_vulns', 'remove_vulns': 'add_vulns',
+    }
+    
+    def __init__(self, store, memory_limit=64 * 1024 * 1024):
+        self.store = store
+        self.memory_limit = memory_limit
+        self.undo_entries = deque()
+        self.redo_entries = []
+        self.memory = 0
+        self._replaying = False
+        store.listeners.append(self.on_store_changed)
+    
+    @staticmethod
+    def estimate_size(ops):
+        """估算操作占用的内存（按序列化长度近似）"""
+        return len(json.dumps(ops, ensure_ascii=False)) * 2
+    
+    @classmethod
+    def invert(cls, ops):
+        """计算一批操作的逆操作"""
+        inverse = []
+        for op in reversed(ops):
+            if op['op'] == 'update_vulns':
+                inverse.append({'op': 'update_vulns',
+                                'items': [[ui, si, vi, old, new] for ui, si, vi, new, old in op['items']]})
+            else:
+                inverse.append(dict(op, op=cls.INVERSE_OPS[op['op']]))
+        return inverse
+    
+    def on_store_changed(self, ops, label):
+        if self._replaying:
+            return
+        size = self.estimate_size(ops)
+        self.undo_entries.append((label, ops, size))
+        self.memory += size
+        self.redo_entries.clear()
+        # 超出内存上限时丢弃最早的撤销项
+        while self.memory > self.memory_limit and len(self.undo_entries) > 1:
+            self.memory -= self.undo_entries.popleft()[2]
+    
+    def can_undo(self):
+        return bool(self.undo_entries)
+    
+    def can_redo(self):
+        return bool(self.redo_entries)
+    
+    def _replay(self, label, ops):
+        self._replaying = True
+        try:
+            with self.store.transaction(label):
+                for op in ops:
+                    self.store.apply(op)
+        finally:
+            self._replaying = False
+    
+    def undo(self):
+        """撤销最近一次操作，返回其描述"""
+        if not self.undo_entries:
+            return None
+        label, ops, size = self.undo_entries.pop()
+        self.memory -= size
+        self._replay(f'撤销{label}', self.invert(ops))
+        self.redo_entries.append((label, ops, size))
+        return label
+    
+    def redo(self):
+        """重做最近一次撤销的操作，返回其描述"""
+        if not self.redo_entries:
+            return None
+        label, ops, size = self.redo_entries.pop()
+        self._replay(label, ops)
+        self.undo_entries.append((label, ops, size))
+        self.memory += size
+        return label
+    
+    def clear(self):
+        self.undo_entries.clear()
+        self.redo_entries.clear()
+        self.memory = 0
+
+class OperationJournal:
+    """操作日志（自动保存与崩溃恢复）
+
+    每次 FindingStore 提交的一批操作追加为 JSONL 日志中的一行，写入代价只与
+    本次修改的大小有关。日志按段滚动，后台线程将 快照 + 已关闭日志段 重放为
+    新快照后删除这些段；启动时加载快照并只重放其后的日志尾部。
+    """
+    
+    SNAPSHOT_FILE = 'snapshot.json'
+    
+    def __init__(self, journal_dir="autosave", compact_every=1000):
+        self.journal_dir = Path(journal_dir)
+        self.compact_every = compact_every
+        self.seq = 0
+        self.segment = None
+        self.segment_records = 0
+        self._lock = threading.Lock()
+        self._compactor = None
+    
+    def segments(self):
+        return sorted(self.journal_dir.glob('journal-*.jsonl'))
+    
+    def load_snapshot(self):
+        """读取快照，返回 (快照包含的最后序号, 数据)"""
+        try:
+            with open(self.journal_dir / self.SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            return snapshot['seq'], snapshot['data']
+        except FileNotFoundError:
+            return 0, []
+    
+    def read_records(self, segments, after_seq):
+        """按序读取日志段中序号大于 after_seq 的记录，忽略崩溃时写了一半的行"""
+        for segment in segments:
+            with open(segment, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record['seq'] > after_seq:
+                        yield record
+    
+    def recover(self):
+        """恢复上次的数据：加载快照并重放日志尾部"""
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        data = []
+        try:
+            self.seq, data = self.load_snapshot()
+            store = FindingStore(data)
+            ops = []
+            for record in self.read_records(self.segments(), self.seq):
+                ops.extend(record['ops'])
+                self.seq = record['seq']
+            store.replay(ops)
+        except Exception as e:
+            print(f"恢复自动保存数据失败: {e}")
+        self.open_segment()
+        return data
+    
+    def open_segment(self):
+        """开始新的日志段"""
+        if self.segment:
+            self.segment.close()
+        path = self.journal_dir / f'journal-{self.seq + 1:012d}.jsonl'
+        self.segment = open(path, 'a', encoding='utf-8')
+        if self.segment.tell() > 0:
+            # 断开崩溃时可能残留的半行记录
+            self.segment.write('\n')
+        self.segment_records = 0
+    
+    def record(self, ops, label=''):
+        """FindingStore 监听者：追加一批操作"""
+        with self._lock:
+            self.seq += 1
+            try:
+                self.segment.write(json.dumps({'seq': self.seq, 'label': label, 'ops': ops},
+                                              ensure_ascii=False) + '\n')
+                self.segment.flush()
+            except Exception as e:
+                print(f"写入操作日志失败: {e}")
+            self.segment_records += 1
+            if self.segment_records >= self.compact_every:
+                self.compact()
+    
+    def compact(self, wait=False):
+        """滚动日志段并在后台线程压缩为快照"""
+        if self._compactor and self._compactor.is_alive():
+            if not wait:
+                return
+            self._compactor.join()
+        closed = [segment for segment in self.segments()
+                  if segment != Path(self.segment.name)] + [Path(self.segment.name)]
+        self.open_segment()
+        self._compactor = threading.Thread(target=self._compact, args=(closed,), daemon=True)
+        self._compactor.start()
+        if wait:
+            self._compactor.join()
+    
+    def _compact(self, segments):
+        try:
+            seq, data = self.load_snapshot()
+            store = FindingStore(data)
+            ops = []
+            for record in self.read_records(segments, seq):
+                ops.extend(record['ops'])
+                seq = record['seq']
+            store.replay(ops)
+            tmp_path = self.journal_dir / (self.SNAPSHOT_FILE + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'seq': seq, 'data': data}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_dir / self.SNAPSHOT_FILE)
+            for segment in segments:
+                segment.unlink()
+        except Exception as e:
+            print(f"压缩操作日志失败: {e}")
+    
+    def reset(self):
+        """清空自动保存数据"""
+        with self._lock:
+            if self._compactor:
+                self._compactor.join()
+            self.segment.close()
+            for path in self.segments() + [self.journal_dir / self.SNAPSHOT_FILE]:
+                if path.exists():
+                    path.unlink()
+            self.seq = 0
+            self.open_segment()
+    
+    def close(self):
+        """退出时压缩日志"""
+        with self._lock:
+            if self.segment_records:
+                self.compact(wait=True)
+            elif self._compactor:
+                self._compactor.join()
+            self.segment.close()
+
+class FindingTableModel(QAbstractTableModel):
+    """漏洞表格模型，直接读取 FindingStore 的扁平行索引"""
+    
+    HEADERS = ['单位', '系统', '漏洞名称', '风险等级', '修复状态', '操作']
+    
+    def __init__(self, store, vuln_manager, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.vuln_manager = vuln_manager
+        store.listeners.append(self.on_store_changed)
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+    
+    def risk_level(self, vuln):
+        """风险等级（优先使用漏洞单独设置的值，否则从漏洞库获取）"""
+        return self.vuln_manager.risk_level(vuln)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = index.column()
+        if role == Qt.TextAlignmentRole and column == 5:
+            return Qt.AlignCenter
+        if role != Qt.DisplayRole:
+            return None
+        unit, system, vuln = self.store.rows[index.row()][:3]
+        if column == 0:
+            return unit['unit']
+        if column == 1:
+            return system['system']
+        if column == 2:
+            return vuln['name']
+        if column == 3:
+            return self.risk_level(vuln)
+        if column == 4:
+            return vuln.get('repaired', '未修复')
+        return '编辑'
+    
+    def refresh(self):
+        """重置整个模型"""
+        self.beginResetModel()
+        self.store.rebuild()
+        self.endResetModel()
+    
+    def on_store_changed(self, ops, label):
+        # 结构变化整体重置一次；仅字段修改时发出一次覆盖受影响行区间的 dataChanged
+        if any(op['op'] != 'update_vulns' for op in ops):
+            self.beginResetModel()
+            self.endResetModel()
+            return
+        rows = [self.store.row_of[id(self.store.data[ui]['systems'][si]['vulns'][vi])]
+                for op in ops for ui, si, vi, _, _ in op['items']]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 3), self.index(max(rows), 4))
+
+class FindingFilterProxyModel(QAbstractProxyModel):
+    """漏洞表格筛选排序代理模型
+
+    数据变化时为每列预先计算 取值 → 行号集合 的索引和排序键，其中风险等级、
+    修复状态使用整数排序键，不比较中文显示文本。筛选先对各列候选集合求交，
+    再按当前排序顺序扫描一次，复杂度O(n)。
+    """
+    
+    RISK_ORDER = {'高危': 0, '中危': 1, '低危': 2, '信息': 3}
+    STATUS_ORDER = {'未修复': 0, '修复中': 1, '已修复': 2, '不适用': 3}
+    FILTER_COLUMNS = (0, 1, 3, 4)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.filters = {}
+        self.text = ''
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+        self.values = {}
+        self.postings = {}
+        self.haystack = []
+        self.order = []
+        self.visible = []
+        self.proxy_of = {}
+    
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        model.modelReset.connect(self.invalidate)
+        model.dataChanged.connect(self.on_source_data_changed)
+        self.invalidate()
+    
+    def sort_key(self, column, value):
+        if column == 3:
+            return self.RISK_ORDER.get(value, len(self.RISK_ORDER))
+        if column == 4:
+            return self.STATUS_ORDER.get(value, len(self.STATUS_ORDER))
+        return value
+    
+    def build_index(self):
+        """重建列取值、倒排索引和全文检索文本"""
+        rows = self.sourceModel().store.rows
+        risk_level = self.sourceModel().risk_level
+        self.values = {
+            0: [row[0]['unit'] for row in rows],
+            1: [row[1]['system'] for row in rows],
+            2: [row[2]['name'] for row in rows],
+            3: [risk_level(row[2]) for row in rows],
+            4: [row[2].get('repaired', '未修复') for row in rows],
+        }
+        self.postings = {}
+        for column in self.FILTER_COLUMNS:
+            postings = {}
+            for row, value in enumerate(self.values[column]):
+                postings.setdefault(value, set()).add(row)
+            self.postings[column] = postings
+        self.haystack = [f'{unit}\t{system}\t{name}'.lower() for unit, system, name
+                         in zip(self.values[0], self.values[1], self.values[2])]
+        self.build_order()
+    
+    def build_order(self):
+        """按当前排序列计算全部行的顺序"""
+        count = len(self.haystack)
+        if 0 <= self.sort_column < 5:
+            keys = [self.sort_key(self.sort_column, value) for value in self.values[self.sort_column]]
+            self.order = sorted(range(count), key=keys.__getitem__,
+                                reverse=self.sort_order == Qt.DescendingOrder)
+        else:
+            self.order = list(range(count))
+    
+    def distinct_values(self, column):
+        """某列的所有取值（供筛选下拉框使用）"""
+        return list(self.postings.get(column, {}))
+    
+    def set_filters(self, filters, text):
+        """设置筛选条件 {列: 取值}（None 表示不限）及全文关键字"""
+        self.filters = {column: value for column, value in filters.items() if value is not None}
+        self.text = text.strip().lower()
+        self.apply_filter()
+    
+    def apply_filter(self):
+        self.beginResetModel()
+        allowed = None
+        for column, value in sorted(self.filters.items(),
+                                    key=lambda item: len(self.postings[item[0]].get(item[1], ()))):
+            rows = self.postings[column].get(value, set())
+            allowed = rows if allowed is None else allowed & rows
+        text, haystack = self.text, self.haystack
+        if allowed is None and not text:
+            self.visible = list(self.order)
+        elif allowed is None:
+            self.visible = [row for row in self.order if text in haystack[row]]
+        elif not text:
+            self.visible = [row for row in self.order if row in allowed]
+        else:
+            self.visible = [row for row in self.order if row in allowed and text in haystack[row]]
+        self.proxy_of = {row: i for i, row in enumerate(self.visible)}
+        self.endResetModel()
+    
+    def invalidate(self):
+        self.build_index()
+        self.apply_filter()
+    
+    def on_source_data_changed(self, top_left, bottom_right, roles=()):
+        # 仅风险等级/修复状态会变化：增量更新索引，已显示的行保持不动
+        rows = self.sourceModel().store.rows
+        risk_level = self.sourceModel().risk_level
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            vuln = rows[row][2]
+            for column, value in ((3, risk_level(vuln)), (4, vuln.get('repaired', '未修复'))):
+                old = self.values[column][row]
+                if value != old:
+                    self.postings[column][old].discard(row)
+                    self.postings[column].setdefault(value, set()).add(row)
+                    self.values[column][row] = value
+        rows = [self.proxy_of[row] for row in range(top_left.row(), bottom_right.row() + 1)
+                if row in self.proxy_of]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), top_left.column()),
+                                  self.index(max(rows), bottom_right.column()))
+    
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.build_order()
+        self.apply_filter()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.visible)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.sourceModel().columnCount()
+    
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self.visible)):
+            return QModelIndex()
+        return self.createIndex(row, column)
+    
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+    
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(self.visible[proxy_index.row()], proxy_index.column())
+    
+    def mapFromSource(self, source_index):
+        if not source_index.isValid() or source_index.row() not in self.proxy_of:
+            return QModelIndex()
+        return self.index(self.proxy_of[source_index.row()], source_index.column())
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal:
+            return self.sourceModel().headerData(section, orientation, role)
+        if role == Qt.DisplayRole:
+            return section + 1
+        return None
+
+class FindingTreeNode:
+    """树模型节点：根、单位或系统（漏洞行不建节点，按下标直接读取）"""
+    
+    __slots__ = ('parent', 'row', 'children', 'fetched', 'counts')
+    
+    def __init__(self, parent=None, row=0):
+        self.parent = parent
+        self.row = row
+        self.children = []
+        self.fetched = 0  # 系统节点已展示的漏洞数
+        self.counts = [0] * len(FindingTreeModel.COUNT_COLUMNS)
+
+class FindingTreeModel(QAbstractItemModel):
+    """单位 → 系统 → 漏洞 树模型
+
+    系统下的漏洞通过 canFetchMore/fetchMore 分批加载，展开上万漏洞的系统也不会卡顿；
+    各单位、系统节点的漏洞数、各风险等级数量和未修复数按操作增量维护，不重新遍历。
+    模型保存自身已展示的节点结构，按操作顺序发出插入/删除行信号。
+    """
+    
+    HEADERS = ['名称', '风险等级', '修复状态', '漏洞数', '高危', '中危', '低危', '未修复']
+    # 统计列：漏洞数、高危、中危、低危、未修复
+    COUNT_COLUMNS = (3, 4, 5, 6, 7)
+    RISK_COUNT = {'高危': 1, '中危': 2, '低危': 3}
+    UNREPAIRED = ('未修复', '修复中')
+    FETCH_BATCH = 500
+    
+    def __init__(self, store, vuln_manager, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.vuln_manager = vuln_manager
+        self.root = FindingTreeNode()
+        self.fetching = False
+        self.build()
+        store.listeners.append(self.on_store_changed)
+    
+    def risk_level(self, vuln):
+        """风险等级（优先使用漏洞单独设置的值，否则从漏洞库获取）"""
+        return self.vuln_manager.risk_level(vuln)
+    
+    def vuln_counts(self, vuln):
+        """单个漏洞对统计列的贡献"""
+        counts = [1, 0, 0, 0, 0]
+        level = self.RISK_COUNT.get(self.risk_level(vuln))
+        if level:
+            counts[level] = 1
+        if vuln.get('repaired', '未修复') in self.UNREPAIRED:
+            counts[4] = 1
+        return counts
+    
+    def add_counts(self, node, counts, sign=1):
+        """将统计增量累加到节点及其所有上级"""
+        while node is not None:
+            node.counts = [total + sign * count for total, count in zip(node.counts, counts)]
+            node = node.parent
+    
+    def make_node(self, parent, row, systems=None, vulns=()):
+        """构建单位节点（给出 systems）或系统节点及其统计"""
+        node = FindingTreeNode(parent, row)
+        if systems is not None:
+            for si, system in enumerate(systems):
+                child = self.make_node(node, si, vulns=system['vulns'])
+                node.children.append(child)
+                node.counts = [a + b for a, b in zip(node.counts, child.counts)]
+        else:
+            for vuln in vulns:
+                for k, count in enumerate(self.vuln_counts(vuln)):
+                    node.counts[k] += count
+        return node
+    
+    def build(self):
+        """按存储数据全量构建节点和统计"""
+        self.root = FindingTreeNode()
+        totals = self.root.counts
+        for ui, unit in enumerate(self.store.data):
+            unit_node = self.make_node(self.root, ui, unit['systems'])
+            self.root.children.append(unit_node)
+            totals = [a + b for a, b in zip(totals, unit_node.counts)]
+        self.root.counts = totals
+    
+    def refresh(self):
+        """重置整个模型（漏洞库加载后风险等级可能变化）"""
+        self.beginResetModel()
+        self.build()
+        self.endResetModel()
+    
+    # ---- 结构 ----
+    
+    def node_of(self, index):
+        """单位/系统节点，漏洞行返回None"""
+        if not index.isValid():
+            return self.root
+        parent = index.internalPointer()
+        if parent.parent is not None and parent.parent.parent is not None:
+            return None
+        return parent.children[index.row()]
+    
+    def node_index(self, node):
+        if node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node.parent)
+    
+    def path_of(self, index):
+        """(单位下标, 系统下标, 漏洞下标)，不适用的层级为None"""
+        if not index.isValid():
+            return (None, None, None)
+        parent = index.internalPointer()
+        if parent is self.root:
+            return (index.row(), None, None)
+        if parent.parent is self.root:
+            return (parent.row, index.row(), None)
+        return (parent.parent.row, parent.row, index.row())
+    
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node_of(parent)
+        if node is None or row < 0 or column < 0 or column >= len(self.HEADERS):
+            return QModelIndex()
+        if row >= (node.fetched if self.is_system(node) else len(node.children)):
+            return QModelIndex()
+        return self.createIndex(row, column, node)
+    
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer()
+        if parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent.parent)
+    
+    @staticmethod
+    def is_system(node):
+        return node is not None and node.parent is not None and node.parent.parent is not None
+    
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        node = self.node_of(parent)
+        if node is None:
+            return 0
+        return node.fetched if self.is_system(node) else len(node.children)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+    
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node_of(parent)
+        if node is None or parent.column() > 0:
+            return False
+        if self.is_system(node):
+            return node.fetched > 0 or node.counts[0] > 0
+        return bool(node.children)
+    
+    def canFetchMore(self, parent):
+        node = self.node_of(parent)
+        return not self.fetching and self.is_system(node) and node.fetched < node.counts[0]
+    
+    def fetchMore(self, parent):
+        node = self.node_of(parent)
+        # 视图可能在 rowsInserted 中再次请求加载，嵌套插入会打乱行号，忽略重入
+        if not self.is_system(node) or self.fetching:
+            return
+        count = min(node.counts[0] - node.fetched, self.FETCH_BATCH)
+        if count <= 0:
+            return
+        self.fetching = True
+        try:
+            self.beginInsertRows(parent, node.fetched, node.fetched + count - 1)
+            node.fetched += count
+            self.endInsertRows()
+        finally:
+            self.fetching = False
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = index.column()
+        if role == Qt.TextAlignmentRole and column >= 3:
+            return Qt.AlignCenter
+        if role != Qt.DisplayRole:
+            return None
+        ui, si, vi = self.path_of(index)
+        unit = self.store.data[ui]
+        if vi is not None:
+            vuln = unit['systems'][si]['vulns'][vi]
+            if column == 0:
+                return vuln['name']
+            if column == 1:
+                return self.risk_level(vuln)
+            if column == 2:
+                return vuln.get('repaired', '未修复')
+            return None
+        node = self.node_of(index)
+        if column == 0:
+            return unit['unit'] if si is None else unit['systems'][si]['system']
+        if column in self.COUNT_COLUMNS:
+            return node.counts[self.COUNT_COLUMNS.index(column)]
+        return None
+    
+    # ---- 增量更新 ----
+    
+    def insert_child(self, parent, row, node):
+        self.beginInsertRows(self.node_index(parent), row, row)
+        parent.children.insert(row, node)
+        for k in range(row, len(parent.children)):
+            parent.children[k].row = k
+        self.endInsertRows()
+    
+    def remove_child(self, parent, row):
+        self.beginRemoveRows(self.node_index(parent), row, row)
+        node = parent.children.pop(row)
+        for k in range(row, len(parent.children)):
+            parent.children[k].row = k
+        self.endRemoveRows()
+        self.add_counts(parent, node.counts, -1)
+    
+    def emit_counts_changed(self, nodes):
+        """统计变化的节点及其上级发出 dataChanged"""
+        changed = set()
+        for node in nodes:
+            while node is not None and node is not self.root and id(node) not in changed:
+                changed.add(id(node))
+                # 同一批中已删除的节点不再发出信号，只更新其上级
+                if node in node.parent.children:
+                    index = self.node_index(node)
+                    self.dataChanged.emit(index.siblingAtColumn(3), index.siblingAtColumn(len(self.HEADERS) - 1))
+                node = node.parent
+    
+    def resize_system(self, node, inserted, removed):
+        """系统节点的漏洞增删后，调整已展示的行"""
+        total = node.counts[0]
+        index = self.node_index(node)
+        if inserted and node.fetched and node.fetched + inserted == total:
+            # 已全部展示时追加新行，否则留给 fetchMore
+            self.beginInsertRows(index, node.fetched, total - 1)
+            node.fetched = total
+            self.endInsertRows()
+        elif node.fetched > total:
+            self.beginRemoveRows(index, total, node.fetched - 1)
+            node.fetched = total
+            self.endRemoveRows()
+        if node.fetched:
+            # 漏洞行按下标读取，插入删除后前面的行内容也会移动
+            self.dataChanged.emit(self.index(0, 0, index), self.index(node.fetched - 1, 2, index))
+    
+    def on_store_changed(self, ops, label):
+        kinds = {op['op'] for op in ops}
+        if 'update_vulns' in kinds and len(kinds) > 1:
+            # 同一批中修改与增删混合时无法按差量还原修改前的状态，整体重建
+            self.refresh()
+            return
+        
+        if kinds == {'update_vulns'}:
+            items = [item for op in ops for item in op['items']]
+            positions = [tuple(item[:3]) for item in items]
+            if len(set(positions)) < len(positions):
+                # 同一漏洞在一批内多次修改，按最终状态重新统计所在系统
+                self.refresh()
+                return
+            nodes = []
+            for ui, si, vi, fields, old in items:
+                vuln = self.store.data[ui]['systems'][si]['vulns'][vi]
+                before = {key: value for key, value in {**vuln, **old}.items() if value is not None}
+                delta = [after - prior for after, prior in zip(self.vuln_counts(vuln), self.vuln_counts(before))]
+                node = self.root.children[ui].children[si]
+                if any(delta):
+                    self.add_counts(node, delta)
+                    nodes.append(node)
+                if vi < node.fetched:
+                    index = self.createIndex(vi, 1, node)
+                    self.dataChanged.emit(index, index.siblingAtColumn(2))
+            self.emit_counts_changed(nodes)
+            return
+        
+        touched = {}
+        grown = []  # 撤销删除时带着原有内容恢复的单位、系统的上级节点
+        for op in ops:
+            kind = op['op']
+            if kind == 'add_unit':
+                node = self.make_node(self.root, op['index'], op.get('systems', ()))
+                self.insert_child(self.root, op['index'], node)
+                self.add_counts(self.root, node.counts)
+            elif kind == 'remove_unit':
+                self.remove_child(self.root, op['index'])
+            elif kind == 'add_system':
+                unit_node = self.root.children[op['unit']]
+                node = self.make_node(unit_node, op['index'], vulns=op.get('vulns', ()))
+                self.insert_child(unit_node, op['index'], node)
+                if any(node.counts):
+                    self.add_counts(unit_node, node.counts)
+                    grown.append(unit_node)
+            elif kind == 'remove_system':
+                self.remove_child(self.root.children[op['unit']], op['index'])
+            else:
+                sign = 1 if kind == 'add_vulns' else -1
+                for ui, si, _, vuln in op['items']:
+                    node = self.root.children[ui].children[si]
+                    self.add_counts(node, self.vuln_counts(vuln), sign)
+                    inserted, removed = touched.get(id(node), (node, 0, 0))[1:]
+                    touched[id(node)] = (node, inserted + (sign > 0), removed + (sign < 0))
+        # 统计已更新而已展示行数尚未调整期间，禁止视图触发 fetchMore
+        self.fetching = True
+        try:
+            for node, inserted, removed in touched.values():
+                if node.parent is not None and node in node.parent.children:
+                    self.resize_system(node, inserted, removed)
+        finally:
+            self.fetching = False
+        self.emit_counts_changed([node for node, _, _ in touched.values()] + grown)
+
+class ReportPreview:
+    """报告HTML预览
+
+    每个漏洞的HTML片段、风险等级和修复状态按漏洞缓存，FindingStore 的操作只使
+    受影响漏洞的片段失效、增量调整统计数量。漏洞详情只展示最近修改的系统起的
+    MAX_FINDINGS 个漏洞，预览耗时与项目规模无关。
+    """
+    
+    MAX_FINDINGS = 200
+    FIELDS = ('description', 'harm', 'suggustion')
+    
+    def __init__(self, store, vuln_manager):
+        self.store = store
+        self.vuln_manager = vuln_manager
+        self.entries = {}  # id(漏洞) -> [漏洞, 风险等级, 修复状态, (编号, HTML片段)或None]
+        self.risk_counts = {}
+        self.focus = (0, 0)  # 漏洞详情从该 (单位, 系统) 开始展示
+        self.changed = None  # 最近添加或修改的漏洞，预览滚动到该漏洞
+        self.refresh()
+        store.listeners.append(self.on_store_changed)
+    
+    def refresh(self):
+        """丢弃全部缓存重新统计（漏洞库加载、数据整体替换后调用）"""
+        self.entries = {}
+        self.risk_counts = {}
+        for row in self.store.rows:
+            self.add_entry(row[2])
+    
+    def add_entry(self, vuln):
+        risk = self.vuln_manager.risk_level(vuln)
+        self.entries[id(vuln)] = [vuln, risk, vuln.get('repaired', '未修复'), None]
+        self.risk_counts[risk] = self.risk_counts.get(risk, 0) + 1
+    
+    def remove_entry(self, vuln):
+        entry = self.entries.pop(id(vuln), None)
+        if entry is not None:
+            self.risk_counts[entry[1]] -= 1
+    
+    def set_focus(self, ui, si=0):
+        self.focus = (ui, si)
+    
+    def on_store_changed(self, ops, label):
+        kinds = {op['op'] for op in ops}
+        if 'update_vulns' in kinds and len(kinds) > 1:
+            # 同一批中修改与增删混合时，修改的下标对应增删前的数据，整体重新统计
+            self.refresh()
+            return
+        for op in ops:
+            kind = op['op']
+            if kind == 'add_vulns':
+                for ui, si, _, vuln in op['items']:
+                    self.add_entry(vuln)
+                    self.focus, self.changed = (ui, si), vuln
+            elif kind == 'remove_vulns':
+                for ui, si, _, vuln in op['items']:
+                    self.remove_entry(vuln)
+                    self.focus = (ui, si)
+            elif kind == 'update_vulns':
+                for ui, si, vi, _, _ in op['items']:
+                    vuln = self.store.data[ui]['systems'][si]['vulns'][vi]
+                    self.remove_entry(vuln)
+                    self.add_entry(vuln)
+                    self.focus, self.changed = (ui, si), vuln
+            elif kind in ('remove_unit', 'remove_system'):
+                for vuln in self.op_vulns(op):
+                    self.remove_entry(vuln)
+            else:
+                for vuln in self.op_vulns(op):
+                    self.add_entry(vuln)
+                self.focus = (op.get('unit', op['index']), op['index'] if 'unit' in op else 0)
+    
+    @staticmethod
+    def op_vulns(op):
+        """单位、系统增删操作中记录的漏洞"""
+        if 'systems' in op:
+            return [vuln for system in op['systems'] for vuln in system['vulns']]
+        return op.get('vulns', [])
+    
+    def finding_html(self, entry, number):
+        """一个漏洞的HTML片段"""
+        vuln, risk, repaired, _ = entry
+        labels = REPORT_LABELS['zh']
+        resolved = self.vuln_manager.resolve_finding(vuln)
+        parts = [f'<h4><a name="f{id(vuln)}"></a>{number} {html_escape(vuln.get("name", ""))}</h4>']
+        for field in self.FIELDS:
+            value = resolved.get(field, '')
+            if value:
+                text = html_escape(str(value)).replace('\n', '<br/>')
+                parts.append(f'<p><b>{labels[field]}{labels["separator"]}</b>{text}</p>')
+        parts.append(f'<p><b>{labels["risklevel"]}{labels["separator"]}</b>{html_escape(risk)}　'
+                     f'<b>{labels["repaired"]}{labels["separator"]}</b>{html_escape(repaired)}</p>')
+        for image in vuln.get('images') or ():
+            parts.append(f'<p><i>[{labels["evidence"]}] {html_escape(os.path.basename(image))}</i></p>')
+        return ''.join(parts)
+    
+    def render(self, template):
+        """生成预览HTML，返回 (HTML, 最近修改的漏洞的锚点名，未展示时为None)"""
+        labels = REPORT_LABELS['zh']
+        parts = [f'<h1 align="center">{html_escape(labels["title"].format(template.get("clientName", "")))}</h1>',
+                 f'<h2>{labels["basic_info"]}</h2><table border="1" cellspacing="0" cellpadding="4">']
+        for key in ('clientName', 'isFirstTest', 'contractorName', 'testDate', 'reportAuthor', 'tester', 'manager'):
+            parts.append(f'<tr><td>{labels[key]}</td><td>{html_escape(str(template.get(key, "")))}</td></tr>')
+        parts.append('</table>')
+        
+        levels = ChartCache.RISK_LEVELS
+        parts.append(f'<h2>{labels["statistics"]}</h2><table border="1" cellspacing="0" cellpadding="4"><tr>'
+                     + ''.join(f'<th>{level}</th>' for level in levels) + '</tr><tr>'
+                     + ''.join(f'<td>{self.risk_counts.get(level, 0)}</td>' for level in levels) + '</tr></table>')
+        
+        parts.append(f'<h2>{labels["details"]}</h2>')
+        data = self.store.data
+        focus_ui = min(self.focus[0], len(data) - 1) if data else 0
+        focus_si = self.focus[1] if self.focus[0] == focus_ui else 0
+        skipped = sum(len(system['vulns']) for unit in data[:focus_ui] for system in unit['systems'])
+        if data:
+            skipped += sum(len(system['vulns']) for system in data[focus_ui]['systems'][:focus_si])
+        if skipped:
+            parts.append(f'<p><i>（前面 {skipped} 个漏洞未在预览中展示）</i></p>')
+        
+        shown = 0
+        anchor = None
+        for ui in range(focus_ui, len(data)):
+            unit = data[ui]
+            parts.append(f'<h2>3.{ui + 1} {html_escape(unit["unit"])}</h2>')
+            for si in range(focus_si if ui == focus_ui else 0, len(unit['systems'])):
+                system = unit['systems'][si]
+                parts.append(f'<h3>3.{ui + 1}.{si + 1} {html_escape(system["system"])}</h3>')
+                for vi, vuln in enumerate(system['vulns']):
+                    if shown >= self.MAX_FINDINGS:
+                        break
+                    entry = self.entries.get(id(vuln))
+                    if entry is None:
+                        self.add_entry(vuln)
+                        entry = self.entries[id(vuln)]
+                    # 片段含编号，前面插入或删除漏洞导致编号变化时重新生成
+                    number = f'3.{ui + 1}.{si + 1}.{vi + 1}'
+                    if entry[3] is None or entry[3][0] != number:
+                        entry[3] = (number, self.finding_html(entry, number))
+                    parts.append(entry[3][1])
+                    if vuln is self.changed:
+                        anchor = f'f{id(vuln)}'
+                    shown += 1
+                if shown >= self.MAX_FINDINGS:
+                    break
+            if shown >= self.MAX_FINDINGS:
+                break
+        remaining = len(self.store.rows) - skipped - shown
+        if remaining > 0:
+            parts.append(f'<p><i>（其余 {remaining} 个漏洞未在预览中展示，完整内容请生成报告查看）</i></p>')
+        return ''.join(parts), anchor
+
+class MemoryTracker:
+    """按阶段统计内存
+
+    默认只记录各阶段的常驻内存(RSS)增量，开销可忽略。trace_python 时另用 tracemalloc
+    统计 Python 对象分配峰值（python-docx 底层的 lxml 节点不经过 Python 分配器，不计入），
+    tracemalloc 会使生成明显变慢，仅用于排查。未启用时不产生开销。
+    """
+    
+    def __init__(self, enabled=False, trace_python=False):
+        self.enabled = enabled
+        self.trace_python = enabled and trace_python
+        self.stages = []
+        self._started = False
+    
+    @staticmethod
+    def current_rss():
+        """当前进程常驻内存（字节），无法获取时返回None"""
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except Exception:
+            return None
+    
+    def start(self):
+        if self.trace_python and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+    
+    def stop(self):
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+    
+    @contextmanager
+    def stage(self, name):
+        """统计一个阶段的内存峰值"""
+        if not self.enabled:
+            yield
+            return
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        rss_before = self.current_rss()
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1] if tracing else None
+            rss_after = self.current_rss()
+            rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+            self.stages.append((name, peak, rss_delta))
+    
+    def report(self):
+        """各阶段内存统计文本"""
+        lines = []
+        for name, peak, rss_delta in self.stages:
+            parts = []
+            if rss_delta is not None:
+                parts.append(f"RSS增量 {rss_delta / 1024 / 1024:+.1f} MB")
+            if peak is not None:
+                parts.append(f"Python峰值 {peak / 1024 / 1024:.1f} MB")
+            if parts:
+                lines.append(f"{name}: {', '.join(parts)}")
+        return lines
+
+# XML 1.0 不允许的控制字符
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def xml_run(value):
+    """文本转为 <w:r> 片段，换行转为 <w:br/>
+
+    与 python-docx 一致，只在首尾有空白时才加 xml:space="preserve"：移入文档时
+    lxml 要逐个处理 xml: 命名空间属性，每个单元格都加会使插入耗时增加两个数量级。
+    """
+    text = INVALID_XML_CHARS.sub('', str(value))
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    pieces = []
+    for line in text.split('\n'):
+        if line != line.strip():
+            pieces.append(f'<w:t xml:space="preserve">{line}</w:t>')
+        elif line:
+            pieces.append(f'<w:t>{line}</w:t>')
+        else:
+            pieces.append('')
+    return f'<w:r>{"<w:br/>".join(pieces)}</w:r>'
+
+def add_bulk_table(doc, rows, header=None, style='Table Grid', widths=None, body=None):
+    """一次性生成整张表格的 <w:tbl> XML 并追加到文档末尾
+
+    python-docx 的 table.cell(i, j) 每次调用都重新解析表格网格，逐格填充大表格的耗时
+    随行数超线性增长。这里按列预先生成共享的单元格属性片段，拼接字符串后只解析一次。
+    rows 为元组序列；header 给出时作为标题行并在分页时重复；widths 为各列宽度比例；
+    body 为追加到的 <w:body>，默认为文档正文。
+    """
+    columns = len(header) if header else len(rows[0]) if rows else 0
+    if not columns:
+        return None
+    section = doc.sections[-1]
+    # 版心宽度（twip）
+    text_width = (section.page_width - section.left_margin - section.right_margin) // 635
+    widths = widths or [1] * columns
+    col_widths = [int(text_width * width / sum(widths)) for width in widths]
+    
+    # 每列共享的单元格开头片段
+    cell_heads = [f'<w:tc><w:tcPr><w:tcW w:w="{width}" w:type="dxa"/></w:tcPr><w:p>'
+                  for width in col_widths]
+    
+    def row_xml(values, row_properties=''):
+        cells = []
+        for head, value in zip(cell_heads, values):
+            if value is not None and value != '':
+                cells.append(f'{head}{xml_run(value)}</w:p></w:tc>')
+            else:
+                cells.append(f'{head}</w:p></w:tc>')
+        return f'<w:tr>{row_properties}{"".join(cells)}</w:tr>'
+    
+    parts = [f'<w:tbl {nsdecls("w")}><w:tblPr>'
+             f'<w:tblStyle w:val="{doc.styles[style].style_id}"/>'
+             f'<w:tblW w:w="0" w:type="auto"/>'
+             f'<w:tblLook w:val="04A0" w:firstRow="1" w:lastRow="0" w:firstColumn="1" '
+             f'w:lastColumn="0" w:noHBand="0" w:noVBand="1"/></w:tblPr><w:tblGrid>']
+    parts.extend(f'<w:gridCol w:w="{width}"/>' for width in col_widths)
+    parts.append('</w:tblGrid>')
+    if header:
+        parts.append(row_xml(header, '<w:trPr><w:tblHeader/></w:trPr>'))
+    parts.extend(row_xml(row) for row in rows)
+    parts.append('</w:tbl>')
+    
+    tbl = parse_xml(''.join(parts))
+    (doc.element.body if body is None else body)._insert_tbl(tbl)
+    return Table(tbl, doc._body)
+
+class HeadingIds:
+    """文档内标题的 paraId 和书签分配器
+
+    生成文档时逐个标题分配唯一的 w14:paraId 和书签（w:id、_Toc 名称），同时记录
+    目录项，文档写完后一次性生成目录，无需 Word 打开时重新计算。
+    """
+    
+    TOC_INDENT = 420  # 每级目录缩进（twip）
+    
+    def __init__(self):
+        self.next_para = 1
+        self.next_bookmark = 1
+        self.entries = []  # 目录项 (级别, 标题, 书签名)
+    
+    def para_id(self):
+        """下一个 paraId（8位十六进制，须小于 0x80000000）"""
+        value = f'{self.next_para:08X}'
+        self.next_para += 1
+        return value
+    
+    def bookmark(self):
+        """下一个书签 (w:id, 名称)"""
+        bookmark_id = self.next_bookmark
+        self.next_bookmark += 1
+        return bookmark_id, f'_Toc{bookmark_id:09d}'
+    
+    def mark(self, p, level, text):
+        """给标题段落加 paraId 和书签，并记为目录项（标题级别0即文档标题不加书签）"""
+        p.set(qn('w14:paraId'), self.para_id())
+        if level < 1:
+            return
+        bookmark_id, name = self.bookmark()
+        start = OxmlElement('w:bookmarkStart')
+        start.set(qn('w:id'), str(bookmark_id))
+        start.set(qn('w:name'), name)
+        end = OxmlElement('w:bookmarkEnd')
+        end.set(qn('w:id'), str(bookmark_id))
+        p.insert(1 if p.pPr is not None else 0, start)
+        p.append(end)
+        self.entries.append((level, text, name))
+    
+    def toc_xml(self, max_level):
+        """目录段落XML：TOC域的结果直接写好，各项链接到标题书签"""
+        entries = [(level, text, name) for level, text, name in self.entries if level <= max_level]
+        if not entries:
+            return ''
+        paragraphs = []
+        for k, (level, text, name) in enumerate(entries):
+            field = ''
+            if k == 0:
+                field = ('<w:r><w:fldChar w:fldCharType="begin"/></w:r>'
+                         f'<w:r><w:instrText xml:space="preserve"> TOC \\o "1-{max_level}" \\h \\z \\u </w:instrText></w:r>'
+                         '<w:r><w:fldChar w:fldCharType="separate"/></w:r>')
+            paragraphs.append(f'<w:p><w:pPr><w:ind w:left="{(level - 1) * self.TOC_INDENT}"/></w:pPr>{field}'
+                              f'<w:hyperlink w:anchor="{name}" w:history="1">{xml_run(text)}</w:hyperlink></w:p>')
+        paragraphs.append('<w:p><w:r><w:fldChar w:fldCharType="end"/></w:r></w:p>')
+        return ''.join(paragraphs)
+    
+    def insert_toc(self, placeholder, max_level):
+        """用目录替换占位段落"""
+        xml = self.toc_xml(max_level)
+        if xml:
+            for element in parse_xml(f'<w:body {nsdecls("w")}>{xml}</w:body>'):
+                placeholder._p.addprevious(element)
+        placeholder._p.getparent().remove(placeholder._p)
+
+class ReportVariant:
+    """报告版本：同一份数据的不同输出（布局、字段、语言）"""
+    
+    # 漏洞详情可输出的字段，按输出顺序排列
+    FIELDS = ('location', 'library', 'description', 'harm', 'risklevel', 'suggustion', 'repaired')
+    DEFAULT_FIELDS = ('description', 'harm', 'risklevel', 'suggustion', 'repaired')
+    LAYOUTS = ('paragraph', 'table')
+    
+    def __init__(self, output_path, language='zh', fields=DEFAULT_FIELDS, layout='paragraph', name='',
+                 overview=True, charts=True, split_units=False, toc_levels=3):
+        if language not in REPORT_LABELS:
+            raise ValueError(f"不支持的报告语言: {language}")
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"不支持的报告布局: {layout}")
+        self.output_path = output_path
+        self.language = language
+        self.fields = tuple(field for field in self.FIELDS if field in fields)
+        self.layout = layout
+        self.name = name
+        self.overview = overview  # 漏洞详情前输出全部漏洞汇总表
+        self.charts = charts      # 漏洞统计后输出风险分布图（需要 matplotlib）
+        self.split_units = split_units  # 每个单位单独一个文档，另生成含统计和索引的总报告
+        self.toc_levels = toc_levels    # 标题后预先生成的目录包含的标题级数，0为不生成
+    
+    def unit_path(self, unit):
+        """按单位拆分时单位文档的路径：<文件名>_units/<序号>_<单位名>.docx"""
+        output = Path(self.output_path)
+        name = re.sub(r'[\\/:*?"<>|\s]+', '_', unit['name']).strip('_') or 'unit'
+        return str(output.with_name(f'{output.stem}_units') / f"{unit['number'][0]:02d}_{name}{output.suffix}")
+    
+    @classmethod
+    def preset(cls, preset, output_path):
+        """预设版本：client 客户版、internal 内部版（附加定位和漏洞库条目）、en 英文版"""
+        if preset == 'client':
+            return cls(output_path, name='客户版')
+        if preset == 'internal':
+            return cls(output_path, fields=cls.FIELDS, layout='table', name='内部版')
+        if preset == 'en':
+            return cls(output_path, language='en', name='英文版')
+        raise ValueError(f"未知的报告版本: {preset}")
+
+# 报告固定文本，{}占位符在渲染时填充
+REPORT_LABELS = {
+    'zh': {
+        'title': '{}渗透测试报告', 'part': '（第{}/{}部分）', 'separator': '：',
+        'basic_info': '1. 基本信息', 'statistics': '2. 漏洞统计', 'details': '3. 漏洞详情',
+        'clientName': '委托单位', 'isFirstTest': '测试类型', 'contractorName': '承测单位',
+        'testDate': '测试时间', 'reportDate': '报告日期', 'reportAuthor': '报告作者',
+        'tester': '测试人员', 'manager': '项目经理', 'date': '{}年{}月{}日',
+        'riskLevel': '风险等级', 'high': '高危', 'mid': '中危', 'low': '低危', 'count': '数量',
+        'location': '所属位置', 'library': '漏洞库条目', 'description': '漏洞描述', 'harm': '危害',
+        'risklevel': '风险等级', 'suggustion': '修复建议', 'repaired': '修复状态',
+        'overview': '漏洞汇总', 'unit': '单位', 'system': '系统', 'name': '漏洞名称',
+        'chartRisk': '各单位风险分布', 'chartStatus': '修复状态分布', 'others': '其他',
+        'retest': '4. 复测对比', 'result': '对比结果', 'baselineStatus': '初测状态', 'retestStatus': '复测状态',
+        'unitTitle': '{}渗透测试报告 - {}', 'unitStatistics': '各单位漏洞统计', 'index': '3. 单位报告索引',
+        'number': '编号', 'systems': '系统数', 'findings': '漏洞数', 'info': '信息', 'open': '未修复',
+        'file': '文件', 'evidence': '漏洞证据', 'toc': '目录',
+    },
+    'en': {
+        'title': '{} Penetration Test Report', 'part': ' (Part {}/{})', 'separator': ': ',
+        'basic_info': '1. Basic Information', 'statistics': '2. Vulnerability Statistics',
+        'details': '3. Vulnerability Details',
+        'clientName': 'Client', 'isFirstTest': 'Test Type', 'contractorName': 'Contractor',
+        'testDate': 'Test Period', 'reportDate': 'Report Date', 'reportAuthor': 'Report Author',
+        'tester': 'Testers', 'manager': 'Project Manager', 'date': '{}-{}-{}',
+        'riskLevel': 'Risk Level', 'high': 'High', 'mid': 'Medium', 'low': 'Low', 'count': 'Count',
+        'location': 'Location', 'library': 'Library Entry', 'description': 'Description', 'harm': 'Impact',
+        'risklevel': 'Risk Level', 'suggustion': 'Remediation', 'repaired': 'Remediation Status',
+        'overview': 'Findings Overview', 'unit': 'Unit', 'system': 'System', 'name': 'Vulnerability',
+        'chartRisk': 'Risk by Unit', 'chartStatus': 'Remediation Status', 'others': 'Others',
+        'retest': '4. Retest Comparison', 'result': 'Result', 'baselineStatus': 'Initial Status',
+        'retestStatus': 'Retest Status',
+        'unitTitle': '{} Penetration Test Report - {}', 'unitStatistics': 'Findings by Unit',
+        'index': '3. Unit Report Index', 'number': 'No.', 'systems': 'Systems', 'findings': 'Findings',
+        'info': 'Info', 'open': 'Not Fixed', 'file': 'File', 'evidence': 'Evidence', 'toc': 'Contents',
+    },
+}
+
+# 英文版中固定取值的翻译
+REPORT_VALUES_EN = {
+    '初测': 'Initial Test', '复测': 'Retest',
+    '高危': 'High', '中危': 'Medium', '低危': 'Low', '信息': 'Info',
+    '未修复': 'Not Fixed', '已修复': 'Fixed', '修复中': 'In Progress', '不适用': 'N/A',
+    '重新出现': 'Regressed', '新发现': 'New', '此前已修复': 'Previously Fixed',
+}
+
+def prune_cache_dir(cache_dir, pattern, max_bytes, keep=()):
+    """按最近使用时间（mtime）删除最旧的缓存文件，使总大小不超过 max_bytes，返回剩余总大小
+
+    命中缓存时应更新文件 mtime。多个进程同时清理时，已被删除或正在使用的文件忽略。
+    """
+    files = []
+    for path in Path(cache_dir).glob(pattern):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    keep = {os.path.abspath(path) for path in keep}
+    for _, size, path in sorted(files, key=lambda item: item[0]):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue
+        total -= size
+    return total
+
+def touch_cache_file(path):
+    """更新缓存文件的最近使用时间"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+class ChartCache:
+    """风险分布图缓存
+
+    图片按统计数据和图中文字的哈希缓存（内存 + cache/charts 目录），不同报告版本、
+    重复生成时相同的分布直接复用PNG，无需重新绘制。使用 Agg 后端，无需图形界面。
+    """
+    
+    RISK_LEVELS = ('高危', '中危', '低危', '信息')
+    RISK_COLORS = ('#d9534f', '#f0ad4e', '#5bc0de', '#999999')
+    MAX_UNITS = 15  # 单位过多时只画漏洞最多的若干个，其余合并
+    DISK_LIMIT = 64 * 1024 * 1024  # cache/charts 目录总大小上限，启动时删除最久未使用的图片
+    
+    def __init__(self, cache_dir="cache/charts"):
+        self.cache_dir = cache_dir
+        self.memory = {}
+        self.lock = threading.Lock()
+        prune_cache_dir(cache_dir, '*.png', self.DISK_LIMIT)
+    
+    @staticmethod
+    def available():
+        return matplotlib is not None
+    
+    def get(self, kind, data, labels):
+        """获取图片PNG数据，未缓存时绘制"""
+        key = hashlib.sha1(json.dumps([kind, data, labels], ensure_ascii=False, sort_keys=True)
+                           .encode('utf-8')).hexdigest()
+        with self.lock:
+            png = self.memory.get(key)
+        if png is not None:
+            METRICS.inc('ssreport_cache_requests_total', cache='chart', result='hit')
+            return png
+        
+        path = os.path.join(self.cache_dir, f'{key}.png')
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+            touch_cache_file(path)
+            METRICS.inc('ssreport_cache_requests_total', cache='chart', result='hit')
+        except FileNotFoundError:
+            METRICS.inc('ssreport_cache_requests_total', cache='chart', result='miss')
+            with warnings.catch_warnings():
+                # 系统缺少中文字体时忽略缺字警告
+                warnings.filterwarnings('ignore', message='Glyph .* missing')
+                png = getattr(self, f'render_{kind}')(data, labels)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(f'{path}.{threading.get_ident()}.tmp', 'wb') as f:
+                    f.write(png)
+                os.replace(f'{path}.{threading.get_ident()}.tmp', path)
+            except Exception as e:
+                print(f"保存图表缓存失败: {e}")
+        with self.lock:
+            self.memory[key] = png
+        return png
+    
+    @staticmethod
+    def figure_png(figure):
+        buffer = io.BytesIO()
+        FigureCanvasAgg(figure).print_png(buffer)
+        return buffer.getvalue()
+    
+    def render_risk_by_unit(self, data, labels):
+        """按单位的风险等级堆叠柱状图，data 为 [[单位, [高, 中, 低, 信息]], ...]"""
+        figure = Figure(figsize=(4, 3), dpi=150)
+        ax = figure.add_subplot()
+        names = [name for name, _ in data]
+        bottoms = [0] * len(data)
+        for level, (level_label, color) in enumerate(zip(labels['levels'], self.RISK_COLORS)):
+            heights = [counts[level] for _, counts in data]
+            ax.bar(range(len(data)), heights, bottom=bottoms, color=color, label=level_label)
+            bottoms = [bottom + height for bottom, height in zip(bottoms, heights)]
+        ax.set_xticks(range(len(data)))
+        ax.set_xticklabels(names, rotation=30, ha='right', fontsize=7)
+        ax.set_title(labels['title'], fontsize=9)
+        ax.legend(fontsize=7)
+        figure.tight_layout()
+        return self.figure_png(figure)
+    
+    def render_status(self, data, labels):
+        """修复状态饼图，data 为 [[状态, 数量], ...]"""
+        figure = Figure(figsize=(4, 3), dpi=150)
+        ax = figure.add_subplot()
+        ax.pie([count for _, count in data], labels=[f'{name} ({count})' for name, count in data],
+               textprops={'fontsize': 7}, startangle=90, counterclock=False)
+        ax.set_title(labels['title'], fontsize=9)
+        figure.tight_layout()
+        return self.figure_png(figure)
+
+class EvidenceCache:
+    """漏洞证据截图处理缓存
+
+    截图按文件内容哈希去重，相同内容的截图（不论路径）只处理一次，在文档中也只保存一份图片。
+    缩小并重新压缩后的图片保存在 cache/evidence 目录，重复生成报告时不再处理；
+    目录总大小超出 DISK_LIMIT 时删除最久未使用的图片（本次生成用到的除外）。
+    """
+    
+    MAX_WIDTH = 1400   # 缩小后的最大宽度（像素）
+    PAGE_WIDTH = 6     # 文档中的最大显示宽度（英寸），按此设置图片DPI
+    QUALITY = 80       # JPEG压缩质量
+    VERSION = 1        # 处理方式变化时使已有缓存失效
+    DISK_LIMIT = 512 * 1024 * 1024  # cache/evidence 目录总大小上限
+    
+    def __init__(self, cache_dir="cache/evidence"):
+        self.cache_dir = cache_dir
+        prune_cache_dir(cache_dir, '*.jpg', self.DISK_LIMIT)
+    
+    @staticmethod
+    def available():
+        return Image is not None
+    
+    def key(self, path):
+        """截图内容及处理参数的哈希"""
+        digest = hashlib.sha1(f'{self.VERSION}:{self.MAX_WIDTH}:{self.PAGE_WIDTH}:{self.QUALITY}:'.encode('utf-8'))
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def process(self, paths, max_workers=None):
+        """处理截图，返回 {原路径: 插入文档的图片路径}，无法读取的截图不在结果中
+
+        未缓存的截图在子进程中并行处理（单核或只有一张时在本进程处理）。
+        """
+        mapping = {}
+        pending = {}  # 缓存路径 -> 原路径，相同内容只处理一次
+        for path in dict.fromkeys(paths):
+            try:
+                key = self.key(path)
+            except OSError as e:
+                print(f"读取证据截图失败: {path}: {e}")
+                continue
+            if not self.available():
+                mapping[path] = path
+                continue
+            target = os.path.join(self.cache_dir, f'{key}.jpg')
+            mapping[path] = target
+            if target not in pending:
+                if os.path.exists(target):
+                    touch_cache_file(target)
+                else:
+                    pending[target] = path
+        METRICS.inc('ssreport_cache_requests_total', len(set(mapping.values())) - len(pending),
+                    cache='evidence', result='hit')
+        METRICS.inc('ssreport_cache_requests_total', len(pending), cache='evidence', result='miss')
+        if not pending:
+            return mapping
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        arguments = (self.MAX_WIDTH, self.PAGE_WIDTH, self.QUALITY)
+        failed = set()
+        workers = min(max_workers or os.cpu_count() or 1, len(pending))
+        if workers <= 1:
+            for target, source in pending.items():
+                try:
+                    process_evidence_image(source, target, *arguments)
+                except Exception as e:
+                    print(f"处理证据截图失败: {source}: {e}")
+                    failed.add(target)
+        else:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = {target: executor.submit(process_evidence_image, source, target, *arguments)
+                           for target, source in pending.items()}
+                for target, future in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"处理证据截图失败: {pending[target]}: {e}")
+                        failed.add(target)
+        mapping = {path: target for path, target in mapping.items() if target not in failed}
+        prune_cache_dir(self.cache_dir, '*.jpg', self.DISK_LIMIT, keep=mapping.values())
+        return mapping
+
+def process_evidence_image(source, target, max_width, page_width, quality):
+    """缩小并压缩一张截图（可在子进程中执行），先写临时文件再移动到缓存路径"""
+    with Image.open(source) as image:
+        image.thumbnail((max_width, max_width * 20))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # 透明背景合成到白底
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        # DPI决定在文档中的默认尺寸：宽图缩放到页面宽度，小图保持原尺寸
+        dpi = max(96, -(-image.width // page_width))
+        temp = f'{target}.{os.getpid()}.tmp'
+        image.save(temp, 'JPEG', quality=quality, optimize=True, dpi=(dpi, dpi))
+    os.replace(temp, target)
+    return target
+
+class SectionCache:
+    """漏洞详情章节缓存
+
+    每个系统章节（系统标题及其全部漏洞）渲染出的 Word XML 按其输入的哈希缓存
+    （内存 + cache/sections 目录）：单位和系统名称、编号、各漏洞数据、用到的漏洞库条目、
+    证据图片、报告版本的语言/字段/版式及文字标签。修改一个漏洞后重新生成时只有该漏洞
+    所在的系统重新渲染，其余章节直接拼接缓存的XML。标题的 paraId、书签及图片引用与
+    所在文档相关，拼接时重新分配。渲染逻辑修改后须增加 VERSION。
+    """
+    
+    VERSION = 1
+    MEMORY_LIMIT = 64 * 1024 * 1024  # 内存中保存的压缩条目总大小上限
+    DISK_LIMIT = 256 * 1024 * 1024  # cache/sections 目录总大小上限，超出时删除最久未使用的条目
+    
+    def __init__(self, cache_dir="cache/sections"):
+        self.cache_dir = cache_dir
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.lock = threading.Lock()
+        # 启动时清理一次，之后按写入量累计，超出上限时再清理
+        self.disk_size = prune_cache_dir(cache_dir, '*.bin', self.DISK_LIMIT)
+    
+    @staticmethod
+    def entry_digest(info, digests):
+        """漏洞库条目内容的哈希（同一次渲染内按条目缓存）"""
+        digest = digests.get(id(info))
+        if digest is None:
+            digest = digests[id(info)] = hashlib.sha1(
+                json.dumps(info, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return digest
+    
+    def key(self, variant, unit, system, evidence, digests):
+        """系统章节输入的哈希"""
+        findings = [[finding['number'], finding['name'], finding['risk'], finding['vuln'], finding['overrides'],
+                     self.entry_digest(finding['info'], digests),
+                     [evidence.get(source) for source in finding['images']]]
+                    for finding in system['findings']]
+        payload = [self.VERSION, variant.language, variant.fields, variant.layout,
+                   REPORT_LABELS[variant.language], unit['name'], system['number'], system['name'], findings]
+        return hashlib.sha1(json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+                            .encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        """缓存条目 {'xml', 'headings', 'images'}，未缓存返回None"""
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+        path = os.path.join(self.cache_dir, f'{key}.bin')
+        if data is None:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                METRICS.inc('ssreport_cache_requests_total', cache='section', result='miss')
+                return None
+            self.remember(key, data)
+        touch_cache_file(path)
+        METRICS.inc('ssreport_cache_requests_total', cache='section', result='hit')
+        return json.loads(zlib.decompress(data))
+    
+    def put(self, key, entry):
+        data = zlib.compress(json.dumps(entry, ensure_ascii=False).encode('utf-8'), 1)
+        self.remember(key, data)
+        path = os.path.join(self.cache_dir, f'{key}.bin')
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(f'{path}.{os.getpid()}.{threading.get_ident()}.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(f'{path}.{os.getpid()}.{threading.get_ident()}.tmp', path)
+        except Exception as e:
+            print(f"保存章节缓存失败: {e}")
+            return
+        with self.lock:
+            self.disk_size += len(data)
+            prune = self.disk_size > self.DISK_LIMIT
+            if prune:
+                self.disk_size = 0
+        if prune:
+            size = prune_cache_dir(self.cache_dir, '*.bin', self.DISK_LIMIT, keep=(path,))
+            with self.lock:
+                self.disk_size += size
+    
+    def remember(self, key, data):
+        """放入内存缓存，超出上限时淘汰最久未使用的条目"""
+        with self.lock:
+            if key in self.memory:
+                return
+            self.memory[key] = data
+            self.memory_size += len(data)
+            while self.memory_size > self.MEMORY_LIMIT and len(self.memory) > 1:
+                self.memory_size -= len(self.memory.popitem(last=False)[1])
+
+class RetestDiff:
+    """初测与复测结果对比
+
+    两次测试的漏洞按 (单位, 系统, 漏洞类型) 分组建立哈希表，组内先按内容签名（单独修改的
+    描述、危害、修复建议）配对，其余的再按出现顺序配对，同类漏洞调整顺序不影响对比结果，
+    O(n)。结果中以 (单位, 系统, 漏洞类型, 同类序号) 标识漏洞，序号优先取初测中的位置。
+    漏洞在两次测试中的状态为 缺失/未修复/已修复，据此分为：
+    fixed 已修复（初测未修复，复测已修复或不再出现）、regressed 重新出现（初测已修复，
+    复测未修复）、new 新发现（仅复测存在）、unchanged 未修复（两次均未修复）、
+    closed 此前已修复（初测已修复，复测仍已修复或不再出现，不计入本次修复）。
+    """
+    
+    CATEGORIES = ('fixed', 'regressed', 'new', 'unchanged', 'closed')
+    LABELS = {'fixed': '已修复', 'regressed': '重新出现', 'new': '新发现', 'unchanged': '未修复',
+              'closed': '此前已修复'}
+    CLOSED = ('已修复', '不适用')
+    SIGNATURE_FIELDS = ('desc', 'harm', 'fix')
+    
+    def __init__(self, baseline, retest, canonical=None):
+        # 不保存 canonical，对比结果可随报告模型传给子进程
+        canonical = canonical or (lambda name: name)
+        self.results = {category: [] for category in self.CATEGORIES}
+        
+        before = self.identify(baseline, canonical)
+        for group, vulns in self.identify(retest, canonical).items():
+            for number, old, vuln in self.match(before.pop(group, []), vulns):
+                if vuln is None:
+                    # 复测中不再出现的漏洞视为已修复（初测时已修复的除外）
+                    category = 'fixed' if self.is_open(old) else 'closed'
+                elif old is None:
+                    category = 'new'
+                elif self.is_open(vuln):
+                    category = 'unchanged' if self.is_open(old) else 'regressed'
+                else:
+                    category = 'fixed' if self.is_open(old) else 'closed'
+                self.results[category].append((group + (number,), old, vuln))
+        for group, olds in before.items():
+            for number, old in enumerate(olds, 1):
+                self.results['fixed' if self.is_open(old) else 'closed'].append((group + (number,), old, None))
+    
+    @staticmethod
+    def identify(data, canonical):
+        """按 (单位, 系统, 漏洞类型) 分组，返回 {分组: [漏洞, ...]}，组内按出现顺序"""
+        names = {}
+        groups = {}
+        for unit in data:
+            unit_name = unit.get('unit', '').strip()
+            for system in unit.get('systems', []):
+                system_name = system.get('system', '').strip()
+                for vuln in system.get('vulns', []):
+                    name = vuln.get('name', '')
+                    if not name:
+                        continue
+                    if name not in names:
+                        names[name] = canonical(name)
+                    groups.setdefault((unit_name, system_name, names[name]), []).append(vuln)
+        return groups
+    
+    @classmethod
+    def signature(cls, vuln):
+        """漏洞内容签名：单独修改的文本，未修改的为空"""
+        return tuple((vuln.get(field) or '').strip() for field in cls.SIGNATURE_FIELDS)
+    
+    @classmethod
+    def match(cls, olds, news):
+        """同一分组内配对初测和复测漏洞，返回 [(同类序号, 初测漏洞或None, 复测漏洞或None), ...]
+
+        内容签名相同的优先配对，其余按出现顺序配对。
+        """
+        pending = {}
+        for i, old in enumerate(olds):
+            pending.setdefault(cls.signature(old), []).append(i)
+        paired = [None] * len(news)
+        for j, vuln in enumerate(news):
+            candidates = pending.get(cls.signature(vuln))
+            if candidates:
+                paired[j] = candidates.pop(0)
+        rest = iter(sorted(i for indices in pending.values() for i in indices))
+        for j in range(len(news)):
+            if paired[j] is None:
+                paired[j] = next(rest, None)
+        # 新发现的漏洞接在初测同类漏洞之后编号
+        added = itertools.count(len(olds) + 1)
+        pairs = [(next(added), None, vuln) if i is None else (i + 1, olds[i], vuln)
+                 for i, vuln in zip(paired, news)]
+        pairs.extend((i + 1, olds[i], None) for i in rest)
+        return pairs
+    
+    @classmethod
+    def is_open(cls, vuln):
+        return vuln.get('repaired', '未修复') not in cls.CLOSED
+    
+    def counts(self):
+        return {category: len(items) for category, items in self.results.items()}
+    
+    def summary(self):
+        """统计文本，如：已修复 3，重新出现 1，新发现 2，未修复 5，此前已修复 4"""
+        return '，'.join(f'{self.LABELS[category]} {len(self.results[category])}' for category in self.CATEGORIES)
+    
+    def rows(self, translate=None):
+        """对比明细表格行：(对比结果, 单位, 系统, 漏洞名称, 初测状态, 复测状态)"""
+        translate = translate or (lambda value: value)
+        rows = []
+        for category in self.CATEGORIES:
+            for (unit_name, system_name, name, _), old, new in self.results[category]:
+                rows.append((translate(self.LABELS[category]), unit_name, system_name, name,
+                             translate(old.get('repaired', '未修复')) if old is not None else '-',
+                             translate(new.get('repaired', '未修复')) if new is not None else '-'))
+        return rows
+
+class FindingDeduplicator:
+    """重复漏洞检测与合并
+
+    多人测试结果合并后，同一系统的同一漏洞常以略有不同的名称重复出现。
+    每个漏洞按 (单位, 系统, 漏洞类型, 单独修改的漏洞描述) 规范化后计算身份哈希：
+    单位和系统名称忽略空白、标点和大小写，漏洞类型按漏洞库名称和别名归一。
+    遍历一次建立 哈希 → 漏洞 的表即可找出全部重复组，O(n)。
+    每组保留最先出现的漏洞，按合并策略吸收其余漏洞的风险等级、修复状态、
+    截图和修改过的文本，再删除其余漏洞。
+    """
+    
+    RISK_POLICIES = {'worst': '保留最高风险等级', 'first': '保留首个漏洞的风险等级'}
+    STATUS_POLICIES = {'latest': '保留最新修复状态（后导入的优先）', 'worst': '保留最不利修复状态'}
+    RISK_ORDER = FindingFilterProxyModel.RISK_ORDER
+    STATUS_ORDER = FindingFilterProxyModel.STATUS_ORDER
+    TEXT_FIELDS = ('desc', 'harm', 'fix')
+    
+    def __init__(self, canonical=None, risk_level=None, risk_policy='worst', status_policy='latest'):
+        self.canonical = canonical or (lambda name: name)
+        self.risk_level = risk_level or (lambda vuln: vuln.get('risk_level') or vuln.get('level') or '未知')
+        self.risk_policy = risk_policy
+        self.status_policy = status_policy
+    
+    @staticmethod
+    def normalize(text):
+        return VulnNameResolver.PUNCTUATION.sub('', (text or '').strip().lower())
+    
+    def find(self, data):
+        """查找重复组 [[(ui, si, vi), ...], ...]，组内按出现顺序排列"""
+        names = {}
+        groups = {}
+        for ui, unit in enumerate(data):
+            unit_name = self.normalize(unit.get('unit', ''))
+            for si, system in enumerate(unit.get('systems', [])):
+                system_name = self.normalize(system.get('system', ''))
+                for vi, vuln in enumerate(system.get('vulns', [])):
+                    name = vuln.get('name', '')
+                    if not name:
+                        continue
+                    if name not in names:
+                        names[name] = VulnNameResolver.normalize(self.canonical(name))
+                    identity = '\x1f'.join((unit_name, system_name, names[name],
+                                            ' '.join((vuln.get('desc') or '').split())))
+                    key = hashlib.blake2b(identity.encode('utf-8'), digest_size=16).digest()
+                    groups.setdefault(key, []).append((ui, si, vi))
+        return [positions for positions in groups.values() if len(positions) > 1]
+    
+    def merged_fields(self, vulns):
+        """按合并策略计算保留漏洞需要修改的字段"""
+        survivor = vulns[0]
+        fields = {}
+        if self.risk_policy == 'worst':
+            risk = min((self.risk_level(vuln) for vuln in vulns),
+                       key=lambda value: self.RISK_ORDER.get(value, len(self.RISK_ORDER)))
+            if risk != self.risk_level(survivor):
+                fields['risk_level'] = risk
+        statuses = [vuln.get('repaired', '未修复') for vuln in vulns]
+        if self.status_policy == 'latest':
+            status = statuses[-1]
+        else:
+            status = min(statuses, key=lambda value: self.STATUS_ORDER.get(value, len(self.STATUS_ORDER)))
+        if status != statuses[0]:
+            fields['repaired'] = status
+        images = list(dict.fromkeys(image for vuln in vulns for image in vuln.get('images') or ()))
+        if images != list(survivor.get('images') or ()):
+            fields['images'] = images
+        for key in self.TEXT_FIELDS:
+            if not survivor.get(key) and key not in (survivor.get('cleared') or ()):
+                value = next((vuln[key] for vuln in vulns[1:] if vuln.get(key)), None)
+                if value:
+                    fields[key] = value
+        return fields
+    
+    def merge(self, store, label='合并重复漏洞'):
+        """合并 store 中的重复漏洞（作为一个事务提交，可撤销）
+
+        返回合并明细 [(单位, 系统, 漏洞名称, 合并数量), ...]
+        """
+        data = store.data
+        groups = self.find(data)
+        if not groups:
+            return []
+        updates, removed, merged = [], [], []
+        for positions in groups:
+            vulns = [data[ui]['systems'][si]['vulns'][vi] for ui, si, vi in positions]
+            fields = self.merged_fields(vulns)
+            ui, si, vi = positions[0]
+            if fields:
+                updates.append([ui, si, vi, fields, {key: vulns[0].get(key) for key in fields}])
+            removed.extend([ui, si, vi, vuln] for (ui, si, vi), vuln in zip(positions[1:], vulns[1:]))
+            merged.append((data[ui]['unit'], data[ui]['systems'][si]['system'], vulns[0]['name'], len(vulns) - 1))
+        # 重复项全部移入首个同名系统后，被移空的系统一并删除（从后往前，下标不受影响）
+        emptied = Counter((ui, si) for ui, si, _, _ in removed)
+        emptied = sorted(((ui, si) for (ui, si), count in emptied.items()
+                          if count == len(data[ui]['systems'][si]['vulns'])), reverse=True)
+        with store.transaction(label):
+            if updates:
+                store.apply({'op': 'update_vulns', 'items': updates})
+            store.apply({'op': 'remove_vulns', 'items': removed})
+            for ui, si in emptied:
+                store.apply({'op': 'remove_system', 'unit': ui, 'index': si,
+                             'name': data[ui]['systems'][si]['system']})
+        return merged
+    
+    @staticmethod
+    def summary(merged):
+        """合并结果统计文本"""
+        return f'合并 {len(merged)} 组重复漏洞，删除 {sum(item[3] for item in merged)} 个重复项'
+
+class ReportGenerator:
+    """报告生成器"""
+    
+    # 内存估算：python-docx 每个漏洞章节（标题 + 4~5个段落）约占 8KB，另有固定开销。
+    # 为粗略估计值（未按实测校准），漏洞文本很长或附带大量截图时实际占用更高；
+    # 拆分的最小单位是系统，单个系统超出预算时不再拆分，只在日志中提示
+    BASE_MEMORY = 20 * 1024 * 1024
+    FINDING_MEMORY = 8 * 1024
+    
+    def __init__(self, vuln_manager, template_manager, memory_budget=None, log=None, trace_memory=None,
+                 section_cache_dir=None):
+        self.vuln_manager = vuln_manager
+        self.template_manager = template_manager
+        # 内存预算（字节），也可通过环境变量 SSREPORT_MEMORY_BUDGET_MB 设置
+        if memory_budget is None and os.environ.get('SSREPORT_MEMORY_BUDGET_MB'):
+            memory_budget = int(float(os.environ['SSREPORT_MEMORY_BUDGET_MB']) * 1024 * 1024)
+        self.memory_budget = memory_budget
+        # 用 tracemalloc 统计各阶段 Python 分配峰值（排查用，明显变慢），也可设置环境变量 SSREPORT_TRACEMALLOC
+        if trace_memory is None:
+            trace_memory = bool(os.environ.get('SSREPORT_TRACEMALLOC'))
+        self.trace_memory = trace_memory
+        self.log = log or print
+        self.chart_cache = ChartCache()
+        self.evidence_cache = EvidenceCache()
+        # 章节缓存保存漏洞全文，目录也可通过环境变量 SSREPORT_SECTION_CACHE 设置，设为 off 时不缓存
+        if section_cache_dir is None:
+            section_cache_dir = os.environ.get('SSREPORT_SECTION_CACHE', 'cache/sections')
+        if section_cache_dir.strip().lower() in ('', '0', 'off', 'none'):
+            section_cache_dir = ''
+        self.section_cache_dir = section_cache_dir
+        self.section_cache = SectionCache(section_cache_dir) if section_cache_dir else None
+    
+    def build_report_model(self, template, vuln_data, baseline=None):
+        """构建报告中间表示
+
+        章节编号、漏洞库条目在这里解析一次（同名漏洞只查询一次漏洞库），
+        各报告版本都从中间表示渲染，不再重复遍历原始数据。
+        给出初测漏洞数据 baseline 时一并计算复测对比结果。
+        """
+        resolved = {}
+        units = []
+        for ui, unit in enumerate(vuln_data):
+            systems = []
+            for si, system in enumerate(unit.get('systems', [])):
+                findings = []
+                for vi, vuln in enumerate(system.get('vulns', [])):
+                    vuln_name = vuln.get('name', '')
+                    if not vuln_name:
+                        continue
+                    if vuln_name not in resolved:
+                        resolved[vuln_name] = self.vuln_manager.get_vulnerability(vuln_name)
+                    info = resolved[vuln_name]
+                    # 只记录单独修改过的字段，渲染时叠加在共享的漏洞库条目上
+                    overrides = self.vuln_manager.overrides(vuln) or None
+                    findings.append({
+                        'number': (ui + 1, si + 1, vi + 1),
+                        'name': vuln_name,
+                        'vuln': vuln,
+                        'info': info,
+                        'overrides': overrides,
+                        'images': list(vuln.get('images') or ()),
+                        'location': f"{unit.get('unit', '')} / {system.get('system', '')}",
+                        'risk': (overrides or {}).get('risklevel') or info.get('risklevel', '未知'),
+                    })
+                systems.append({'number': (ui + 1, si + 1), 'name': system.get('system', ''),
+                                'findings': findings})
+            units.append({'number': (ui + 1,), 'name': unit.get('unit', ''), 'systems': systems})
+        if METRICS.enabled:
+            findings_count = sum(len(system['findings']) for unit in units for system in unit['systems'])
+            METRICS.inc('ssreport_cache_requests_total', findings_count - len(resolved),
+                        cache='vulnwiki', result='hit')
+            METRICS.inc('ssreport_cache_requests_total', len(resolved), cache='vulnwiki', result='miss')
+        retest = None
+        if baseline is not None:
+            retest = RetestDiff(baseline, vuln_data, self.vuln_manager.canonical_name)
+            self.log(f"复测对比: {retest.summary()}")
+        return {'template': template, 'units': units, 'retest': retest}
+    
+    def estimate_memory(self, model, selection=None):
+        """根据漏洞数量估算生成所需内存（字节）"""
+        if selection is None:
+            selection = [(ui, range(len(unit['systems']))) for ui, unit in enumerate(model['units'])]
+        count = sum(len(model['units'][ui]['systems'][si]['findings'])
+                    for ui, systems in selection for si in systems)
+        return self.BASE_MEMORY + count * self.FINDING_MEMORY
+    
+    def split_selection(self, model, budget):
+        """将单位/系统划分为若干部分，使每部分的估算内存不超过预算
+
+        返回 [[(单位下标, [系统下标, ...]), ...], ...]，单个单位超出预算时按系统拆分。
+        """
+        capacity = max((budget - self.BASE_MEMORY) // self.FINDING_MEMORY, 1)
+        parts = []
+        current, current_count = [], 0
+        for ui, unit in enumerate(model['units']):
+            for si, system in enumerate(unit['systems']):
+                count = len(system['findings'])
+                if current and current_count + count > capacity:
+                    parts.append(current)
+                    current, current_count = [], 0
+                if current and current[-1][0] == ui:
+                    current[-1][1].append(si)
+                else:
+                    current.append((ui, [si]))
+                current_count += count
+            if not unit['systems'] and not (current and current[-1][0] == ui):
+                current.append((ui, []))
+        if current or not parts:
+            parts.append(current)
+        return parts
+    
+    def load_template(self, template_name):
+        template = self.template_manager.get_template(template_name)
+        if not template:
+            raise ValueError(f"模板 {template_name} 不存在")
+        return template
+    
+    def generate_report(self, template_name, vuln_data, output_path, baseline=None, split_units=False):
+        """生成报告
+
+        设置了内存预算且估算内存超出预算时，自动拆分为多个文档输出，返回输出路径列表。
+        复测时给出初测漏洞数据 baseline，报告末尾附复测对比。
+        split_units 为 True 时每个单位单独一个文档，返回 [总报告, 单位文档...]。
+        """
+        variant = ReportVariant(output_path, split_units=split_units)
+        return self.generate_variants(template_name, vuln_data, [variant], baseline=baseline)[0]
+    
+    def generate_variants(self, template_name, vuln_data, variants, max_workers=None, baseline=None):
+        """一次解析、生成多个报告版本
+
+        中间表示只构建一次，各版本在子进程中并行渲染写出（python-docx 为纯Python实现，
+        线程受GIL限制无法并行）；单核或设置了内存预算时在本进程顺序渲染，
+        避免并行使内存峰值成倍增加。返回与 variants 对应的输出路径（或拆分后的路径列表）。
+        """
+        return self.render_variants(self.load_template(template_name), vuln_data, variants, max_workers, baseline)
+    
+    def render_variants(self, template, vuln_data, variants, max_workers=None, baseline=None):
+        """按基本信息字典生成多个报告版本（项目文件自带基本信息时使用）
+
+        按单位拆分的版本中每个单位文档是一个独立任务，与其他版本一起并行渲染；
+        全部完成后用各单位的汇总数据生成总报告，结果为 [总报告, 单位文档...]。
+        """
+        tracker = MemoryTracker(enabled=self.memory_budget is not None or self.trace_memory,
+                                trace_python=self.trace_memory)
+        tracker.start()
+        start = time.perf_counter()
+        try:
+            with tracker.stage('构建报告模型'):
+                model = self.build_report_model(template, vuln_data, baseline)
+            
+            with tracker.stage('处理证据截图'):
+                # 各版本、各单位文档共用处理结果
+                model['evidence'] = self.evidence_cache.process(
+                    [source for unit in model['units'] for system in unit['systems']
+                     for finding in system['findings'] for source in finding['images']],
+                    max_workers)
+            
+            # 渲染任务：(版本序号, 单位下标)，单位下标为 None 表示整份报告
+            jobs = []
+            for k, variant in enumerate(variants):
+                if variant.split_units:
+                    for unit in model['units']:
+                        Path(variant.unit_path(unit)).parent.mkdir(parents=True, exist_ok=True)
+                    jobs.extend((k, ui) for ui in range(len(model['units'])))
+                else:
+                    jobs.append((k, None))
+            unit_model = lambda ui: {'template': model['template'], 'units': [model['units'][ui]], 'retest': None,
+                                     'evidence': model['evidence']}
+            
+            workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+            if self.memory_budget is not None and workers > 1:
+                # 同时渲染的文档（估算内存最大的 workers 个）之和超出预算时逐个渲染，必要时拆分
+                estimates = sorted((self.estimate_memory(model if ui is None else unit_model(ui))
+                                    for _, ui in jobs), reverse=True)
+                if sum(estimates[:workers]) > self.memory_budget:
+                    workers = 1
+            if workers <= 1:
+                outputs = [self.render_variant(model, variants[k], tracker) if ui is None
+                           else self.render_unit(unit_model(ui), variants[k],
+                                                 variants[k].unit_path(model['units'][ui]), tracker)
+                           for k, ui in jobs]
+            else:
+                # GUI进程中有后台线程，使用spawn避免fork带来的锁状态问题
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_render_worker,
+                                         initargs=(self.memory_budget, self.section_cache_dir)) as executor:
+                    futures = [executor.submit(render_variant_worker, model, variants[k]) if ui is None
+                               else executor.submit(render_unit_worker, unit_model(ui), variants[k],
+                                                    variants[k].unit_path(model['units'][ui]))
+                               for k, ui in jobs]
+                    outputs = []
+                    for future in futures:
+                        output, snapshot = future.result()
+                        METRICS.merge(snapshot)
+                        outputs.append(output)
+            
+            results = [None] * len(variants)
+            aggregates = {k: [] for k, variant in enumerate(variants) if variant.split_units}
+            for (k, ui), output in zip(jobs, outputs):
+                if ui is None:
+                    results[k] = output
+                else:
+                    aggregates[k].append(output)
+            for k, unit_aggregates in aggregates.items():
+                master = self.render_master(model, variants[k], unit_aggregates, tracker)
+                results[k] = [master] + [path for aggregate in unit_aggregates for path in aggregate['paths']]
+        except Exception:
+            METRICS.inc('ssreport_report_jobs_total', status='failure')
+            raise
+        else:
+            METRICS.inc('ssreport_report_jobs_total', status='success')
+            METRICS.observe('ssreport_report_seconds', time.perf_counter() - start)
+        finally:
+            tracker.stop()
+        for line in tracker.report():
+            self.log(f"内存统计 - {line}")
+        return results
+    
+    def render_variant(self, model, variant, tracker=None):
+        """渲染一个报告版本，估算内存超出预算时拆分输出"""
+        return self.render_budgeted(model, variant, variant.output_path, tracker)
+    
+    def render_budgeted(self, model, variant, output_path, tracker=None, aggregate=None):
+        """渲染一个文档，估算内存超出预算时拆分为 <文件名>_part<序号> 多个文档
+
+        拆分时返回路径列表，未拆分时返回单个路径。aggregate 见 render_document（按单位拆分的单位文档）。
+        """
+        estimate = self.estimate_memory(model)
+        if not (self.memory_budget and estimate > self.memory_budget):
+            return self.render_document(model, variant, tracker=tracker, output_path=output_path,
+                                        aggregate=aggregate)
+        
+        parts = self.split_selection(model, self.memory_budget)
+        name = f"{aggregate['name']} " if aggregate is not None else ''
+        self.log(f"{name}估算内存 {estimate / 1024 / 1024:.0f} MB 超出预算 "
+                 f"{self.memory_budget / 1024 / 1024:.0f} MB，拆分为 {len(parts)} 个文档生成")
+        output = Path(output_path)
+        result = []
+        for k, selection in enumerate(parts, 1):
+            part_estimate = self.estimate_memory(model, selection)
+            if part_estimate > self.memory_budget:
+                ui, si = max(((ui, si) for ui, system_indices in selection for si in system_indices),
+                             key=lambda item: len(model['units'][item[0]]['systems'][item[1]]['findings']))
+                system = model['units'][ui]['systems'][si]
+                self.log(f"第 {k} 部分估算内存 {part_estimate / 1024 / 1024:.0f} MB 仍超出预算：系统 "
+                         f"{system['name']} 含 {len(system['findings'])} 个漏洞，单个系统不再拆分")
+            part_path = str(output.with_name(f'{output.stem}_part{k}{output.suffix}'))
+            self.render_document(model, variant, selection, part=(k, len(parts)),
+                                 tracker=tracker, output_path=part_path, aggregate=aggregate)
+            result.append(part_path)
+        return result
+    
+    @staticmethod
+    def translate(variant, value):
+        """英文版翻译固定取值"""
+        if variant.language == 'en':
+            return REPORT_VALUES_EN.get(value, value)
+        return value
+    
+    @staticmethod
+    def finding_name(variant, finding):
+        """漏洞名称（英文版优先使用漏洞库中的 name_en）"""
+        if variant.language != 'zh' and finding['info'].get(f'name_{variant.language}'):
+            return finding['info'][f'name_{variant.language}']
+        return finding['name']
+    
+    def field_value(self, variant, finding, field):
+        """漏洞详情字段取值（英文版优先使用漏洞库中的 <字段>_en）"""
+        if field == 'location':
+            return finding['location']
+        if field == 'repaired':
+            return self.translate(variant, finding['vuln'].get('repaired', ''))
+        overrides = finding['overrides']
+        if overrides and field in overrides:
+            return self.translate(variant, overrides[field])
+        info = finding['info']
+        if field == 'library':
+            return info.get('name', '')
+        if variant.language != 'zh' and info.get(f'{field}_{variant.language}'):
+            return info[f'{field}_{variant.language}']
+        return self.translate(variant, info.get(field, ''))
+    
+    @staticmethod
+    def unit_aggregate(unit):
+        """单位的汇总数据：系统数、漏洞数、各风险等级数量和各修复状态数量"""
+        levels = ChartCache.RISK_LEVELS
+        risk = [0] * len(levels)
+        status = {}
+        findings = 0
+        for system in unit['systems']:
+            for finding in system['findings']:
+                if finding['risk'] in levels:
+                    risk[levels.index(finding['risk'])] += 1
+                repaired = finding['vuln'].get('repaired') or '未修复'
+                status[repaired] = status.get(repaired, 0) + 1
+                findings += 1
+        return {'number': unit['number'], 'name': unit['name'], 'systems': len(unit['systems']),
+                'findings': findings, 'risk': risk, 'status': status,
+                'open': findings - sum(status.get(closed, 0) for closed in RetestDiff.CLOSED)}
+    
+    def render_charts(self, model, variant, aggregates=None):
+        """统计全部漏洞并生成风险分布图、修复状态图，返回PNG数据列表
+
+        aggregates 为各单位的汇总数据（按单位拆分时由单位文档生成时一并算出），未给出时从中间表示统计。
+        """
+        labels = REPORT_LABELS[variant.language]
+        levels = ChartCache.RISK_LEVELS
+        if aggregates is None:
+            aggregates = [self.unit_aggregate(unit) for unit in model['units']]
+        by_unit = [[aggregate['name'], list(aggregate['risk'])] for aggregate in aggregates]
+        status_counts = {}
+        for aggregate in aggregates:
+            for status, count in aggregate['status'].items():
+                status = self.translate(variant, status)
+                status_counts[status] = status_counts.get(status, 0) + count
+        
+        if len(by_unit) > ChartCache.MAX_UNITS:
+            by_unit.sort(key=lambda item: -sum(item[1]))
+            rest = by_unit[ChartCache.MAX_UNITS - 1:]
+            by_unit = by_unit[:ChartCache.MAX_UNITS - 1]
+            by_unit.append([labels['others'], [sum(counts[level] for _, counts in rest)
+                                               for level in range(len(levels))]])
+        
+        level_labels = [self.translate(variant, level) for level in levels]
+        charts = [self.chart_cache.get('risk_by_unit', by_unit,
+                                       {'title': labels['chartRisk'], 'levels': level_labels})]
+        if status_counts:
+            charts.append(self.chart_cache.get('status', sorted(status_counts.items()),
+                                               {'title': labels['chartStatus']}))
+        return charts
+    
+    def field_rows(self, variant, finding, fields):
+        """漏洞详情的 (标签, 文本) 行，空字段跳过"""
+        labels = REPORT_LABELS[variant.language]
+        rows = []
+        for field in fields:
+            value = self.field_value(variant, finding, field)
+            if value:
+                rows.append((labels[field], value))
+        return rows
+    
+    @staticmethod
+    def add_heading(doc, text, level, ids):
+        """添加标题并分配 paraId 和书签（doc 也可以是 new_body 创建的容器）"""
+        heading = doc.add_paragraph(text, 'Title' if level == 0 else f'Heading {level}')
+        ids.mark(heading._p, level, text)
+        return heading
+    
+    def add_title(self, doc, text, variant, ids):
+        """文档标题，其后为目录占位段落（文档写完后替换为目录），返回占位段落"""
+        title = self.add_heading(doc, text, 0, ids)
+        title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        if not variant.toc_levels:
+            return None
+        doc.add_paragraph(REPORT_LABELS[variant.language]['toc'], style='TOC Heading')
+        return doc.add_paragraph()
+    
+    def add_basic_info(self, doc, template, variant, ids):
+        """添加基本信息章节（总报告、单位文档和拆分文档的第一部分共用）"""
+        labels = REPORT_LABELS[variant.language]
+        self.add_heading(doc, labels['basic_info'], 1, ids)
+        
+        report_date = labels['date'].format(template.get('reportYear', ''),
+                                            template.get('reportMonth', ''),
+                                            template.get('reportDay', ''))
+        info_data = [
+            (labels['clientName'], template.get('clientName', '')),
+            (labels['isFirstTest'], self.translate(variant, template.get('isFirstTest', ''))),
+            (labels['contractorName'], template.get('contractorName', '')),
+            (labels['testDate'], template.get('testDate', '')),
+            (labels['reportDate'], report_date),
+            (labels['reportAuthor'], template.get('reportAuthor', '')),
+            (labels['tester'], template.get('tester', '')),
+            (labels['manager'], template.get('manager', ''))
+        ]
+        add_bulk_table(doc, info_data)
+    
+    def add_retest(self, doc, retest, variant, ids):
+        """添加复测对比章节"""
+        labels = REPORT_LABELS[variant.language]
+        translate = lambda value: self.translate(variant, value)
+        self.add_heading(doc, labels['retest'], 1, ids)
+        counts = retest.counts()
+        add_bulk_table(doc, [tuple(str(counts[category]) for category in RetestDiff.CATEGORIES)],
+                       tuple(translate(RetestDiff.LABELS[category]) for category in RetestDiff.CATEGORIES))
+        doc.add_paragraph()
+        add_bulk_table(doc, retest.rows(translate),
+                       (labels['result'], labels['unit'], labels['system'], labels['name'],
+                        labels['baselineStatus'], labels['retestStatus']),
+                       widths=(1, 2, 2, 4, 1, 1))
+    
+    def render_document(self, model, variant, selection=None, part=None, tracker=None, output_path=None,
+                        aggregate=None):
+        """渲染一个Word文档
+
+        selection 指定要输出的 (单位下标, [系统下标]) 列表，编号始终按完整数据计算；
+        part=(序号, 总数) 时为拆分输出的其中一部分，基本信息和统计只出现在第一部分。
+        aggregate 为单位汇总数据时渲染按单位拆分的单位文档：统计只含该单位，不含图表和复测对比。
+        """
+        start = time.perf_counter()
+        tracker = tracker or MemoryTracker()
+        template = model['template']
+        labels = REPORT_LABELS[variant.language]
+        if selection is None:
+            selection = [(ui, range(len(unit['systems']))) for ui, unit in enumerate(model['units'])]
+        part_no, part_count = part or (1, 1)
+        stage_suffix = (f'[{variant.name}]' if variant.name else '') + (str(part_no) if part_count > 1 else '')
+        
+        # 创建Word文档
+        doc = Document()
+        ids = HeadingIds()
+        
+        # 设置文档标题
+        if aggregate is not None:
+            title_text = labels['unitTitle'].format(template.get('clientName', ''), aggregate['name'])
+        else:
+            title_text = labels['title'].format(template.get('clientName', ''))
+        if part_count > 1:
+            title_text += labels['part'].format(part_no, part_count)
+        toc_paragraph = self.add_title(doc, title_text, variant, ids)
+        
+        # 统计图表在后台线程绘制，与正文渲染同时进行
+        chart_executor = chart_future = None
+        if part_no == 1 and variant.charts and ChartCache.available() and model['units'] and aggregate is None:
+            chart_executor = ThreadPoolExecutor(max_workers=1)
+            chart_future = chart_executor.submit(self.render_charts, model, variant)
+        
+        if part_no == 1:
+            with tracker.stage(f'基本信息{stage_suffix}'):
+                self.add_basic_info(doc, template, variant, ids)
+            
+            with tracker.stage(f'漏洞统计{stage_suffix}'):
+                # 添加漏洞统计
+                self.add_heading(doc, labels['statistics'], 1, ids)
+                
+                if aggregate is not None:
+                    counts = [str(count) for count in aggregate['risk'][:3]]
+                else:
+                    counts = [template.get('highVuln', '0'), template.get('midVuln', '0'), template.get('lowVuln', '0')]
+                add_bulk_table(doc, [(labels['count'], *counts)],
+                               (labels['riskLevel'], labels['high'], labels['mid'], labels['low']))
+                # 图表占位段落，正文完成后插入图片
+                chart_paragraph = doc.add_paragraph() if chart_future else None
+        
+        with tracker.stage(f'漏洞详情{stage_suffix}'):
+            # 添加漏洞详情
+            self.add_heading(doc, labels['details'], 1, ids)
+            
+            # 只取决于漏洞库条目的字段按条目缓存，位置和修复状态逐个漏洞生成
+            text_fields = [field for field in variant.fields if field not in ('location', 'repaired')]
+            fragments = {}
+            digests = {}
+            evidence = model.get('evidence', {})
+            shape_ids = None
+            
+            if variant.overview:
+                # 漏洞汇总表，大量漏洞时逐格填充过慢，整表一次生成
+                overview_rows = [
+                    (unit['name'], system['name'], self.finding_name(variant, finding),
+                     self.translate(variant, finding['risk']),
+                     self.translate(variant, finding['vuln'].get('repaired', '')))
+                    for unit, system in ((model['units'][ui], model['units'][ui]['systems'][si])
+                                         for ui, system_indices in selection for si in system_indices)
+                    for finding in system['findings']
+                ]
+                doc.add_paragraph(labels['overview'])
+                add_bulk_table(doc, overview_rows,
+                               (labels['unit'], labels['system'], labels['name'],
+                                labels['risklevel'], labels['repaired']),
+                               widths=(2, 2, 4, 1, 1))
+            
+            for ui, system_indices in selection:
+                unit = model['units'][ui]
+                heading = self.new_body(doc)
+                self.add_heading(heading, f"3.{unit['number'][0]} {unit['name']}", 2, ids)
+                self.append_body(doc, list(heading._element))
+                
+                # 系统章节未修改时拼接缓存的XML，修改过的重新渲染
+                for si in system_indices:
+                    system = unit['systems'][si]
+                    cache = self.section_cache
+                    key = cache.key(variant, unit, system, evidence, digests) if cache is not None else None
+                    entry = cache.get(key) if cache is not None else None
+                    if entry is None:
+                        body, entry = self.render_section(doc, variant, system, text_fields, fragments, evidence)
+                        if cache is not None:
+                            cache.put(key, entry)
+                        rebind = False
+                    else:
+                        body = parse_xml(entry['xml'])
+                        rebind = True
+                    if entry['images'] and shape_ids is None:
+                        shape_ids = itertools.count(doc.part.next_id)
+                    self.splice_section(doc, body, entry, ids, shape_ids, rebind)
+        
+        if model.get('retest') is not None and part_no == part_count and aggregate is None:
+            with tracker.stage(f'复测对比{stage_suffix}'):
+                # 复测对比放在最后一部分的末尾，不影响漏洞详情的章节编号
+                self.add_retest(doc, model['retest'], variant, ids)
+        
+        if chart_future is not None:
+            with tracker.stage(f'统计图表{stage_suffix}'):
+                try:
+                    for png in chart_future.result():
+                        chart_paragraph.add_run().add_picture(io.BytesIO(png), width=Inches(3))
+                except Exception as e:
+                    self.log(f"生成统计图表失败: {e}")
+                finally:
+                    chart_executor.shutdown()
+        
+        if toc_paragraph is not None:
+            with tracker.stage(f'目录{stage_suffix}'):
+                ids.insert_toc(toc_paragraph, variant.toc_levels)
+        
+        # 保存文档
+        output_path = output_path or variant.output_path
+        if METRICS.enabled:
+            METRICS.observe('ssreport_document_rss_bytes', MemoryTracker.current_rss() or 0)
+        with tracker.stage(f'保存文档{stage_suffix}'):
+            doc.save(output_path)
+        if METRICS.enabled:
+            METRICS.inc('ssreport_documents_total')
+            METRICS.inc('ssreport_findings_total', sum(len(model['units'][ui]['systems'][si]['findings'])
+                                                       for ui, system_indices in selection for si in system_indices))
+            METRICS.observe('ssreport_document_seconds', time.perf_counter() - start)
+        return output_path
+
+    def render_section(self, doc, variant, system, text_fields, fragments, evidence):
+        """渲染一个系统章节（系统标题及其全部漏洞）到独立的 <w:body>
+
+        返回 (容器元素, 缓存条目)；条目中记录标题位置和图片路径，拼接时据此分配书签和图片引用。
+        """
+        labels = REPORT_LABELS[variant.language]
+        body = self.new_body(doc)
+        headings = []
+        images = []
+        # 按名称查找样式需遍历全部样式，每个章节只查一次
+        style_ids = {level: doc.styles[f'Heading {level}'].style_id for level in (3, 4)}
+        
+        def add_heading(text, level):
+            headings.append((len(body._element), level, text))
+            body.add_paragraph(text)._p.style = style_ids[level]
+        
+        head_fields = [field for field in variant.fields if field == 'location']
+        tail_fields = [field for field in variant.fields if field == 'repaired']
+        add_heading(f"3.{'.'.join(map(str, system['number']))} {system['name']}", 3)
+        for finding in system['findings']:
+            add_heading(f"3.{'.'.join(map(str, finding['number']))} {self.finding_name(variant, finding)}", 4)
+            
+            # 按版本选择的字段输出，空字段跳过；未修改的漏洞复用同一条目已生成的文本
+            if finding['overrides'] is None:
+                rows = fragments.get(id(finding['info']))
+                if rows is None:
+                    rows = fragments[id(finding['info'])] = self.field_rows(variant, finding, text_fields)
+            else:
+                rows = self.field_rows(variant, finding, text_fields)
+            rows = (self.field_rows(variant, finding, head_fields) + rows
+                    + self.field_rows(variant, finding, tail_fields))
+            if variant.layout == 'table' and rows:
+                add_bulk_table(doc, rows, widths=(1, 4), body=body._element)
+            else:
+                for label, value in rows:
+                    body.add_paragraph(f'{label}{labels["separator"]}{value}')
+            
+            # 证据截图：相同图片在文档中只保存一份，各处引用同一图片
+            sources = [evidence[source] for source in finding['images'] if source in evidence]
+            if sources:
+                body.add_paragraph(f'{labels["evidence"]}{labels["separator"]}')
+                for image in sources:
+                    body.add_paragraph().add_run().add_picture(image)
+                    images.append(image)
+        
+        entry = {'xml': etree.tostring(body._element, encoding='unicode'), 'headings': headings, 'images': images}
+        return body._element, entry
+    
+    @staticmethod
+    def splice_section(doc, body, entry, ids, shape_ids, rebind):
+        """将章节容器中的元素移到文档正文末尾
+
+        标题重新分配 paraId 和书签并记为目录项，图片编号重新分配；
+        rebind 为真（来自缓存）时图片关系按路径在本文档中重新建立。
+        """
+        children = list(body)
+        for index, level, text in entry['headings']:
+            ids.mark(children[index], level, text)
+        if rebind:
+            for blip, image in zip(body.iter(qn('a:blip')), entry['images']):
+                blip.set(qn('r:embed'), doc.part.get_or_add_image(image)[0])
+        if entry['images']:
+            for shape in body.iter(qn('wp:docPr')):
+                shape.set('id', str(next(shape_ids)))
+        ReportGenerator.append_body(doc, children)
+    
+    @staticmethod
+    def new_body(doc):
+        """独立的 <w:body> 容器，在其中追加段落不必在整个文档正文中查找插入位置"""
+        return _Body(parse_xml(f'<w:body {nsdecls("w")}/>'), doc)
+    
+    @staticmethod
+    def append_body(doc, elements):
+        """将元素移到文档正文末尾（分节属性之前），O(元素数)"""
+        body = doc.element.body
+        # len(body) 需遍历全部子元素，这里只取最后一个
+        last = next(body.iterchildren(reversed=True), None)
+        for element in elements:
+            if last is not None and last.tag == qn('w:sectPr'):
+                last.addprevious(element)
+            else:
+                body.append(element)
+    
+    def render_unit(self, unit_model, variant, output_path, tracker=None):
+        """渲染按单位拆分的单位文档，返回该单位的汇总数据（含输出路径）供总报告使用
+
+        unit_model 为只含一个单位的中间表示，编号沿用完整数据中的编号。
+        """
+        aggregate = self.unit_aggregate(unit_model['units'][0])
+        # 单位文档同样按内存预算估算，超出时拆分；索引中链接第一部分
+        paths = self.render_budgeted(unit_model, variant, output_path, tracker, aggregate)
+        aggregate['paths'] = paths if isinstance(paths, list) else [paths]
+        aggregate['path'] = aggregate['paths'][0]
+        return aggregate
+    
+    def render_master(self, model, variant, aggregates, tracker=None):
+        """按单位拆分时的总报告：基本信息、汇总统计、图表和单位文档索引
+
+        只使用各单位文档生成时算出的汇总数据，不再遍历漏洞。
+        """
+        start = time.perf_counter()
+        tracker = tracker or MemoryTracker()
+        template = model['template']
+        labels = REPORT_LABELS[variant.language]
+        stage_suffix = f'[{variant.name}]' if variant.name else ''
+        
+        doc = Document()
+        ids = HeadingIds()
+        toc_paragraph = self.add_title(doc, labels['title'].format(template.get('clientName', '')), variant, ids)
+        
+        with tracker.stage(f'总报告{stage_suffix}'):
+            self.add_basic_info(doc, template, variant, ids)
+            
+            self.add_heading(doc, labels['statistics'], 1, ids)
+            add_bulk_table(doc,
+                           [(labels['count'], template.get('highVuln', '0'),
+                             template.get('midVuln', '0'), template.get('lowVuln', '0'))],
+                           (labels['riskLevel'], labels['high'], labels['mid'], labels['low']))
+            
+            doc.add_paragraph(labels['unitStatistics'])
+            add_bulk_table(doc,
+                           [(aggregate['name'], str(aggregate['systems']), str(aggregate['findings']),
+                             *map(str, aggregate['risk']), str(aggregate['open']))
+                            for aggregate in aggregates],
+                           (labels['unit'], labels['systems'], labels['findings'], labels['high'],
+                            labels['mid'], labels['low'], labels['info'], labels['open']),
+                           widths=(4, 1, 1, 1, 1, 1, 1, 1))
+            
+            if variant.charts and ChartCache.available() and aggregates:
+                try:
+                    paragraph = doc.add_paragraph()
+                    for png in self.render_charts(model, variant, aggregates):
+                        paragraph.add_run().add_picture(io.BytesIO(png), width=Inches(3))
+                except Exception as e:
+                    self.log(f"生成统计图表失败: {e}")
+            
+            # 单位文档索引，文件路径相对总报告所在目录
+            self.add_heading(doc, labels['index'], 1, ids)
+            base = Path(variant.output_path).parent
+            add_bulk_table(doc,
+                           [(f"3.{aggregate['number'][0]}", aggregate['name'], str(aggregate['findings']),
+                             Path(os.path.relpath(aggregate['path'], base)).as_posix())
+                            for aggregate in aggregates],
+                           (labels['number'], labels['unit'], labels['findings'], labels['file']),
+                           widths=(1, 3, 1, 5))
+            
+            if model.get('retest') is not None:
+                self.add_retest(doc, model['retest'], variant, ids)
+            
+            if toc_paragraph is not None:
+                ids.insert_toc(toc_paragraph, variant.toc_levels)
+        
+        if METRICS.enabled:
+            METRICS.observe('ssreport_document_rss_bytes', MemoryTracker.current_rss() or 0)
+        with tracker.stage(f'保存文档{stage_suffix}'):
+            doc.save(variant.output_path)
+        if METRICS.enabled:
+            # 漏洞数已由各单位文档计入，总报告不再重复计数
+            METRICS.inc('ssreport_documents_total')
+            METRICS.observe('ssreport_document_seconds', time.perf_counter() - start)
+        return variant.output_path
+
+_render_generator = None
+
+def init_render_worker(memory_budget=None, section_cache_dir=None):
+    """渲染工作进程初始化：每个进程只创建一次生成器，缓存目录只清理一次，内存中的缓存在任务间复用
+
+    渲染只依赖中间表示，不需要漏洞库和模板管理器。
+    """
+    global _render_generator
+    _render_generator = ReportGenerator(None, None, memory_budget=memory_budget,
+                                        section_cache_dir=section_cache_dir)
+
+def render_variant_worker(model, variant):
+    """子进程渲染入口，返回 (输出路径, 子进程指标)"""
+    if _render_generator is None:
+        init_render_worker()
+    return _render_generator.render_variant(model, variant), METRICS.drain()
+
+def render_unit_worker(unit_model, variant, output_path):
+    """子进程渲染入口：按单位拆分时的单位文档，只传入该单位的中间表示"""
+    if _render_generator is None:
+        init_render_worker()
+    return _render_generator.render_unit(unit_model, variant, output_path), METRICS.drain()
+
+def load_engagement(path):
+    """读取项目文件，返回 (基本信息, 漏洞数据)
+
+    支持"导出项目"生成的 {"template": {...}, "vulnerability_data": [...]}
+    以及仅包含漏洞数据的 vuln_tree.json 格式（单位列表）。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return {}, data
+    if isinstance(data, dict) and isinstance(data.get('vulnerability_data'), list):
+        return data.get('template', {}), data['vulnerability_data']
+    raise ValueError('数据格式错误，应为项目文件或单位列表')
+
+def save_engagement(path, template, vuln_data):
+    """保存项目文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'template': template, 'vulnerability_data': vuln_data}, f, ensure_ascii=False, indent=2)
+
+class FindingAnalytics:
+    """跨项目统计分析
+
+    将历次项目的漏洞按列存储为 NumPy 数组，委托单位、单位、系统、漏洞类型、
+    风险等级、修复状态等文本列字典编码为整数，分组计数用 bincount 向量化完成。
+    """
+    
+    COLUMNS = ('client', 'quarter', 'unit', 'system', 'vuln', 'risk', 'status', 'source')
+    COLUMN_LABELS = {
+        'client': '委托单位', 'quarter': '季度', 'unit': '单位', 'system': '系统',
+        'vuln': '漏洞类型', 'risk': '风险等级', 'status': '修复状态', 'source': '项目文件',
+    }
+    REPAIRED = '已修复'
+    
+    def __init__(self, store_dir="analytics", vuln_manager=None):
+        self.store_dir = Path(store_dir)
+        self.vuln_manager = vuln_manager
+        self.vocab = {column: [] for column in self.COLUMNS}
+        self.codes = {column: {} for column in self.COLUMNS}
+        self.columns = {column: np.zeros(0, dtype=np.int32) for column in self.COLUMNS}
+        self.sources = {}
+        self.load()
+    
+    def __len__(self):
+        return len(self.columns['source'])
+    
+    def load(self):
+        """加载已保存的列存储"""
+        try:
+            with open(self.store_dir / 'meta.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with np.load(self.store_dir / 'columns.npz') as arrays:
+                self.columns = {column: arrays[column] for column in self.COLUMNS}
+            self.vocab = meta['vocab']
+            self.sources = meta['sources']
+            self.codes = {column: {value: code for code, value in enumerate(values)}
+                          for column, values in self.vocab.items()}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"加载统计数据失败: {e}")
+    
+    def save(self):
+        """保存列存储"""
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        np.savez(self.store_dir / 'columns.npz', **self.columns)
+        with open(self.store_dir / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump({'vocab': self.vocab, 'sources': self.sources}, f, ensure_ascii=False)
+    
+    def encode(self, column, value):
+        """字典编码"""
+        code = self.codes[column].get(value)
+        if code is None:
+            code = self.codes[column][value] = len(self.vocab[column])
+            self.vocab[column].append(value)
+        return code
+    
+    @staticmethod
+    def engagement_quarter(template, mtime):
+        """项目所属季度：优先取测试时间，其次报告日期，最后取文件修改时间"""
+        match = re.search(r'(\d{4})\s*年\s*(\d{1,2})\s*月', template.get('testDate', ''))
+        if match:
+            year, month = int(match.group(1)), int(match.group(2))
+        elif str(template.get('reportYear', '')).isdigit() and str(template.get('reportMonth', '')).isdigit():
+            year, month = int(template['reportYear']), int(template['reportMonth'])
+        else:
+            date = datetime.fromtimestamp(mtime)
+            year, month = date.year, date.month
+        return f'{year}Q{(month - 1) // 3 + 1}'
+    
+    def canonical_name(self, name):
+        """漏洞类型：能解析到漏洞库时使用漏洞库名称"""
+        if self.vuln_manager is None:
+            return name
+        return self.vuln_manager.canonical_name(name)
+    
+    def ingest(self, paths):
+        """导入项目文件或目录（目录下所有 .json），未变化的文件跳过，返回导入的漏洞数"""
+        files = []
+        for path in map(Path, paths):
+            files.extend(sorted(path.glob('*.json')) if path.is_dir() else [path])
+        added = 0
+        replaced = []
+        chunks = {column: [self.columns[column]] for column in self.COLUMNS}
+        for path in files:
+            source = str(path.resolve())
+            mtime = path.stat().st_mtime
+            if self.sources.get(source) == mtime:
+                continue
+            try:
+                template, vuln_data = load_engagement(path)
+            except Exception as e:
+                print(f"导入项目文件 {path} 失败: {e}")
+                continue
+            
+            # 文件变化时删除该文件之前导入的记录
+            source_code = self.encode('source', source)
+            if source in self.sources:
+                replaced.append(source_code)
+            
+            client = self.encode('client', template.get('clientName') or path.stem)
+            quarter = self.encode('quarter', self.engagement_quarter(template, mtime))
+            rows = {column: [] for column in self.COLUMNS}
+            for unit in vuln_data:
+                unit_code = self.encode('unit', unit.get('unit', ''))
+                for system in unit.get('systems', []):
+                    system_code = self.encode('system', system.get('system', ''))
+                    for vuln in system.get('vulns', []):
+                        name = self.canonical_name(vuln.get('name', ''))
+                        risk = vuln.get('risk_level') or vuln.get('level')
+                        if not risk and self.vuln_manager is not None:
+                            risk = self.vuln_manager.get_vulnerability(name).get('risklevel')
+                        rows['unit'].append(unit_code)
+                        rows['system'].append(system_code)
+                        rows['vuln'].append(self.encode('vuln', name))
+                        rows['risk'].append(self.encode('risk', risk or '未知'))
+                        rows['status'].append(self.encode('status', vuln.get('repaired') or '未修复'))
+            count = len(rows['unit'])
+            rows['client'] = [client] * count
+            rows['quarter'] = [quarter] * count
+            rows['source'] = [source_code] * count
+            for column in self.COLUMNS:
+                chunks[column].append(np.asarray(rows[column], dtype=np.int32))
+            self.sources[source] = mtime
+            added += count
+        if not added and not replaced:
+            return 0
+        # 旧记录只在原有数据中，新数据块追加在其后
+        existing = len(self)
+        self.columns = {column: np.concatenate(values) for column, values in chunks.items()}
+        if replaced:
+            keep = np.ones(len(self), dtype=bool)
+            keep[:existing] = ~np.isin(self.columns['source'][:existing], replaced)
+            self.columns = {column: values[keep] for column, values in self.columns.items()}
+        self.save()
+        return added
+    
+    def mask(self, where=None):
+        """按 {列: 取值} 过滤的布尔掩码"""
+        mask = np.ones(len(self), dtype=bool)
+        for column, value in (where or {}).items():
+            code = self.codes[column].get(value)
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.columns[column] == code
+        return mask
+    
+    def _group(self, by, mask):
+        """返回 (组合编码, 计数, 已修复计数)
+
+        组合编码超出 int64 范围时改为对各列编码逐行去重，组合编码为每组的编码数组。
+        """
+        size = 1
+        for column in by:
+            size *= max(len(self.vocab[column]), 1)
+        repaired_code = self.codes['status'].get(self.REPAIRED, -1)
+        repaired = self.columns['status'][mask] == repaired_code
+        if size > 2 ** 63:
+            stacked = np.stack([self.columns[column][mask] for column in by], axis=1)
+            keys, inverse, counts = np.unique(stacked, axis=0, return_inverse=True, return_counts=True)
+            inverse = inverse.reshape(-1)
+            return keys, counts, np.bincount(inverse, weights=repaired, minlength=len(keys)).astype(np.int64)
+        key = np.zeros(int(mask.sum()), dtype=np.int64)
+        for column in by:
+            key = key * max(len(self.vocab[column]), 1) + self.columns[column][mask]
+        if size <= 10_000_000:
+            counts = np.bincount(key, minlength=size)
+            repaired_counts = np.bincount(key, weights=repaired, minlength=size)
+            keys = np.flatnonzero(counts)
+            return keys, counts[keys], repaired_counts[keys].astype(np.int64)
+        keys, inverse, counts = np.unique(key, return_inverse=True, return_counts=True)
+        return keys, counts, np.bincount(inverse, weights=repaired).astype(np.int64)
+    
+    def _decode(self, by, key):
+        if isinstance(key, np.ndarray):
+            return tuple(self.vocab[column][int(code)] for column, code in zip(by, key))
+        values = []
+        for column in reversed(by):
+            key, code = divmod(int(key), max(len(self.vocab[column]), 1))
+            values.append(self.vocab[column][code])
+        return tuple(reversed(values))
+    
+    def query(self, by, where=None, top=None, sort='count'):
+        """分组统计
+
+        返回 [(分组取值元组, 数量, 已修复数量, 修复率), ...]，按数量（或修复率）降序。
+        """
+        keys, counts, repaired = self._group(list(by), self.mask(where))
+        rates = repaired / np.maximum(counts, 1)
+        order = np.argsort(-(rates if sort == 'rate' else counts), kind='stable')
+        if top:
+            order = order[:top]
+        return [(self._decode(by, keys[i]), int(counts[i]), int(repaired[i]), float(rates[i]))
+                for i in order]
+
+class SearchSegment:
+    """检索索引的一个只读段
+
+    <段>.idx 开头为魔数、头部长度和头部JSON（文件列表 [[路径, 内容哈希, 首个章节序号, 章节数], ...]
+    及各数组的类型和位置），其后依次为排序后的词元表、各词元在倒排表中的起止位置、
+    倒排表（章节序号）、各章节所属文件和章节原文在 <段>.txt 中的字节偏移。
+    两个文件都以 mmap 只读映射，数组直接引用映射的内存，查询只读取用到的页。
+    """
+    
+    MAGIC = b'SSIDX001'
+    HEADER = 16
+    
+    def __init__(self, base):
+        with open(f'{base}.idx', 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:8] != self.MAGIC:
+            raise ValueError(f'不是检索索引文件: {base}.idx')
+        header_length = int.from_bytes(self.buffer[8:self.HEADER], 'little')
+        header = json.loads(self.buffer[self.HEADER:self.HEADER + header_length])
+        self.docs = header['docs']
+        start = self.data_start(header_length)
+        self.arrays = {name: np.frombuffer(self.buffer, dtype=dtype, count=count, offset=start + offset)
+                       if count else np.zeros(0, dtype=dtype)
+                       for name, (dtype, offset, count) in header['arrays'].items()}
+        self.tokens = self.arrays['tokens']
+        self.token_offsets = self.arrays['token_offsets']
+        self.postings = self.arrays['postings']
+        self.section_docs = self.arrays['section_docs']
+        self.text_offsets = self.arrays['text_offsets']
+        with open(f'{base}.txt', 'rb') as f:
+            self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.text_offsets[-1] else b''
+    
+    @classmethod
+    def data_start(cls, header_length):
+        """数组数据的起始位置（按8字节对齐）"""
+        return (cls.HEADER + header_length + 7) // 8 * 8
+    
+    @classmethod
+    def write(cls, base, documents, tokenize):
+        """写入一个段，documents 为 [(路径, 内容哈希, [章节原文, ...]), ...]"""
+        index = {}
+        docs, section_docs, text_offsets, chunks = [], [], [0], []
+        section = 0
+        for doc, (path, sha1, records) in enumerate(documents):
+            docs.append([path, sha1, section, len(records)])
+            for record in records:
+                for token in tokenize(record):
+                    index.setdefault(token, []).append(section)
+                data = record.encode('utf-8')
+                chunks.append(data)
+                text_offsets.append(text_offsets[-1] + len(data))
+                section_docs.append(doc)
+                section += 1
+        tokens = sorted(index)
+        token_offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        token_offsets[1:] = np.cumsum([len(index[token]) for token in tokens])
+        arrays = {
+            'tokens': np.array(tokens, dtype=str),
+            'token_offsets': token_offsets,
+            'postings': np.fromiter((section for token in tokens for section in index[token]),
+                                    dtype=np.int32, count=int(token_offsets[-1])),
+            'section_docs': np.asarray(section_docs, dtype=np.int32),
+            'text_offsets': np.asarray(text_offsets, dtype=np.int64),
+        }
+        layout, offset = {}, 0
+        for name, array in arrays.items():
+            layout[name] = (array.dtype.str, offset, len(array))
+            offset += (array.nbytes + 7) // 8 * 8
+        header = json.dumps({'docs': docs, 'arrays': layout}, ensure_ascii=False).encode('utf-8')
+        with open(f'{base}.txt', 'wb') as f:
+            f.writelines(chunks)
+        with open(f'{base}.idx', 'wb') as f:
+            f.write(cls.MAGIC + len(header).to_bytes(cls.HEADER - 8, 'little') + header)
+            f.write(bytes(cls.data_start(len(header)) - cls.HEADER - len(header)))
+            for array in arrays.values():
+                f.write(array.tobytes())
+                f.write(bytes((8 - array.nbytes % 8) % 8))
+    
+    def lookup(self, token, prefix=False):
+        """词元（或以之开头的全部词元）的倒排表"""
+        start = np.searchsorted(self.tokens, token)
+        end = np.searchsorted(self.tokens, token + '\uffff') if prefix else start + 1
+        if end <= start or (not prefix and (start >= len(self.tokens) or self.tokens[start] != token)):
+            return np.zeros(0, dtype=np.int32)
+        if end == start + 1:
+            return self.postings[self.token_offsets[start]:self.token_offsets[start + 1]]
+        return np.unique(self.postings[self.token_offsets[start]:self.token_offsets[end]])
+    
+    def record(self, section):
+        return self.text[self.text_offsets[section]:self.text_offsets[section + 1]].decode('utf-8')
+    
+    def close(self):
+        # 数组引用着映射的内存，先释放再关闭
+        self.arrays = self.tokens = self.token_offsets = self.postings = None
+        self.section_docs = self.text_offsets = None
+        for buffer in (self.buffer, self.text):
+            if isinstance(buffer, mmap.mmap):
+                try:
+                    buffer.close()
+                except BufferError:
+                    pass  # 仍有查询在使用，随对象回收
+
+class ReportSearchIndex:
+    """历史报告全文检索
+
+    流式读取各 .docx 中的 word/document.xml（不经 python-docx），按标题拆分为章节
+    （标题路径 + 正文），建立 词元 → 章节 的倒排索引，保存在 search_index 目录。
+    中文按字二元组（连续汉字的最后一个字另记一元组）、英文数字按单词切分。
+    索引按段追加：更新时只解析修改时间或大小变化、且内容哈希也变化的文件，写入新的段，
+    旧段中这些文件的章节随之失效；段过多时合并为一个。查询对各词元的倒排表求交，
+    再在候选章节原文中确认关键词。
+    """
+    
+    TOKEN = re.compile(r'[a-z0-9_]+|[\u3400-\u9fff]+')
+    MAX_TOKEN = 16      # 英文单词超过此长度时截断（查询时仍在原文中完整匹配）
+    MAX_SEGMENTS = 8
+    CLIENT = re.compile(r'^(.+?)渗透测试报告')
+    
+    def __init__(self, index_dir="search_index"):
+        self.index_dir = Path(index_dir)
+        self.files = {}         # 路径 -> {'mtime', 'size', 'sha1', 'segment', 'sections'}
+        self.segment_ids = []
+        self.next_segment = 1
+        self.segments = {}      # 已加载的段
+        self.lock = threading.Lock()            # 保护文件表、段列表和已加载的段，查询期间持有
+        self.update_lock = threading.Lock()     # 同一时间只有一个更新
+        self.load()
+    
+    def load(self):
+        try:
+            with open(self.index_dir / 'meta.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.files = meta['files']
+            self.segment_ids = meta['segments']
+            self.next_segment = meta['next_segment']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"加载检索索引失败: {e}")
+    
+    def save(self):
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        path = self.index_dir / 'meta.json'
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files, 'segments': self.segment_ids,
+                       'next_segment': self.next_segment}, f, ensure_ascii=False)
+        os.replace(f'{path}.tmp', path)
+    
+    @property
+    def section_count(self):
+        return sum(entry['sections'] for entry in self.files.values())
+    
+    @classmethod
+    def tokenize(cls, text):
+        """章节原文的词元集合"""
+        tokens = set()
+        for match in cls.TOKEN.finditer(text.lower()):
+            word = match.group()
+            if word[0] < '\u3400':
+                tokens.add(word[:cls.MAX_TOKEN])
+            else:
+                tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+                tokens.add(word[-1])
+        return tokens
+    
+    @classmethod
+    def term_tokens(cls, term):
+        """查询关键词对应的 [(词元, 是否前缀匹配), ...]"""
+        result = []
+        for match in cls.TOKEN.finditer(term):
+            word = match.group()
+            if word[0] < '\u3400':
+                result.append((word[:cls.MAX_TOKEN], True))
+            elif len(word) == 1:
+                # 单个汉字：以之开头的二元组或作为一元组出现
+                result.append((word, True))
+            else:
+                result.extend((word[i:i + 2], False) for i in range(len(word) - 1))
+        return result
+    
+    @classmethod
+    def client_name(cls, path):
+        """委托单位：取报告文件名中"渗透测试报告"之前的部分"""
+        stem = Path(path).stem
+        match = cls.CLIENT.match(stem)
+        return match.group(1) if match else stem
+    
+    def segment_base(self, segment_id):
+        return str(self.index_dir / f'seg-{segment_id:06d}')
+    
+    def segment(self, segment_id):
+        segment = self.segments.get(segment_id)
+        if segment is None:
+            segment = self.segments[segment_id] = SearchSegment(self.segment_base(segment_id))
+        return segment
+    
+    def update(self, paths, max_workers=None):
+        """更新索引（目录下所有 .docx），返回 (重新索引的文件数, 删除的文件数)
+
+        修改时间和大小都未变的文件不读取；变化的文件在子进程中并行解析（单核或只有一个时在本进程解析）。
+        解析和写入新段期间不影响查询，完成后在锁内切换到新的文件表和段列表。
+        """
+        with self.update_lock:
+            files = []
+            for path in map(Path, paths):
+                files.extend(sorted(path.glob('*.docx')) if path.is_dir() else [path])
+            current = {}
+            for path in files:
+                if path.name.startswith('~$'):
+                    continue  # Word 打开文档时的锁文件
+                try:
+                    current[str(path.resolve())] = path.stat()
+                except OSError as e:
+                    print(f"读取报告文件失败: {path}: {e}")
+            pending = [source for source, stat in current.items()
+                       if (self.files.get(source, {}).get('mtime'), self.files.get(source, {}).get('size'))
+                       != (stat.st_mtime_ns, stat.st_size)]
+            removed = [source for source in self.files if source not in current and not os.path.exists(source)]
+            if not pending and not removed:
+                return 0, 0
+            
+            workers = min(max_workers or os.cpu_count() or 1, len(pending))
+            if workers <= 1:
+                results = []
+                for source in pending:
+                    try:
+                        results.append(extract_report_sections(source))
+                    except Exception as e:
+                        results.append(e)
+            else:
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                    futures = [executor.submit(extract_report_sections, source) for source in pending]
+                    results = []
+                    for future in futures:
+                        try:
+                            results.append(future.result())
+                        except Exception as e:
+                            results.append(e)
+            
+            files = {source: dict(entry) for source, entry in self.files.items()}
+            segment_ids = list(self.segment_ids)
+            segment_id = self.next_segment
+            documents = []
+            for source, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    print(f"解析报告文件失败: {source}: {result}")
+                    continue
+                sha1, records = result
+                stat = current[source]
+                entry = files.get(source)
+                if entry is not None and entry['sha1'] == sha1:
+                    # 内容未变（如只是被复制或重新保存），只更新修改时间
+                    entry['mtime'], entry['size'] = stat.st_mtime_ns, stat.st_size
+                    continue
+                files[source] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': sha1,
+                                 'segment': segment_id, 'sections': len(records)}
+                documents.append((source, sha1, records))
+            for source in removed:
+                files.pop(source)
+            
+            if documents:
+                self.index_dir.mkdir(parents=True, exist_ok=True)
+                SearchSegment.write(self.segment_base(segment_id), documents, self.tokenize)
+                segment_ids.append(segment_id)
+                self.next_segment += 1
+            # 删除已没有有效文件的段，段过多时合并
+            live = {entry['segment'] for entry in files.values()}
+            segment_ids = [segment_id for segment_id in segment_ids if segment_id in live]
+            previous = self.segment_ids + [segment_id for segment_id in segment_ids
+                                           if segment_id not in self.segment_ids]
+            if len(segment_ids) > self.MAX_SEGMENTS:
+                segment_ids = self.compact(files, segment_ids)
+            
+            with self.lock:
+                dead = [segment_id for segment_id in previous if segment_id not in segment_ids]
+                self.files, self.segment_ids = files, segment_ids
+                for segment_id in dead:
+                    self.remove_segment(segment_id)
+                self.save()
+            return len(documents), len(removed)
+    
+    def remove_segment(self, segment_id):
+        segment = self.segments.pop(segment_id, None)
+        if segment is not None:
+            segment.close()
+        for suffix in ('.idx', '.txt'):
+            try:
+                os.remove(self.segment_base(segment_id) + suffix)
+            except OSError:
+                pass
+    
+    def compact(self, files, segment_ids):
+        """将各段合并为一个新段（只保留有效文件的章节，原文重新切分词元，不再解析文档），返回新的段列表"""
+        with self.lock:
+            segments = [(segment_id, self.segment(segment_id)) for segment_id in segment_ids]
+        documents = []
+        for segment_id, segment in segments:
+            for path, sha1, first, count in segment.docs:
+                if files.get(path, {}).get('segment') == segment_id:
+                    documents.append((path, sha1, [segment.record(section)
+                                                   for section in range(first, first + count)]))
+        segment_id = self.next_segment
+        self.next_segment += 1
+        SearchSegment.write(self.segment_base(segment_id), documents, self.tokenize)
+        for path, _, _ in documents:
+            files[path]['segment'] = segment_id
+        return [segment_id]
+    
+    def search(self, query, limit=100):
+        """查询，关键词以空格分隔且须全部出现在同一章节（标题路径或正文）中
+
+        返回 (结果列表, 是否还有更多结果)，结果为 {'path', 'client', 'headings', 'snippet'}，
+        按报告修改时间从新到旧排列。候选章节按同样的顺序逐个确认，凑满 limit 个即停止。
+        """
+        terms = [''.join(term.lower().split()) for term in query.split()]
+        terms = [term for term in terms if term]
+        tokens = {token for term in terms for token in self.term_tokens(term)}
+        if not tokens:
+            return [], False
+        exact = {token for token in tokens if not token[1]}
+        if exact:
+            # 前缀词元（英文数字、单个汉字）的倒排表要合并多个词元，代价高且区分度低，
+            # 已有精确词元时只在原文确认阶段检查
+            tokens = exact
+        
+        with self.lock:
+            return self.query(terms, tokens, limit)
+    
+    def query(self, terms, tokens, limit):
+        """在锁内执行查询（见 search）"""
+        files = self.files
+        segments = [self.segment(segment_id) for segment_id in self.segment_ids]
+        segment_ids = self.segment_ids
+        keys, positions, sections = [], [], []
+        for position, (segment_id, segment) in enumerate(zip(segment_ids, segments)):
+            candidates = None
+            # 先用最短的倒排表，交集尽快缩小
+            for postings in sorted((segment.lookup(token, prefix) for token, prefix in tokens), key=len):
+                candidates = postings if candidates is None else np.intersect1d(candidates, postings,
+                                                                                 assume_unique=True)
+                if not len(candidates):
+                    break
+            if not len(candidates):
+                continue
+            # 已删除或已重新索引的文件修改时间记为 -1，不参与排序
+            mtimes = np.array([files[path]['mtime'] if files.get(path, {}).get('segment') == segment_id else -1
+                               for path, _, _, _ in segment.docs], dtype=np.int64)
+            candidate_mtimes = mtimes[segment.section_docs[candidates]]
+            live = candidate_mtimes >= 0
+            keys.append(candidate_mtimes[live])
+            sections.append(candidates[live])
+            positions.append(np.full(int(live.sum()), position, dtype=np.int32))
+        if not keys:
+            return [], False
+        keys, positions, sections = np.concatenate(keys), np.concatenate(positions), np.concatenate(sections)
+        
+        results = []
+        for index in np.lexsort((sections, positions, -keys)).tolist():
+            segment = segments[positions[index]]
+            section = int(sections[index])
+            record = segment.record(section)
+            if not all(term in ''.join(record.lower().split()) for term in terms):
+                continue
+            if len(results) == limit:
+                return results, True
+            path = segment.docs[segment.section_docs[section]][0]
+            heading, _, body = record.partition('\n')
+            lowered = body.lower()
+            offset = min((lowered.find(term) for term in terms if term in lowered), default=0)
+            snippet = body[max(0, offset - 30):offset + 60].replace('\n', ' ')
+            results.append({'path': path, 'client': self.client_name(path),
+                            'headings': heading.split(' > ') if heading else [], 'snippet': snippet})
+        return results, False
+
+def extract_report_sections(path):
+    """流式解析一个 .docx（可在子进程中执行），返回 (内容哈希, [章节原文, ...])
+
+    章节原文第一行为标题路径（各级标题以 " > " 连接），其后为正文段落。
+    标题级别取自 styles.xml 中样式的名称（heading N）或大纲级别，目录样式的段落跳过。
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    sha1 = hashlib.sha1(data).hexdigest()
+    w = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        levels, skipped = {}, set()
+        try:
+            styles = etree.fromstring(archive.read('word/styles.xml'))
+        except KeyError:
+            styles = None
+        if styles is not None:
+            for style in styles.iter(f'{w}style'):
+                style_id = style.get(f'{w}styleId')
+                name = style.find(f'{w}name')
+                name = (name.get(f'{w}val') if name is not None else '').lower()
+                outline = style.find(f'{w}pPr/{w}outlineLvl')
+                if name.startswith('toc'):
+                    skipped.add(style_id)
+                elif re.fullmatch(r'heading [1-9]', name):
+                    levels[style_id] = int(name[-1])
+                elif outline is not None and outline.get(f'{w}val', '').isdigit() and int(outline.get(f'{w}val')) < 9:
+                    levels[style_id] = int(outline.get(f'{w}val')) + 1
+        
+        records = []
+        headings, body = [], []
+        def flush():
+            if headings or body:
+                records.append(' > '.join(headings) + '\n' + '\n'.join(body))
+        
+        with archive.open('word/document.xml') as f:
+            for _, p in etree.iterparse(f, events=('end',), tag=f'{w}p'):
+                text = ''.join(t.text or '' for t in p.iter(f'{w}t')).strip()
+                style = p.find(f'{w}pPr/{w}pStyle')
+                style_id = style.get(f'{w}val') if style is not None else None
+                # 释放已处理的段落，内存占用与文档大小无关
+                p.clear()
+                while p.getprevious() is not None:
+                    del p.getparent()[0]
+                if not text or style_id in skipped:
+                    continue
+                level = levels.get(style_id)
+                if level is None:
+                    body.append(text)
+                    continue
+                flush()
+                headings = headings[:level - 1] + [text]
+                body = []
+        flush()
+    return sha1, records
+
+def analytics_cli(argv):
+    """命令行：跨项目统计分析"""
+    parser = argparse.ArgumentParser(prog='main.py analytics', description='跨项目漏洞统计分析')
+    parser.add_argument('--store', default='analytics', help='统计数据目录')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    ingest_parser = subparsers.add_parser('ingest', help='导入项目文件或目录')
+    ingest_parser.add_argument('paths', nargs='+')
+    
+    query_parser = subparsers.add_parser('query', help='分组统计')
+    query_parser.add_argument('--by', nargs='+', default=['vuln'], choices=FindingAnalytics.COLUMNS)
+    query_parser.add_argument('--where', nargs='*', default=[], metavar='列=取值')
+    query_parser.add_argument('--top', type=int, default=20)
+    query_parser.add_argument('--sort', choices=['count', 'rate'], default='count')
+    args = parser.parse_args(argv)
+    
+    analytics = FindingAnalytics(args.store, VulnerabilityManager())
+    if args.command == 'ingest':
+        added = analytics.ingest(args.paths)
+        print(f"已导入 {added} 个漏洞，共 {len(analytics)} 条记录")
+        return 0
+    
+    where = {}
+    for condition in args.where:
+        column, sep, value = condition.partition('=')
+        if not sep or column not in FindingAnalytics.COLUMNS:
+            parser.error(f"无效的筛选条件 {condition}，应为 列=取值，列可选: {', '.join(FindingAnalytics.COLUMNS)}")
+        where[column] = value
+    start = time.perf_counter()
+    results = analytics.query(args.by, where, args.top, args.sort)
+    elapsed = time.perf_counter() - start
+    print('\t'.join([FindingAnalytics.COLUMN_LABELS[column] for column in args.by] + ['数量', '已修复', '修复率']))
+    for values, count, repaired, rate in results:
+        print('\t'.join(list(values) + [str(count), str(repaired), f'{rate:.1%}']))
+    print(f"共 {len(analytics)} 条记录，查询耗时 {elapsed * 1000:.1f} ms")
+    return 0
+
+def search_cli(argv):
+    """命令行：检索历史报告"""
+    parser = argparse.ArgumentParser(prog='main.py search', description='检索历史报告中的漏洞章节')
+    parser.add_argument('query', nargs='*', help='关键词，以空格分隔，须全部出现在同一章节中')
+    parser.add_argument('--docs', nargs='*', default=['docs'], help='报告目录或文件，默认为 docs')
+    parser.add_argument('--index', default='search_index', help='索引目录')
+    parser.add_argument('--limit', type=int, default=20, help='最多输出的结果数')
+    parser.add_argument('--no-update', action='store_true', help='查询前不检查报告是否有变化')
+    args = parser.parse_args(argv)
+    
+    index = ReportSearchIndex(args.index)
+    if not args.no_update:
+        start = time.perf_counter()
+        changed, removed = index.update(args.docs)
+        print(f"索引 {len(index.files)} 个报告、{index.section_count} 个章节"
+              f"（重新索引 {changed} 个，删除 {removed} 个，耗时 {time.perf_counter() - start:.2f} s）")
+    if not args.query:
+        return 0
+    
+    start = time.perf_counter()
+    results, more = index.search(' '.join(args.query), args.limit)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        print(f"{result['client']}\t{' > '.join(result['headings'])}\t{result['path']}")
+        if result['snippet']:
+            print(f"    {result['snippet']}")
+    more = f"，仅显示前 {args.limit} 个，可用 --limit 增加" if more else ""
+    print(f"{len(results)} 个章节命中{more}（查询耗时 {elapsed * 1000:.1f} ms）")
+    return 0
+
+def retest_cli(argv):
+    """命令行：对比初测与复测项目"""
+    parser = argparse.ArgumentParser(prog='main.py retest', description='对比初测与复测项目的漏洞')
+    parser.add_argument('baseline', help='初测项目文件')
+    parser.add_argument('retest', help='复测项目文件')
+    parser.add_argument('--details', action='store_true', help='输出对比明细')
+    args = parser.parse_args(argv)
+    
+    baseline = load_engagement(args.baseline)[1]
+    retest = load_engagement(args.retest)[1]
+    start = time.perf_counter()
+    diff = RetestDiff(baseline, retest, VulnerabilityManager().canonical_name)
+    elapsed = time.perf_counter() - start
+    if args.details:
+        print('\t'.join(['对比结果', '单位', '系统', '漏洞名称', '初测状态', '复测状态']))
+        for row in diff.rows():
+            print('\t'.join(row))
+    print(f"{diff.summary()}（对比耗时 {elapsed * 1000:.1f} ms）")
+    return 0
+
+def dedup_cli(argv):
+    """命令行：合并项目文件中的重复漏洞"""
+    parser = argparse.ArgumentParser(prog='main.py dedup', description='检测并合并项目文件中的重复漏洞')
+    parser.add_argument('project', help='项目文件')
+    parser.add_argument('-o', '--output', help='合并后的项目文件，默认只输出检测结果')
+    parser.add_argument('--risk', choices=list(FindingDeduplicator.RISK_POLICIES), default='worst',
+                        help='风险等级合并策略')
+    parser.add_argument('--status', choices=list(FindingDeduplicator.STATUS_POLICIES), default='latest',
+                        help='修复状态合并策略')
+    args = parser.parse_args(argv)
+    
+    template, vuln_data = load_engagement(args.project)
+    vuln_manager = VulnerabilityManager()
+    deduplicator = FindingDeduplicator(vuln_manager.canonical_name, vuln_manager.risk_level,
+                                       args.risk, args.status)
+    start = time.perf_counter()
+    merged = deduplicator.merge(FindingStore(vuln_data))
+    elapsed = time.perf_counter() - start
+    print('\t'.join(['单位', '系统', '漏洞名称', '合并数量']))
+    for item in merged:
+        print('\t'.join(map(str, item)))
+    print(f"{FindingDeduplicator.summary(merged)}（耗时 {elapsed * 1000:.1f} ms）")
+    if args.output:
+        save_engagement(args.output, template, vuln_data)
+    return 0
+
+_daemon_generator = None
+
+def init_daemon_worker(vuln_file, template_dir, image_path=None):
+    """守护进程工作进程初始化：漏洞库和模板只加载一次，之后的任务复用
+
+    指定 image_path 时映射父进程写好的漏洞库映像，不再各自解析和保存一份漏洞库。
+    """
+    global _daemon_generator
+    if image_path:
+        vuln_manager = VulnerabilityManager.mapped(image_path)
+    else:
+        vuln_manager = VulnerabilityManager(vuln_file)
+    _daemon_generator = ReportGenerator(vuln_manager, TemplateManager(template_dir))
+
+def drain_daemon_metrics():
+    """取回工作进程初始化时记录的指标"""
+    return METRICS.drain()
+
+def daemon_render_worker(source, digest, outbox, default_template, presets):
+    """渲染一个项目文件
+
+    报告输出到 outbox/<项目文件名>/ 目录，不同项目文件的报告不会重名。先写入该任务
+    独有的 .partial/<哈希> 临时目录，全部完成后再原子替换到输出目录，读取方不会看到
+    写了一半的报告。返回 (输出路径列表, 工作进程指标)。
+    """
+    template, vuln_data = load_engagement(source)
+    if not template:
+        if not default_template:
+            raise ValueError('项目文件缺少基本信息，请使用 --template 指定模板')
+        template = _daemon_generator.load_template(default_template)
+    
+    stem = Path(source).stem
+    job = hashlib.sha1(f'{Path(source).name}\0{digest}'.encode('utf-8')).hexdigest()
+    partial_dir = os.path.join(outbox, '.partial', job)
+    os.makedirs(partial_dir, exist_ok=True)
+    variants = [ReportVariant(os.path.join(partial_dir, f'{stem}.docx'))]
+    variants += [ReportVariant.preset(preset, os.path.join(partial_dir, f'{stem}_{preset}.docx'))
+                 for preset in presets]
+    results = _daemon_generator.render_variants(template, vuln_data, variants, max_workers=1)
+    
+    output_dir = os.path.join(outbox, stem)
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    for result in results:
+        for path in (result if isinstance(result, list) else [result]):
+            target = os.path.join(output_dir, os.path.basename(path))
+            os.replace(path, target)
+            outputs.append(target)
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    return outputs, METRICS.drain()
+
+class ReportDaemon:
+    """收件箱守护进程：监视目录中的项目文件，自动生成报告到输出目录
+
+    - 文件大小和修改时间在 settle 秒内不再变化才视为写入完成
+    - 按内容哈希去重：内容未变的文件（包括重启后）不重复生成
+    - 工作进程常驻，漏洞库只在启动时加载一次，并以只读映像在工作进程间共享
+    - prefork 模式下由父进程加载后 fork 出工作进程（仅限支持 fork 的平台）
+    - 空闲时轮询间隔逐步加长到 max_poll 秒，CPU占用接近零
+    """
+    
+    STATE_FILE = '.daemon_state.json'
+    IGNORED_SUFFIXES = ('.tmp', '.part', '.swp', '~')
+    
+    def __init__(self, inbox, outbox, template=None, presets=(), workers=None, settle=2.0,
+                 poll=1.0, max_poll=5.0, vuln_file="config/VulnWiki.yml", template_dir="config/templates",
+                 metrics_file=None, metrics_port=None, prefork=False):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.template = template
+        self.presets = tuple(presets)
+        self.workers = workers or os.cpu_count() or 1
+        self.settle = settle
+        self.poll = poll
+        self.max_poll = max_poll
+        self.vuln_file = vuln_file
+        self.template_dir = template_dir
+        self.metrics_file = metrics_file
+        self.metrics_port = metrics_port
+        self.prefork = prefork
+        
+        self.seen = {}          # 文件名 -> 最近一次观察到的 (大小, 修改时间)
+        self.stable_since = {}  # 文件名 -> 该 (大小, 修改时间) 首次出现的时刻
+        self.checked = {}       # 文件名 -> 已处理（提交或跳过）的 (大小, 修改时间)
+        self.running = {}       # 文件名 -> (future, 内容哈希, 提交时刻)
+        self.stop_event = threading.Event()
+        self.pool = None
+        
+        os.makedirs(self.outbox, exist_ok=True)
+        self.done = self.load_state()  # 文件名 -> 已生成报告的内容哈希
+    
+    def log(self, message):
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        print(f"[{timestamp}] {message}", flush=True)
+    
+    def load_state(self):
+        try:
+            with open(os.path.join(self.outbox, self.STATE_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"加载守护进程状态失败: {e}")
+            return {}
+    
+    def save_state(self):
+        path = os.path.join(self.outbox, self.STATE_FILE)
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.done, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            print(f"保存守护进程状态失败: {e}")
+    
+    def scan(self):
+        """收件箱中的项目文件：文件名 -> (大小, 修改时间)"""
+        files = {}
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                name = entry.name
+                if (not name.endswith('.json') or name.startswith('.')
+                        or name.endswith(self.IGNORED_SUFFIXES) or not entry.is_file()):
+                    continue
+                stat = entry.stat()
+                files[name] = (stat.st_size, stat.st_mtime_ns)
+        return files
+    
+    @staticmethod
+    def file_digest(path):
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    
+    def collect(self):
+        """收集已完成的任务，返回是否有工作进程异常退出（进程池已不可用）"""
+        broken = False
+        finished = [name for name, (future, *_) in self.running.items() if future.done()]
+        for name in finished:
+            future, digest, submitted = self.running.pop(name)
+            try:
+                outputs, snapshot = future.result()
+                METRICS.merge(snapshot)
+                METRICS.inc('ssreport_daemon_jobs_total', status='success')
+                self.done[name] = digest
+                self.log(f"报告生成成功: {name} -> {', '.join(map(os.path.basename, outputs))}")
+            except BrokenProcessPool:
+                # 工作进程被杀（如内存不足），重启进程池后重新生成
+                broken = True
+                METRICS.inc('ssreport_daemon_jobs_total', status='failure')
+                self.checked.pop(name, None)
+                self.log(f"生成报告失败: {name}: 工作进程异常退出，稍后重试")
+            except Exception as e:
+                # 文件再次修改后会重新生成
+                METRICS.inc('ssreport_daemon_jobs_total', status='failure')
+                self.log(f"生成报告失败: {name}: {e}")
+            METRICS.observe('ssreport_daemon_job_seconds', time.monotonic() - submitted)
+        if finished:
+            self.save_state()
+            METRICS.set('ssreport_daemon_running_jobs', len(self.running))
+            if self.metrics_file:
+                METRICS.write_textfile(self.metrics_file)
+        return broken
+    
+    def restart_pool(self):
+        """工作进程异常退出后重建进程池（原进程池中未完成的任务均已失败）"""
+        self.log("工作进程异常退出，重新启动工作进程")
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.collect()
+        self.start_pool()
+    
+    def poll_once(self, now):
+        """扫描一次收件箱并提交已写入完成的文件，返回是否仍有待处理的文件"""
+        if self.collect():
+            self.restart_pool()
+        files = self.scan()
+        for name in list(self.seen):
+            if name not in files:
+                self.seen.pop(name)
+                self.stable_since.pop(name, None)
+                self.checked.pop(name, None)
+        
+        pending = False
+        for name, signature in files.items():
+            if self.checked.get(name) == signature:
+                continue
+            if self.seen.get(name) != signature:
+                # 新文件或仍在写入，重新计时
+                self.seen[name] = signature
+                self.stable_since[name] = now
+                pending = True
+                continue
+            if now - self.stable_since[name] < self.settle or name in self.running:
+                pending = True
+                continue
+            
+            self.checked[name] = signature
+            path = os.path.join(self.inbox, name)
+            try:
+                digest = self.file_digest(path)
+            except OSError as e:
+                self.log(f"读取项目文件失败: {name}: {e}")
+                continue
+            if self.done.get(name) == digest:
+                continue
+            try:
+                future = self.pool.submit(daemon_render_worker, path, digest, self.outbox, self.template,
+                                          self.presets)
+            except BrokenProcessPool:
+                # 空闲的工作进程被杀时提交才会发现，重建后重新提交
+                self.restart_pool()
+                future = self.pool.submit(daemon_render_worker, path, digest, self.outbox, self.template,
+                                          self.presets)
+            self.running[name] = (future, digest, time.monotonic())
+            METRICS.set('ssreport_daemon_running_jobs', len(self.running))
+            self.log(f"开始生成报告: {name}")
+        return pending or bool(self.running)
+    
+    def stop(self, *args):
+        self.stop_event.set()
+    
+    def start_pool(self):
+        """启动工作进程
+
+        默认由父进程加载一次漏洞库并写入只读映像，spawn 出的工作进程映射同一文件；
+        prefork 模式下父进程加载后冻结GC再 fork，工作进程直接共享父进程的内存页，
+        冻结后的对象不再被垃圾回收遍历，不会因此触发写时复制。
+        """
+        if self.prefork:
+            init_daemon_worker(self.vuln_file, self.template_dir)
+            # 父进程加载时记录的指标先取出，避免每个工作进程继承后重复上报
+            snapshot = METRICS.drain()
+            gc.freeze()
+            self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('fork'))
+        else:
+            vuln_manager = VulnerabilityManager(self.vuln_file)
+            try:
+                image_path = vuln_manager.write_image()
+            except Exception as e:
+                print(f"写入漏洞库映像失败: {e}")
+                image_path = None
+            snapshot = METRICS.drain()
+            del vuln_manager
+            self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_daemon_worker,
+                                            initargs=(self.vuln_file, self.template_dir, image_path))
+        METRICS.merge(snapshot)
+        # 预热：提前启动全部工作进程并加载漏洞库（加载耗时等指标一并取回）
+        for future in [self.pool.submit(drain_daemon_metrics) for _ in range(self.workers)]:
+            METRICS.merge(future.result())
+    
+    def run(self):
+        """运行直到收到停止信号"""
+        self.start_pool()
+        if self.metrics_port is not None:
+            # 指标接口线程在工作进程启动之后再开（prefork 时 fork 前不能有持锁的线程）
+            METRICS.serve(self.metrics_port)
+        self.log(f"监视 {self.inbox}，输出到 {self.outbox}（{self.workers} 个工作进程）")
+        
+        interval = self.poll
+        try:
+            while not self.stop_event.is_set():
+                busy = self.poll_once(time.monotonic())
+                interval = self.poll if busy else min(interval * 2, self.max_poll)
+                self.stop_event.wait(interval)
+        finally:
+            self.pool.shutdown(wait=True)
+            self.collect()
+            self.log("守护进程已停止")
+
+def daemon_cli(argv):
+    """命令行：监视收件箱目录自动生成报告"""
+    parser = argparse.ArgumentParser(prog='main.py daemon', description='监视收件箱目录，自动为新的项目文件生成报告')
+    parser.add_argument('inbox', help='项目文件收件箱目录')
+    parser.add_argument('outbox', help='报告输出目录')
+    parser.add_argument('--template', help='项目文件不含基本信息时使用的模板名称')
+    parser.add_argument('--variants', nargs='*', default=[], choices=['internal', 'en'], help='同时生成的附加版本')
+    parser.add_argument('--workers', type=int, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--settle', type=float, default=2.0, help='文件多少秒不再变化视为写入完成')
+    parser.add_argument('--metrics-port', type=int, help='在该端口提供 Prometheus 指标接口 /metrics')
+    parser.add_argument('--metrics-file', help='每完成一批任务将 Prometheus 指标写入该文件')
+    parser.add_argument('--prefork', action='store_true', help='父进程加载漏洞库后 fork 工作进程（仅限 Linux/macOS）')
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.inbox):
+        print(f"收件箱目录不存在: {args.inbox}")
+        return 1
+    if args.prefork and 'fork' not in multiprocessing.get_all_start_methods():
+        print("当前平台不支持 fork，不能使用 --prefork")
+        return 1
+    if args.metrics_port is not None or args.metrics_file:
+        # 工作进程继承环境变量，启动时同样启用指标
+        os.environ['SSREPORT_METRICS'] = '1'
+        METRICS.enabled = True
+    daemon = ReportDaemon(args.inbox, args.outbox, args.template, args.variants, args.workers, args.settle,
+                          metrics_file=args.metrics_file, metrics_port=args.metrics_port, prefork=args.prefork)
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    daemon.run()
+    return 0
+
+class EventLoopWatchdog:
+    """界面事件循环卡顿检测（设置 SSREPORT_WATCHDOG 时启用）
+
+    主线程中的心跳定时器每 TICK 秒触发一次，记录触发时间和相对预定时间的延迟；
+    后台线程定期检查心跳，超过阈值未更新即视为卡顿，期间反复采样主线程的 Python 调用栈。
+    卡顿结束后按槽函数（事件循环直接调用的最外层函数；在模态对话框等嵌套事件循环中
+    则取嵌套循环调用的函数）汇总，按累计卡顿时长排序写入报告文件。
+    """
+    
+    TICK = 0.05
+    # 这些调用内部运行嵌套事件循环，其中调用的函数才是实际执行的槽函数
+    NESTED_LOOP = re.compile(r'\.exec_?\(|processEvents\(|QMessageBox\.\w+\(|QFileDialog\.get|QInputDialog\.get')
+    MAX_LATENCIES = 100000
+    
+    def __init__(self, threshold=0.2, report_path='stall_report.txt'):
+        self.threshold = threshold
+        self.report_path = report_path
+        self.sample_interval = min(threshold / 4, self.TICK)
+        self.latencies = deque(maxlen=self.MAX_LATENCIES)
+        self.stalls = {}        # 槽函数 -> {'count', 'total', 'max', 'stacks': Counter}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.started_at = None
+        self.timer = None
+    
+    @classmethod
+    def from_environment(cls):
+        """SSREPORT_WATCHDOG 为阈值毫秒数（或 1，使用默认200毫秒），未设置时返回None"""
+        value = os.environ.get('SSREPORT_WATCHDOG')
+        if not value:
+            return None
+        try:
+            milliseconds = float(value)
+        except ValueError:
+            milliseconds = 1
+        return cls(milliseconds / 1000 if milliseconds > 1 else 0.2,
+                   os.environ.get('SSREPORT_WATCHDOG_REPORT', 'stall_report.txt'))
+    
+    def start(self):
+        """在主线程中、进入事件循环之前调用"""
+        self.main_thread_id = threading.get_ident()
+        # 调用者及其外层的栈帧属于事件循环之外，采样时略去
+        frame, self.base_depth = sys._getframe(1), 0
+        while frame is not None:
+            frame, self.base_depth = frame.f_back, self.base_depth + 1
+        self.started_at = self.heartbeat = time.perf_counter()
+        self.timer = QTimer()
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.beat)
+        self.timer.start(int(self.TICK * 1000))
+        QApplication.instance().aboutToQuit.connect(self.stop)
+        threading.Thread(target=self.watch, daemon=True).start()
+        print(f"已启用界面卡顿检测（阈值 {self.threshold * 1000:.0f} ms，报告: {self.report_path}）")
     
-    def load_templates(self):
-        """加载模板"""
-        template_path = Path(self.template_dir)
-        if template_path.exists():
-            for json_file in template_path.glob("*.json"):
-                try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        template_name = json_file.stem
-                        self.templates[template_name] = data
-                except Exception as e:
-                    print(f"加载模板 {json_file} 失败: {e}")
+    def stop(self):
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.timer.stop()
+        self.write_report()
     
-    def get_template(self, name):
-        """获取模板"""
-        return self.templates.get(name, {})
+    def beat(self):
+        """心跳（主线程）"""
+        now = time.perf_counter()
+        latency = max(0.0, now - self.heartbeat - self.TICK)
+        self.heartbeat = now
+        self.latencies.append(latency)
+        METRICS.observe('ssreport_gui_event_latency_seconds', latency)
     
-    def get_all_templates(self):
-        """获取所有模板"""
-        return list(self.templates.keys())
-
-class ReportGenerator:
-    """报告生成器"""
+    def watch(self):
+        """检查心跳（后台线程）"""
+        stall = None
+        while not self.stopped.wait(self.sample_interval):
+            heartbeat = self.heartbeat
+            if stall is not None and heartbeat != stall['start']:
+                self.finish(stall, heartbeat)
+                stall = None
+            if time.perf_counter() - heartbeat > self.threshold + self.TICK:
+                if stall is None:
+                    stall = {'start': heartbeat, 'samples': []}
+                sample = self.sample()
+                if sample is not None:
+                    stall['samples'].append(sample)
     
-    def __init__(self, vuln_manager, template_manager):
-        self.vuln_manager = vuln_manager
-        self.template_manager = template_manager
+    def sample(self):
+        """主线程当前的调用栈 [(文件, 行号, 函数, 源码), ...]，从外到内"""
+        frame = sys._current_frames().get(self.main_thread_id)
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append((code.co_filename, frame.f_lineno, getattr(code, 'co_qualname', code.co_name),
+                           linecache.getline(code.co_filename, frame.f_lineno).strip()))
+            frame = frame.f_back
+        frames.reverse()
+        return tuple(frames[self.base_depth:]) or None
     
-    def generate_report(self, template_name, vuln_data, output_path):
-        """生成报告"""
-        template = self.template_manager.get_template(template_name)
-        if not template:
-            raise ValueError(f"模板 {template_name} 不存在")
-        
-        # 创建Word文档
-        doc = Document()
-        
-        # 设置文档标题
-        title = doc.add_heading(f"{template.get('clientName', '')}渗透测试报告", 0)
-        title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # 添加基本信息
-        doc.add_heading('1. 基本信息', level=1)
-        
-        info_table = doc.add_table(rows=8, cols=2)
-        info_table.style = 'Table Grid'
-        
-        info_data = [
-            ('委托单位', template.get('clientName', '')),
-            ('测试类型', template.get('isFirstTest', '')),
-            ('承测单位', template.get('contractorName', '')),
-            ('测试时间', template.get('testDate', '')),
-            ('报告日期', f"{template.get('reportYear', '')}年{template.get('reportMonth', '')}月{template.get('reportDay', '')}日"),
-            ('报告作者', template.get('reportAuthor', '')),
-            ('测试人员', template.get('tester', '')),
-            ('项目经理', template.get('manager', ''))
-        ]
-        
-        for i, (key, value) in enumerate(info_data):
-            info_table.cell(i, 0).text = key
-            info_table.cell(i, 1).text = value
-        
-        # 添加漏洞统计
-        doc.add_heading('2. 漏洞统计', level=1)
-        
-        stats_table = doc.add_table(rows=2, cols=4)
-        stats_table.style = 'Table Grid'
-        
-        stats_table.cell(0, 0).text = '风险等级'
-        stats_table.cell(0, 1).text = '高危'
-        stats_table.cell(0, 2).text = '中危'
-        stats_table.cell(0, 3).text = '低危'
-        
-        stats_table.cell(1, 0).text = '数量'
-        stats_table.cell(1, 1).text = template.get('highVuln', '0')
-        stats_table.cell(1, 2).text = template.get('midVuln', '0')
-        stats_table.cell(1, 3).text = template.get('lowVuln', '0')
-        
-        # 添加漏洞详情
-        doc.add_heading('3. 漏洞详情', level=1)
-        
-        for unit_data in vuln_data:
-            unit_name = unit_data.get('unit', '')
-            doc.add_heading(f'3.{vuln_data.index(unit_data) + 1} {unit_name}', level=2)
-            
-            for system_data in unit_data.get('systems', []):
-                system_name = system_data.get('system', '')
-                doc.add_heading(f'3.{vuln_data.index(unit_data) + 1}.{unit_data.get("systems", []).index(system_data) + 1} {system_name}', level=3)
-                
-                for vuln in system_data.get('vulns', []):
-                    vuln_name = vuln.get('name', '')
-                    if vuln_name:
-                        vuln_info = self.vuln_manager.get_vulnerability(vuln_name)
-                        
-                        doc.add_heading(f'3.{vuln_data.index(unit_data) + 1}.{unit_data.get("systems", []).index(system_data) + 1}.{system_data.get("vulns", []).index(vuln) + 1} {vuln_name}', level=4)
-                        
-                        # 添加漏洞描述
-                        if vuln_info.get('description'):
-                            doc.add_paragraph(f'漏洞描述：{vuln_info["description"]}')
-                        
-                        # 添加危害
-                        if vuln_info.get('harm'):
-                            doc.add_paragraph(f'危害：{vuln_info["harm"]}')
-                        
-                        # 添加风险等级
-                        if vuln_info.get('risklevel'):
-                            doc.add_paragraph(f'风险等级：{vuln_info["risklevel"]}')
-                        
-                        # 添加修复建议
-                        if vuln_info.get('suggustion'):
-                            doc.add_paragraph(f'修复建议：{vuln_info["suggustion"]}')
-                        
-                        # 添加修复状态
-                        if vuln.get('repaired'):
-                            doc.add_paragraph(f'修复状态：{vuln["repaired"]}')
-        
-        # 保存文档
-        doc.save(output_path)
-        return output_path
+    @classmethod
+    def slot_name(cls, stack):
+        slot = stack[0]
+        for caller, frame in zip(stack, stack[1:]):
+            if cls.NESTED_LOOP.search(caller[3]):
+                slot = frame
+        return slot[2]
+    
+    def finish(self, stall, heartbeat):
+        """记录一次卡顿并更新报告"""
+        duration = heartbeat - stall['start'] - self.TICK
+        slots = Counter(self.slot_name(stack) for stack in stall['samples'])
+        slot = slots.most_common(1)[0][0] if slots else '(未采样到)'
+        with self.lock:
+            entry = self.stalls.setdefault(slot, {'count': 0, 'total': 0.0, 'max': 0.0, 'stacks': Counter()})
+            entry['count'] += 1
+            entry['total'] += duration
+            entry['max'] = max(entry['max'], duration)
+            entry['stacks'].update(stack for stack in stall['samples'] if self.slot_name(stack) == slot)
+        METRICS.inc('ssreport_gui_stalls_total', slot=slot)
+        METRICS.observe('ssreport_gui_stall_seconds', duration)
+        print(f"界面卡顿 {duration * 1000:.0f} ms: {slot}")
+        self.write_report()
+    
+    def report(self):
+        """卡顿报告文本"""
+        with self.lock:
+            stalls = sorted(((slot, dict(entry, stacks=Counter(entry['stacks'])))
+                             for slot, entry in self.stalls.items()), key=lambda item: -item[1]['total'])
+        latencies = np.array(self.latencies)
+        lines = [f"界面卡顿报告（阈值 {self.threshold * 1000:.0f} ms，"
+                 f"运行 {time.perf_counter() - self.started_at:.0f} s，生成于 {datetime.now():%Y-%m-%d %H:%M:%S}）"]
+        if len(latencies):
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            lines.append(f"事件循环延迟: 心跳 {len(latencies)} 次，p50 {p50:.1f} ms，"
+                         f"p99 {p99:.1f} ms，最大 {latencies.max() * 1000:.0f} ms")
+        total = sum(entry['total'] for _, entry in stalls)
+        lines.append(f"卡顿 {sum(entry['count'] for _, entry in stalls)} 次，共 {total:.2f} s")
+        for rank, (slot, entry) in enumerate(stalls, 1):
+            lines.append('')
+            lines.append(f"{rank}. {slot}: {entry['count']} 次，共 {entry['total']:.2f} s"
+                         f"（{entry['total'] / total:.0%}），最长 {entry['max']:.2f} s")
+            samples = sum(entry['stacks'].values())
+            if samples:
+                stack, count = entry['stacks'].most_common(1)[0]
+                lines.append(f"   最常见调用栈（采样 {samples} 次中的 {count} 次）:")
+                for filename, lineno, name, line in stack:
+                    lines.append(f'     File "{filename}", line {lineno}, in {name}')
+                    if line:
+                        lines.append(f'       {line}')
+        return '\n'.join(lines) + '\n'
+    
+    def write_report(self):
+        """写入报告文件，先写临时文件再替换"""
+        try:
+            with open(f'{self.report_path}.tmp', 'w', encoding='utf-8') as f:
+                f.write(self.report())
+            os.replace(f'{self.report_path}.tmp', self.report_path)
+        except Exception as e:
+            print(f"写入卡顿报告失败: {e}")
 
 class MainWindow(QMainWindow):
     """主窗口"""
     
+    REPAIRED_OPTIONS = ['未修复', '已修复', '修复中', '不适用']
+    RISK_OPTIONS = ['高危', '中危', '低危', '信息']
+    
+    # 后台线程加载漏洞库和模板完成，参数为加载耗时（秒）
+    library_loaded = pyqtSignal(float)
+    # 后台线程更新报告检索索引完成，参数为 (重新索引的文件数, 删除的文件数, 耗时) 或异常
+    search_index_updated = pyqtSignal(object)
+    
     def __init__(self):
         super().__init__()
-        self.vuln_manager = VulnerabilityManager()
-        self.template_manager = TemplateManager()
-        self.report_generator = ReportGenerator(self.vuln_manager, self.template_manager)
+        # 漏洞库和模板在窗口显示后由后台线程加载
+        self.vuln_manager = VulnerabilityManager(load=False)
+        self.template_manager = TemplateManager(load=False)
+        self.library_ready = False
+        # 重复漏洞合并策略（见 FindingDeduplicator）
+        self.dedup_risk_policy = 'worst'
+        self.dedup_status_policy = 'latest'
+        self.report_generator = ReportGenerator(self.vuln_manager, self.template_manager, log=self.log_message)
+        self.journal = OperationJournal()
+        
+        # 存储漏洞数据（从自动保存恢复，之后的修改都写入操作日志）
+        self.vulnerability_data = self.journal.recover()
+        self.finding_store = FindingStore(self.vulnerability_data)
+        self.finding_store.listeners.append(self.journal.record)
+        self.undo_stack = UndoStack(self.finding_store)
+        
+        self.pending_logs = []
+        self.first_paint_time = None
         self.init_ui()
+        if self.vulnerability_data:
+            self.log_message(f"已从自动保存恢复 {len(self.finding_store.rows)} 个漏洞")
+        
+        self.library_loaded.connect(self.on_library_loaded)
+        threading.Thread(target=self.load_library, daemon=True).start()
     
     def init_ui(self):
         """初始化用户界面"""
         self.setWindowTitle('SSReportTools - 渗透测试报告生成工具 v1.2.0')
         self.setGeometry(100, 100, 1200, 800)
         
-        # 显示欢迎对话框
-        self.show_welcome_dialog()
-        
         # 创建中央widget
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -212,34 +4511,106 @@ class MainWindow(QMainWindow):
         # 创建主布局
         main_layout = QVBoxLayout(central_widget)
         
-        # 创建标签页
-        tab_widget = QTabWidget()
-        main_layout.addWidget(tab_widget)
+        # 创建标签页（首次切换到某标签页时才构建其内容）
+        self.tab_widget = QTabWidget()
+        main_layout.addWidget(self.tab_widget)
+        
+        self.tab_builders = {}
+        for title, builder in (('基本信息', self.create_basic_info_tab),
+                               ('漏洞管理', self.create_vulnerability_tab),
+                               ('报告生成', self.create_report_tab),
+                               ('统计分析', self.create_analytics_tab),
+                               ('报告检索', self.create_search_tab)):
+            tab = QWidget()
+            self.tab_builders[self.tab_widget.addTab(tab, title)] = (builder, tab)
+        self.tab_widget.currentChanged.connect(self.ensure_tab)
+        self.ensure_tab(self.tab_widget.currentIndex())
+        
+        # 状态栏
+        self.statusBar().showMessage('正在加载漏洞库和模板...')
         
-        # 基本信息标签页
-        self.create_basic_info_tab(tab_widget)
+        # 添加文件菜单
+        menubar = self.menuBar()
+        file_menu = menubar.addMenu('文件')
         
-        # 漏洞管理标签页
-        self.create_vulnerability_tab(tab_widget)
+        export_action = file_menu.addAction('导出项目')
+        export_action.triggered.connect(self.export_engagement)
         
-        # 报告生成标签页
-        self.create_report_tab(tab_widget)
+        clear_action = file_menu.addAction('清空漏洞数据')
+        clear_action.triggered.connect(self.clear_vulnerability_data)
         
-        # 状态栏
-        self.statusBar().showMessage('就绪')
+        # 添加编辑菜单
+        edit_menu = menubar.addMenu('编辑')
+        
+        self.undo_action = edit_menu.addAction('撤销')
+        self.undo_action.setShortcut('Ctrl+Z')
+        self.undo_action.triggered.connect(self.undo)
+        
+        self.redo_action = edit_menu.addAction('重做')
+        self.redo_action.setShortcut('Ctrl+Y')
+        self.redo_action.triggered.connect(self.redo)
+        
+        edit_menu.addSeparator()
+        dedup_action = edit_menu.addAction('合并重复漏洞')
+        dedup_action.triggered.connect(self.merge_duplicate_vulnerabilities)
+        
+        self.finding_store.listeners.append(lambda ops, label: self.update_undo_actions())
+        self.update_undo_actions()
         
         # 添加关于菜单
-        menubar = self.menuBar()
         help_menu = menubar.addMenu('帮助')
         
         about_action = help_menu.addAction('关于')
         about_action.triggered.connect(self.show_about)
     
-    def create_basic_info_tab(self, parent):
+    def ensure_tab(self, index):
+        """构建尚未创建的标签页内容"""
+        if index in self.tab_builders:
+            builder, tab = self.tab_builders.pop(index)
+            builder(tab)
+    
+    def showEvent(self, event):
+        """窗口首次显示后记录首次绘制耗时，并弹出欢迎对话框"""
+        super().showEvent(event)
+        if self.first_paint_time is None:
+            self.first_paint_time = 0
+            QTimer.singleShot(0, self.on_first_paint)
+    
+    def on_first_paint(self):
+        self.first_paint_time = time.perf_counter() - STARTUP_TIME
+        self.log_message(f"界面首次绘制耗时: {self.first_paint_time * 1000:.0f} ms")
+        self.show_welcome_dialog()
+    
+    def load_library(self):
+        """后台线程：加载漏洞库和模板"""
+        start = time.perf_counter()
+        self.vuln_manager.load_vulnerabilities()
+        self.template_manager.load_templates()
+        self.library_loaded.emit(time.perf_counter() - start)
+    
+    def on_library_loaded(self, elapsed):
+        """漏洞库和模板加载完成，填充依赖它们的组件"""
+        self.library_ready = True
+        if hasattr(self, 'template_combo'):
+            self.template_combo.addItems(self.template_manager.get_all_templates())
+        if hasattr(self, 'vuln_model') or hasattr(self, 'report_preview'):
+            self.update_vulnerability_table()
+        interactive_time = time.perf_counter() - STARTUP_TIME
+        self.statusBar().showMessage('就绪')
+        self.log_message(f"已加载漏洞库 {len(self.vuln_manager.vulnerabilities)} 条、"
+                         f"模板 {len(self.template_manager.templates)} 个，耗时 {elapsed * 1000:.0f} ms；"
+                         f"界面可交互耗时: {interactive_time * 1000:.0f} ms")
+        print(f"启动耗时: 首次绘制 {(self.first_paint_time or 0) * 1000:.0f} ms, "
+              f"可交互 {interactive_time * 1000:.0f} ms")
+    
+    def check_library_ready(self):
+        """漏洞库和模板尚未加载完成时提示用户"""
+        if not self.library_ready:
+            QMessageBox.information(self, '提示', '漏洞库和模板正在加载，请稍候')
+        return self.library_ready
+    
+    def create_basic_info_tab(self, tab):
         """创建基本信息标签页"""
-        tab = QWidget()
-        parent.addTab(tab, '基本信息')
-        
         layout = QVBoxLayout(tab)
         
         # 基本信息组
@@ -288,7 +4659,8 @@ class MainWindow(QMainWindow):
         
         template_layout.addWidget(QLabel('选择模板:'))
         self.template_combo = QComboBox()
-        self.template_combo.addItems(self.template_manager.get_all_templates())
+        if self.library_ready:
+            self.template_combo.addItems(self.template_manager.get_all_templates())
         template_layout.addWidget(self.template_combo)
         
         load_template_btn = QPushButton('加载模板')
@@ -302,11 +4674,8 @@ class MainWindow(QMainWindow):
         layout.addWidget(template_group)
         layout.addStretch()
     
-    def create_vulnerability_tab(self, parent):
+    def create_vulnerability_tab(self, tab):
         """创建漏洞管理标签页"""
-        tab = QWidget()
-        parent.addTab(tab, '漏洞管理')
-        
         layout = QVBoxLayout(tab)
         
         # 单位管理组
@@ -327,6 +4696,11 @@ class MainWindow(QMainWindow):
         system_group = QGroupBox('系统管理')
         system_layout = QHBoxLayout(system_group)
         
+        system_layout.addWidget(QLabel('所属单位:'))
+        self.system_unit_combo = QComboBox()
+        self.system_unit_combo.setMinimumContentsLength(10)
+        system_layout.addWidget(self.system_unit_combo)
+        
         system_layout.addWidget(QLabel('系统名称:'))
         self.system_name_edit = QLineEdit()
         system_layout.addWidget(self.system_name_edit)
@@ -337,16 +4711,63 @@ class MainWindow(QMainWindow):
         
         layout.addWidget(system_group)
         
-        # 漏洞表格
-        self.vuln_table = QTableWidget()
-        self.vuln_table.setColumnCount(6)
-        self.vuln_table.setHorizontalHeaderLabels(['单位', '系统', '漏洞名称', '风险等级', '修复状态', '操作'])
+        # 筛选栏（输入防抖，停止输入后再筛选）
+        filter_layout = QHBoxLayout()
+        self.filter_combos = {}
+        for column, label in ((0, '单位'), (1, '系统'), (3, '风险等级'), (4, '修复状态')):
+            filter_layout.addWidget(QLabel(f'{label}:'))
+            combo = QComboBox()
+            combo.addItem('全部')
+            combo.setMinimumContentsLength(8)
+            combo.currentIndexChanged.connect(lambda _: self.filter_timer.start())
+            filter_layout.addWidget(combo)
+            self.filter_combos[column] = combo
+        filter_layout.addWidget(QLabel('搜索:'))
+        self.filter_text_edit = QLineEdit()
+        self.filter_text_edit.setPlaceholderText('单位 / 系统 / 漏洞名称')
+        self.filter_text_edit.textChanged.connect(lambda _: self.filter_timer.start())
+        filter_layout.addWidget(self.filter_text_edit)
+        layout.addLayout(filter_layout)
+        
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(200)
+        self.filter_timer.timeout.connect(self.apply_vulnerability_filter)
         
-        # 设置表格属性
+        # 漏洞表格
+        self.vuln_table = QTableView()
+        self.vuln_model = FindingTableModel(self.finding_store, self.vuln_manager, self)
+        self.vuln_proxy = FindingFilterProxyModel(self)
+        self.vuln_proxy.setSourceModel(self.vuln_model)
+        self.vuln_proxy.modelReset.connect(self.update_filter_options)
+        self.vuln_table.setModel(self.vuln_proxy)
+        self.vuln_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.vuln_table.setSortingEnabled(True)
+        
+        # 设置表格属性（支持多选批量操作）
         self.vuln_table.horizontalHeader().setStretchLastSection(True)
         self.vuln_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        
-        layout.addWidget(self.vuln_table)
+        self.vuln_table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.vuln_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.vuln_table.clicked.connect(self.on_vuln_table_clicked)
+        
+        # 左侧层级树（单位 → 系统 → 漏洞，附统计），右侧漏洞表格
+        self.vuln_tree = QTreeView()
+        self.vuln_tree_model = FindingTreeModel(self.finding_store, self.vuln_manager, self)
+        self.vuln_tree.setModel(self.vuln_tree_model)
+        self.vuln_tree.setUniformRowHeights(True)
+        self.vuln_tree.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.vuln_tree.header().setSectionResizeMode(0, QHeaderView.Stretch)
+        for column in range(1, len(FindingTreeModel.HEADERS)):
+            self.vuln_tree.header().setSectionResizeMode(column, QHeaderView.ResizeToContents)
+        self.vuln_tree.clicked.connect(self.on_vuln_tree_clicked)
+        self.vuln_tree.doubleClicked.connect(self.on_vuln_tree_double_clicked)
+        
+        vuln_splitter = QSplitter(Qt.Horizontal)
+        vuln_splitter.addWidget(self.vuln_tree)
+        vuln_splitter.addWidget(self.vuln_table)
+        vuln_splitter.setSizes([350, 650])
+        layout.addWidget(vuln_splitter)
         
         # 漏洞操作按钮
         vuln_btn_layout = QHBoxLayout()
@@ -363,17 +4784,46 @@ class MainWindow(QMainWindow):
         delete_vuln_btn.clicked.connect(self.delete_vulnerability)
         vuln_btn_layout.addWidget(delete_vuln_btn)
         
+        import_vuln_btn = QPushButton('导入漏洞数据')
+        import_vuln_btn.clicked.connect(self.import_vulnerability_data)
+        vuln_btn_layout.addWidget(import_vuln_btn)
+        
+        self.dedup_import_check = QCheckBox('导入时合并重复漏洞')
+        self.dedup_import_check.setChecked(True)
+        vuln_btn_layout.addWidget(self.dedup_import_check)
+        
+        dedup_btn = QPushButton('合并重复漏洞')
+        dedup_btn.clicked.connect(self.merge_duplicate_vulnerabilities)
+        vuln_btn_layout.addWidget(dedup_btn)
+        
         vuln_btn_layout.addStretch()
         layout.addLayout(vuln_btn_layout)
         
-        # 存储漏洞数据
-        self.vulnerability_data = []
+        # 批量操作按钮（作用于所有选中行）
+        bulk_btn_layout = QHBoxLayout()
+        bulk_btn_layout.addWidget(QLabel('批量操作:'))
+        
+        bulk_repaired_btn = QPushButton('设置修复状态')
+        bulk_repaired_btn.clicked.connect(
+            lambda: self.bulk_update_vulnerabilities('repaired', '修复状态', self.REPAIRED_OPTIONS))
+        bulk_btn_layout.addWidget(bulk_repaired_btn)
+        
+        bulk_risk_btn = QPushButton('设置风险等级')
+        bulk_risk_btn.clicked.connect(
+            lambda: self.bulk_update_vulnerabilities('risk_level', '风险等级', self.RISK_OPTIONS))
+        bulk_btn_layout.addWidget(bulk_risk_btn)
+        
+        bulk_move_btn = QPushButton('移动到系统')
+        bulk_move_btn.clicked.connect(self.bulk_move_vulnerabilities)
+        bulk_btn_layout.addWidget(bulk_move_btn)
+        
+        bulk_btn_layout.addStretch()
+        layout.addLayout(bulk_btn_layout)
+        
+        self.update_filter_options()
     
-    def create_report_tab(self, parent):
+    def create_report_tab(self, tab):
         """创建报告生成标签页"""
-        tab = QWidget()
-        parent.addTab(tab, '报告生成')
-        
         # 创建水平分割器
         splitter = QSplitter(Qt.Horizontal)
         layout = QVBoxLayout(tab)
@@ -399,6 +4849,37 @@ class MainWindow(QMainWindow):
         
         report_layout.addLayout(path_layout)
         
+        # 附加版本：与主报告一次解析、并发生成
+        variant_layout = QHBoxLayout()
+        variant_layout.addWidget(QLabel('同时生成:'))
+        self.variant_checks = {}
+        for preset, label in (('internal', '内部版'), ('en', '英文版')):
+            check = QCheckBox(label)
+            variant_layout.addWidget(check)
+            self.variant_checks[preset] = check
+        self.variant_checks['en'].setToolTip(
+            '标签和风险等级、修复状态等固定取值为英文；漏洞名称、描述、危害和修复建议取漏洞库中的 '
+            'name_en、description_en、harm_en、suggustion_en，未填写时及单独修改过的漏洞文本仍为中文')
+        # 单位较多时每个单位单独一个文档，另生成含统计和索引的总报告
+        self.split_units_check = QCheckBox('按单位拆分')
+        self.split_units_check.setToolTip('每个单位生成一个文档（<文件名>_units/ 目录），主文件为汇总统计和单位索引')
+        variant_layout.addWidget(self.split_units_check)
+        variant_layout.addStretch()
+        report_layout.addLayout(variant_layout)
+        
+        # 复测时选择初测项目文件，报告末尾附复测对比
+        baseline_layout = QHBoxLayout()
+        baseline_layout.addWidget(QLabel('初测项目:'))
+        self.baseline_path_edit = QLineEdit()
+        self.baseline_path_edit.setPlaceholderText('复测报告可选择初测导出的项目文件')
+        baseline_layout.addWidget(self.baseline_path_edit)
+        
+        baseline_btn = QPushButton('浏览')
+        baseline_btn.clicked.connect(self.browse_baseline_path)
+        baseline_layout.addWidget(baseline_btn)
+        
+        report_layout.addLayout(baseline_layout)
+        
         # 生成按钮
         generate_btn = QPushButton('生成报告')
         generate_btn.clicked.connect(self.generate_report)
@@ -413,6 +4894,9 @@ class MainWindow(QMainWindow):
         
         self.log_text = QTextEdit()
         self.log_text.setReadOnly(True)
+        for message in self.pending_logs:
+            self.log_text.append(message)
+        self.pending_logs.clear()
         log_layout.addWidget(self.log_text)
         
         left_layout.addWidget(log_group)
@@ -619,12 +5103,279 @@ class MainWindow(QMainWindow):
         
         right_layout.addWidget(author_group)
         
-        # 将左右两部分添加到分割器
+        # 中间：报告预览（修改漏洞后只重新生成受影响的片段）
+        preview_group = QGroupBox('报告预览')
+        preview_layout = QVBoxLayout(preview_group)
+        self.preview_browser = QTextBrowser()
+        preview_layout.addWidget(self.preview_browser)
+        
+        self.report_preview = ReportPreview(self.finding_store, self.vuln_manager)
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(100)
+        self.preview_timer.timeout.connect(self.update_preview)
+        self.finding_store.listeners.append(lambda ops, label: self.preview_timer.start())
+        self.preview_tab = tab
+        self.tab_widget.currentChanged.connect(
+            lambda index: self.tab_widget.widget(index) is tab and self.preview_timer.start())
+        
+        # 将各部分添加到分割器
         splitter.addWidget(left_widget)
+        splitter.addWidget(preview_group)
         splitter.addWidget(right_widget)
         
         # 设置分割器比例
-        splitter.setSizes([800, 300])
+        splitter.setSizes([450, 550, 300])
+        self.preview_timer.start()
+    
+    def create_analytics_tab(self, tab):
+        """创建统计分析标签页"""
+        layout = QVBoxLayout(tab)
+        self.analytics = FindingAnalytics(vuln_manager=self.vuln_manager)
+        
+        # 数据导入组
+        ingest_group = QGroupBox('历史项目')
+        ingest_layout = QHBoxLayout(ingest_group)
+        self.analytics_count_label = QLabel()
+        ingest_layout.addWidget(self.analytics_count_label)
+        ingest_layout.addStretch()
+        
+        ingest_files_btn = QPushButton('导入项目文件')
+        ingest_files_btn.clicked.connect(lambda: self.ingest_engagements(False))
+        ingest_layout.addWidget(ingest_files_btn)
+        
+        ingest_dir_btn = QPushButton('导入项目目录')
+        ingest_dir_btn.clicked.connect(lambda: self.ingest_engagements(True))
+        ingest_layout.addWidget(ingest_dir_btn)
+        layout.addWidget(ingest_group)
+        
+        # 查询条件组
+        query_group = QGroupBox('分组统计')
+        query_layout = QHBoxLayout(query_group)
+        self.analytics_group_combos = []
+        for label in ('分组:', '再按:'):
+            query_layout.addWidget(QLabel(label))
+            combo = QComboBox()
+            if self.analytics_group_combos:
+                combo.addItem('(无)', None)
+            for column in FindingAnalytics.COLUMNS:
+                combo.addItem(FindingAnalytics.COLUMN_LABELS[column], column)
+            query_layout.addWidget(combo)
+            self.analytics_group_combos.append(combo)
+        self.analytics_group_combos[0].setCurrentIndex(FindingAnalytics.COLUMNS.index('vuln'))
+        
+        query_layout.addWidget(QLabel('排序:'))
+        self.analytics_sort_combo = QComboBox()
+        self.analytics_sort_combo.addItem('按数量', 'count')
+        self.analytics_sort_combo.addItem('按修复率', 'rate')
+        query_layout.addWidget(self.analytics_sort_combo)
+        
+        query_btn = QPushButton('查询')
+        query_btn.clicked.connect(self.run_analytics_query)
+        query_layout.addWidget(query_btn)
+        query_layout.addStretch()
+        layout.addWidget(query_group)
+        
+        self.analytics_table = QTableWidget()
+        self.analytics_table.horizontalHeader().setStretchLastSection(True)
+        self.analytics_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.analytics_table)
+        
+        self.analytics_status_label = QLabel()
+        layout.addWidget(self.analytics_status_label)
+        self.update_analytics_count()
+    
+    def update_analytics_count(self):
+        self.analytics_count_label.setText(
+            f'已导入 {len(self.analytics.sources)} 个项目，共 {len(self.analytics)} 个漏洞')
+    
+    def ingest_engagements(self, directory):
+        """导入历史项目到统计数据"""
+        if not self.check_library_ready():
+            return
+        if directory:
+            path = QFileDialog.getExistingDirectory(self, '选择项目目录')
+            paths = [path] if path else []
+        else:
+            paths, _ = QFileDialog.getOpenFileNames(self, '选择项目文件', '', 'JSON文件 (*.json)')
+        if not paths:
+            return
+        added = self.analytics.ingest(paths)
+        self.update_analytics_count()
+        self.log_message(f"统计分析已导入 {added} 个漏洞")
+        self.run_analytics_query()
+    
+    def run_analytics_query(self):
+        """执行分组统计并显示结果"""
+        by = [combo.currentData() for combo in self.analytics_group_combos if combo.currentData()]
+        by = list(dict.fromkeys(by))
+        start = time.perf_counter()
+        results = self.analytics.query(by, top=500, sort=self.analytics_sort_combo.currentData())
+        elapsed = time.perf_counter() - start
+        
+        headers = [FindingAnalytics.COLUMN_LABELS[column] for column in by] + ['数量', '已修复', '修复率']
+        self.analytics_table.clear()
+        self.analytics_table.setColumnCount(len(headers))
+        self.analytics_table.setHorizontalHeaderLabels(headers)
+        self.analytics_table.setRowCount(len(results))
+        for row, (values, count, repaired, rate) in enumerate(results):
+            for column, text in enumerate(list(values) + [str(count), str(repaired), f'{rate:.1%}']):
+                self.analytics_table.setItem(row, column, QTableWidgetItem(text))
+        self.analytics_status_label.setText(
+            f'共 {len(self.analytics)} 条记录，{len(results)} 个分组，查询耗时 {elapsed * 1000:.1f} ms')
+    
+    def create_search_tab(self, tab):
+        """创建报告检索标签页"""
+        layout = QVBoxLayout(tab)
+        self.search_index = ReportSearchIndex()
+        self.search_index_updated.connect(self.on_search_index_updated)
+        
+        # 报告目录组
+        docs_group = QGroupBox('历史报告')
+        docs_layout = QHBoxLayout(docs_group)
+        docs_layout.addWidget(QLabel('报告目录:'))
+        self.search_docs_edit = QLineEdit('docs')
+        docs_layout.addWidget(self.search_docs_edit)
+        
+        browse_btn = QPushButton('浏览')
+        browse_btn.clicked.connect(self.browse_search_docs)
+        docs_layout.addWidget(browse_btn)
+        
+        self.search_update_btn = QPushButton('更新索引')
+        self.search_update_btn.clicked.connect(self.update_search_index)
+        docs_layout.addWidget(self.search_update_btn)
+        layout.addWidget(docs_group)
+        
+        # 查询组
+        query_layout = QHBoxLayout()
+        self.search_query_edit = QLineEdit()
+        self.search_query_edit.setPlaceholderText('关键词以空格分隔，如：SQL注入 OA系统')
+        self.search_query_edit.returnPressed.connect(self.run_report_search)
+        query_layout.addWidget(self.search_query_edit)
+        
+        search_btn = QPushButton('搜索')
+        search_btn.clicked.connect(self.run_report_search)
+        query_layout.addWidget(search_btn)
+        layout.addLayout(query_layout)
+        
+        self.search_table = QTableWidget()
+        self.search_table.setColumnCount(4)
+        self.search_table.setHorizontalHeaderLabels(['客户', '章节', '摘要', '文件'])
+        self.search_table.horizontalHeader().setStretchLastSection(True)
+        self.search_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.search_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.search_table.cellDoubleClicked.connect(self.open_search_result)
+        layout.addWidget(self.search_table)
+        
+        self.search_status_label = QLabel()
+        layout.addWidget(self.search_status_label)
+        self.update_search_index()
+    
+    def browse_search_docs(self):
+        path = QFileDialog.getExistingDirectory(self, '选择报告目录', self.search_docs_edit.text())
+        if path:
+            self.search_docs_edit.setText(path)
+            self.update_search_index()
+    
+    def update_search_index(self):
+        """在后台线程中更新报告检索索引（只解析有变化的报告）"""
+        if not self.search_update_btn.isEnabled():
+            return
+        self.search_update_btn.setEnabled(False)
+        self.search_status_label.setText('正在更新索引...')
+        docs = self.search_docs_edit.text().strip() or 'docs'
+        
+        def run():
+            start = time.perf_counter()
+            try:
+                changed, removed = self.search_index.update([docs])
+                self.search_index_updated.emit((changed, removed, time.perf_counter() - start))
+            except Exception as e:
+                self.search_index_updated.emit(e)
+        threading.Thread(target=run, daemon=True).start()
+    
+    def on_search_index_updated(self, result):
+        self.search_update_btn.setEnabled(True)
+        if isinstance(result, Exception):
+            self.search_status_label.setText(f'更新索引失败: {result}')
+            return
+        changed, removed, elapsed = result
+        self.search_status_label.setText(
+            f'已索引 {len(self.search_index.files)} 个报告、{self.search_index.section_count} 个章节'
+            f'（重新索引 {changed} 个，删除 {removed} 个，耗时 {elapsed:.2f} s）')
+        if changed or removed:
+            self.log_message(f"报告检索索引已更新: 重新索引 {changed} 个报告，删除 {removed} 个")
+        if self.search_query_edit.text().strip():
+            self.run_report_search()
+    
+    def run_report_search(self):
+        """检索历史报告并显示结果"""
+        query = self.search_query_edit.text().strip()
+        if not query:
+            return
+        start = time.perf_counter()
+        results, more = self.search_index.search(query, limit=200)
+        elapsed = time.perf_counter() - start
+        
+        self.search_table.setRowCount(len(results))
+        for row, result in enumerate(results):
+            values = [result['client'], ' > '.join(result['headings']), result['snippet'], result['path']]
+            for column, text in enumerate(values):
+                item = QTableWidgetItem(text)
+                item.setToolTip(text)
+                self.search_table.setItem(row, column, item)
+        self.search_table.resizeColumnsToContents()
+        more = '，仅显示前 200 个' if more else ''
+        self.search_status_label.setText(f'{len(results)} 个章节命中{more}，查询耗时 {elapsed * 1000:.1f} ms')
+    
+    def open_search_result(self, row, column):
+        """双击结果用系统默认程序打开报告"""
+        path = self.search_table.item(row, 3).text()
+        if not QDesktopServices.openUrl(QUrl.fromLocalFile(path)):
+            QMessageBox.warning(self, '警告', f'无法打开报告文件: {path}')
+    
+    def collect_basic_info(self):
+        """收集基本信息字段"""
+        template_data = {}
+        for field_name, widget in self.fields.items():
+            if isinstance(widget, QComboBox):
+                template_data[field_name] = widget.currentText()
+            elif isinstance(widget, QSpinBox):
+                template_data[field_name] = str(widget.value())
+            else:
+                template_data[field_name] = widget.text()
+        return template_data
+    
+    def dated_basic_info(self):
+        """基本信息字段加上报告日期（当前日期），用于保存模板和导出项目"""
+        template_data = self.collect_basic_info()
+        now = datetime.now()
+        template_data['reportYear'] = str(now.year)
+        template_data['reportMonth'] = f"{now.month:02d}"
+        template_data['reportDay'] = f"{now.day:02d}"
+        return template_data
+    
+    def fill_basic_info(self, template):
+        """填充基本信息字段"""
+        for field_name, widget in self.fields.items():
+            if field_name in template:
+                if isinstance(widget, QComboBox):
+                    widget.setCurrentText(template[field_name])
+                elif isinstance(widget, QSpinBox):
+                    widget.setValue(int(template[field_name]) if template[field_name].isdigit() else 0)
+                else:
+                    widget.setText(template[field_name])
+    
+    def export_engagement(self):
+        """导出项目（基本信息 + 漏洞数据）"""
+        file_path, _ = QFileDialog.getSaveFileName(self, '导出项目', '', 'JSON文件 (*.json)')
+        if not file_path:
+            return
+        try:
+            save_engagement(file_path, self.dated_basic_info(), self.vulnerability_data)
+            self.log_message(f"项目已导出: {file_path}")
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'导出项目失败: {e}')
     
     def load_template(self):
         """加载模板"""
@@ -635,14 +5386,7 @@ class MainWindow(QMainWindow):
         template = self.template_manager.get_template(template_name)
         if template:
             # 填充基本信息字段
-            for field_name, widget in self.fields.items():
-                if field_name in template:
-                    if isinstance(widget, QComboBox):
-                        widget.setCurrentText(template[field_name])
-                    elif isinstance(widget, QSpinBox):
-                        widget.setValue(int(template[field_name]) if template[field_name].isdigit() else 0)
-                    else:
-                        widget.setText(template[field_name])
+            self.fill_basic_info(template)
             
             self.log_message(f"已加载模板: {template_name}")
     
@@ -653,21 +5397,8 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, '警告', '请选择模板名称')
             return
         
-        # 收集基本信息
-        template_data = {}
-        for field_name, widget in self.fields.items():
-            if isinstance(widget, QComboBox):
-                template_data[field_name] = widget.currentText()
-            elif isinstance(widget, QSpinBox):
-                template_data[field_name] = str(widget.value())
-            else:
-                template_data[field_name] = widget.text()
-        
-        # 添加当前日期
-        now = datetime.now()
-        template_data['reportYear'] = str(now.year)
-        template_data['reportMonth'] = f"{now.month:02d}"
-        template_data['reportDay'] = f"{now.day:02d}"
+        # 收集基本信息并添加当前日期
+        template_data = self.dated_basic_info()
         
         # 保存到文件
         template_path = Path(self.template_manager.template_dir) / f"{template_name}.json"
@@ -687,16 +5418,13 @@ class MainWindow(QMainWindow):
             return
         
         # 检查是否已存在
-        for unit in self.vulnerability_data:
-            if unit['unit'] == unit_name:
-                QMessageBox.warning(self, '警告', '该单位已存在')
-                return
+        if self.finding_store.find_unit(unit_name) >= 0:
+            QMessageBox.warning(self, '警告', '该单位已存在')
+            return
         
         # 添加新单位
-        self.vulnerability_data.append({
-            'unit': unit_name,
-            'systems': []
-        })
+        with self.finding_store.transaction('添加单位'):
+            self.finding_store.add_unit(unit_name)
         
         self.unit_name_edit.clear()
         self.log_message(f"已添加单位: {unit_name}")
@@ -708,22 +5436,29 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, '警告', '请输入系统名称')
             return
         
-        # 添加到最后一个单位
+        # 添加到"所属单位"中选择的单位
         if not self.vulnerability_data:
             QMessageBox.warning(self, '警告', '请先添加单位')
             return
+        ui = self.system_unit_combo.currentIndex()
+        if ui < 0:
+            QMessageBox.warning(self, '警告', '请选择所属单位')
+            return
+        if self.finding_store.find_system(ui, system_name) >= 0:
+            QMessageBox.warning(self, '警告', '该单位下已存在同名系统')
+            return
         
-        last_unit = self.vulnerability_data[-1]
-        last_unit['systems'].append({
-            'system': system_name,
-            'vulns': []
-        })
+        with self.finding_store.transaction('添加系统'):
+            self.finding_store.add_system(ui, system_name)
         
         self.system_name_edit.clear()
-        self.log_message(f"已添加系统: {system_name}")
+        self.log_message(f"已添加系统: {self.vulnerability_data[ui]['unit']} / {system_name}")
     
     def add_vulnerability(self):
         """添加漏洞"""
+        if not self.check_library_ready():
+            return
+        
         if not self.vulnerability_data:
             QMessageBox.warning(self, '警告', '请先添加单位和系统')
             return
@@ -775,14 +5510,14 @@ class MainWindow(QMainWindow):
         # 修复状态
         layout.addWidget(QLabel('修复状态:'))
         repaired_combo = QComboBox()
-        repaired_combo.addItems(['未修复', '已修复', '修复中', '不适用'])
+        repaired_combo.addItems(self.REPAIRED_OPTIONS)
         repaired_combo.setCurrentText('未修复')
         layout.addWidget(repaired_combo)
         
         # 风险等级
         layout.addWidget(QLabel('风险等级:'))
         risk_combo = QComboBox()
-        risk_combo.addItems(['高危', '中危', '低危', '信息'])
+        risk_combo.addItems(self.RISK_OPTIONS)
         risk_combo.setCurrentText('高危')
         layout.addWidget(risk_combo)
         
@@ -804,42 +5539,111 @@ class MainWindow(QMainWindow):
             risk_level = risk_combo.currentText()
             
             # 添加到数据源
-            for unit in self.vulnerability_data:
-                if unit['unit'] == unit_name:
-                    for system in unit['systems']:
-                        if system['system'] == system_name:
-                            system['vulns'].append({
-                                'name': vuln_name,
-                                'repaired': repaired,
-                                'risk_level': risk_level
-                            })
-                            break
-                    break
+            ui = self.finding_store.find_unit(unit_name)
+            si = self.finding_store.find_system(ui, system_name) if ui >= 0 else -1
+            if si < 0:
+                QMessageBox.warning(self, '警告', '请先为该单位添加系统')
+                return
+            with self.finding_store.transaction('添加漏洞'):
+                self.finding_store.add_vulnerabilities(ui, si, [{
+                    'name': vuln_name,
+                    'repaired': repaired,
+                    'risk_level': risk_level
+                }])
             
-            self.update_vulnerability_table()
             self.log_message(f"已添加漏洞: {vuln_name} - 单位: {unit_name}, 系统: {system_name}")
             QMessageBox.information(self, '成功', '漏洞添加成功')
     
-    def edit_vulnerability(self):
+    def selected_vulnerability_rows(self):
+        """获取选中的漏洞在数据源中的行号（升序）"""
+        visible = self.vuln_proxy.visible
+        return sorted(visible[index.row()] for index in self.vuln_table.selectionModel().selectedRows())
+    
+    def on_vuln_table_clicked(self, index):
+        """点击操作列时编辑该行"""
+        if index.column() == 5:
+            self.edit_vulnerability(self.vuln_proxy.mapToSource(index).row())
+    
+    def apply_vulnerability_filter(self):
+        """按筛选栏条件筛选漏洞表格"""
+        filters = {column: (combo.currentText() if combo.currentIndex() > 0 else None)
+                   for column, combo in self.filter_combos.items()}
+        self.vuln_proxy.set_filters(filters, self.filter_text_edit.text())
+    
+    def update_filter_options(self):
+        """数据变化后刷新筛选下拉框和所属单位选项，保留当前选择"""
+        units = [unit['unit'] for unit in self.vulnerability_data]
+        current = self.system_unit_combo.currentIndex()
+        previous_count = self.system_unit_combo.count()
+        self.system_unit_combo.clear()
+        self.system_unit_combo.addItems(units)
+        if units:
+            # 新增单位后默认选中新单位
+            added = current < 0 or len(units) > previous_count
+            self.system_unit_combo.setCurrentIndex(len(units) - 1 if added else min(current, len(units) - 1))
+        
+        changed = False
+        for column, combo in self.filter_combos.items():
+            current = combo.currentText()
+            values = self.vuln_proxy.distinct_values(column)
+            if column in (3, 4):
+                values.sort(key=lambda value: self.vuln_proxy.sort_key(column, value))
+            else:
+                values.sort()
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItem('全部')
+            combo.addItems(values)
+            combo.setCurrentText(current if current in values else '全部')
+            combo.blockSignals(False)
+            changed = changed or combo.currentText() != current
+        if changed:
+            # 选中的值已不存在时下拉框回到“全部”，按新条件重新筛选
+            self.apply_vulnerability_filter()
+    
+    def on_vuln_tree_clicked(self, index):
+        """点击树节点：选中对应单位作为新系统的所属单位，并按单位/系统筛选表格和报告预览"""
+        ui, si, _ = self.vuln_tree_model.path_of(index)
+        if ui is None:
+            return
+        unit = self.vulnerability_data[ui]
+        self.system_unit_combo.setCurrentIndex(ui)
+        self.filter_combos[0].setCurrentText(unit['unit'] if unit['unit'] in
+                                             self.vuln_proxy.distinct_values(0) else '全部')
+        system_name = unit['systems'][si]['system'] if si is not None else '全部'
+        self.filter_combos[1].setCurrentText(system_name if system_name in
+                                             self.vuln_proxy.distinct_values(1) else '全部')
+        if hasattr(self, 'report_preview'):
+            # 报告预览从该单位/系统开始展示
+            self.report_preview.set_focus(ui, si or 0)
+    
+    def on_vuln_tree_double_clicked(self, index):
+        """双击树中的漏洞进行编辑"""
+        ui, si, vi = self.vuln_tree_model.path_of(index)
+        if vi is not None:
+            vuln = self.vulnerability_data[ui]['systems'][si]['vulns'][vi]
+            self.edit_vulnerability(self.finding_store.row_of[id(vuln)])
+    
+    def edit_vulnerability(self, current_row=None):
         """编辑漏洞"""
-        current_row = self.vuln_table.currentRow()
+        if current_row is None:
+            current_row = self.vuln_proxy.mapToSource(self.vuln_table.currentIndex()).row()
         if current_row < 0:
             QMessageBox.warning(self, '警告', '请选择要编辑的漏洞')
             return
         
         # 获取当前选中的漏洞信息
-        unit_name = self.vuln_table.item(current_row, 0).text()
-        system_name = self.vuln_table.item(current_row, 1).text()
-        vuln_name = self.vuln_table.item(current_row, 2).text()
-        current_repaired = self.vuln_table.item(current_row, 4).text()
+        vuln = self.finding_store.rows[current_row][2]
+        vuln_name = vuln['name']
+        current_repaired = vuln.get('repaired', '未修复')
         
         # 创建编辑对话框
-        from PyQt5.QtWidgets import QDialog, QFormLayout, QComboBox, QDialogButtonBox
+        from PyQt5.QtWidgets import QDialog, QFormLayout, QComboBox, QDialogButtonBox, QListWidget
         
         dialog = QDialog(self)
         dialog.setWindowTitle('编辑漏洞')
         dialog.setModal(True)
-        dialog.resize(400, 200)
+        dialog.resize(500, 600)
         
         layout = QFormLayout(dialog)
         
@@ -850,17 +5654,49 @@ class MainWindow(QMainWindow):
         
         # 修复状态
         repaired_combo = QComboBox()
-        repaired_combo.addItems(['未修复', '已修复', '修复中', '不适用'])
+        repaired_combo.addItems(self.REPAIRED_OPTIONS)
         repaired_combo.setCurrentText(current_repaired)
         layout.addRow('修复状态:', repaired_combo)
         
         # 风险等级
         risk_combo = QComboBox()
-        risk_combo.addItems(['高危', '中危', '低危', '信息'])
-        current_risk = self.vuln_table.item(current_row, 3).text()
+        risk_combo.addItems(self.RISK_OPTIONS)
+        current_risk = self.vuln_manager.risk_level(vuln)
         risk_combo.setCurrentText(current_risk if current_risk else '高危')
         layout.addRow('风险等级:', risk_combo)
         
+        # 漏洞文本（默认显示漏洞库内容，只保存与漏洞库不同的修改）
+        library = self.vuln_manager.get_vulnerability(vuln_name)
+        resolved = self.vuln_manager.resolve_finding(vuln)
+        text_edits = {}
+        for key, label in (('desc', '漏洞描述:'), ('harm', '漏洞危害:'), ('fix', '修复建议:')):
+            field = VulnerabilityManager.OVERRIDE_FIELDS[key]
+            edit = QTextEdit()
+            edit.setPlainText(resolved.get(field, ''))
+            edit.setMaximumHeight(80)
+            layout.addRow(label, edit)
+            text_edits[key] = (edit, field)
+        
+        # 证据截图（报告生成时自动缩小压缩，相同图片只保存一份）
+        image_list = QListWidget()
+        image_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        image_list.addItems(vuln.get('images') or [])
+        image_list.setMaximumHeight(80)
+        add_image_btn = QPushButton('添加截图')
+        add_image_btn.clicked.connect(lambda: image_list.addItems(QFileDialog.getOpenFileNames(
+            dialog, '选择证据截图', '', '图片文件 (*.png *.jpg *.jpeg *.bmp *.gif);;所有文件 (*)')[0]))
+        remove_image_btn = QPushButton('移除截图')
+        remove_image_btn.clicked.connect(
+            lambda: [image_list.takeItem(image_list.row(item)) for item in image_list.selectedItems()])
+        image_buttons = QHBoxLayout()
+        image_buttons.addWidget(add_image_btn)
+        image_buttons.addWidget(remove_image_btn)
+        image_buttons.addStretch()
+        image_layout = QVBoxLayout()
+        image_layout.addWidget(image_list)
+        image_layout.addLayout(image_buttons)
+        layout.addRow('证据截图:', image_layout)
+        
         # 按钮
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(dialog.accept)
@@ -872,98 +5708,330 @@ class MainWindow(QMainWindow):
             new_repaired = repaired_combo.currentText()
             new_risk = risk_combo.currentText()
             
-            # 更新表格显示
-            self.vuln_table.setItem(current_row, 3, QTableWidgetItem(new_risk))
-            self.vuln_table.setItem(current_row, 4, QTableWidgetItem(new_repaired))
+            # 与漏洞库相同的内容不单独保存（None 表示删除该字段）
+            library_risk = vuln.get('level') or library.get('risklevel')
+            fields = {'repaired': new_repaired,
+                      'risk_level': new_risk if new_risk != library_risk else None}
+            # 清空的文本记录在 cleared 中（导入数据中的空字符串表示未填写，沿用漏洞库）
+            cleared = []
+            for key, (edit, field) in text_edits.items():
+                text = edit.toPlainText().strip()
+                if text == library.get(field, '').strip():
+                    fields[key] = None
+                elif not text:
+                    fields[key] = None
+                    cleared.append(key)
+                else:
+                    fields[key] = text
+            fields['cleared'] = cleared or None
+            images = [image_list.item(i).text() for i in range(image_list.count())]
+            fields['images'] = images or None
             
-            # 更新数据源
-            self.update_vulnerability_data(unit_name, system_name, vuln_name, new_repaired, new_risk)
+            # 更新数据源（表格经模型自动刷新）
+            with self.finding_store.transaction('编辑漏洞'):
+                self.finding_store.update_rows([current_row], fields)
             
             self.log_message(f"已更新漏洞: {vuln_name} - 状态: {new_repaired}, 风险: {new_risk}")
             QMessageBox.information(self, '成功', '漏洞信息已更新')
     
-    def update_vulnerability_data(self, unit_name, system_name, vuln_name, new_repaired, new_risk):
-        """更新漏洞数据源"""
-        for unit in self.vulnerability_data:
-            if unit['unit'] == unit_name:
-                for system in unit['systems']:
-                    if system['system'] == system_name:
-                        for vuln in system['vulns']:
-                            if vuln['name'] == vuln_name:
-                                vuln['repaired'] = new_repaired
-                                vuln['risk_level'] = new_risk
-                                return
-    
     def delete_vulnerability(self):
-        """删除漏洞"""
-        current_row = self.vuln_table.currentRow()
-        if current_row < 0:
+        """删除漏洞（支持多选）"""
+        rows = self.selected_vulnerability_rows()
+        if not rows:
             QMessageBox.warning(self, '警告', '请选择要删除的漏洞')
             return
         
-        # 获取要删除的漏洞信息
-        unit_name = self.vuln_table.item(current_row, 0).text()
-        system_name = self.vuln_table.item(current_row, 1).text()
-        vuln_name = self.vuln_table.item(current_row, 2).text()
-        
         # 确认删除
+        if len(rows) == 1:
+            unit, system, vuln = self.finding_store.rows[rows[0]][:3]
+            prompt = f'确定要删除漏洞 "{vuln["name"]}" 吗？\n\n单位: {unit["unit"]}\n系统: {system["system"]}'
+        else:
+            prompt = f'确定要删除选中的 {len(rows)} 个漏洞吗？'
         reply = QMessageBox.question(
             self, 
             '确认删除', 
-            f'确定要删除漏洞 "{vuln_name}" 吗？\n\n单位: {unit_name}\n系统: {system_name}',
+            prompt,
             QMessageBox.Yes | QMessageBox.No,
             QMessageBox.No
         )
         
         if reply == QMessageBox.Yes:
-            # 从数据源中删除
-            if self.remove_vulnerability_from_data(unit_name, system_name, vuln_name):
-                # 从表格中删除行
-                self.vuln_table.removeRow(current_row)
-                self.log_message(f"已删除漏洞: {vuln_name}")
-                QMessageBox.information(self, '成功', '漏洞已删除')
-            else:
-                QMessageBox.warning(self, '错误', '删除漏洞失败')
+            with self.finding_store.transaction('删除漏洞'):
+                self.finding_store.remove_rows(rows)
+            self.log_message(f"已删除漏洞: {len(rows)} 个")
     
-    def remove_vulnerability_from_data(self, unit_name, system_name, vuln_name):
-        """从数据源中删除漏洞"""
-        for unit in self.vulnerability_data:
-            if unit['unit'] == unit_name:
-                for system in unit['systems']:
-                    if system['system'] == system_name:
-                        for i, vuln in enumerate(system['vulns']):
-                            if vuln['name'] == vuln_name:
-                                system['vulns'].pop(i)
-                                return True
-        return False
+    def bulk_update_vulnerabilities(self, field, label, options):
+        """批量设置选中漏洞的字段"""
+        rows = self.selected_vulnerability_rows()
+        if not rows:
+            QMessageBox.warning(self, '警告', '请选择要修改的漏洞')
+            return
+        
+        value, ok = QInputDialog.getItem(self, f'批量设置{label}', f'{label}:', options, 0, False)
+        if not ok:
+            return
+        
+        with self.finding_store.transaction(f'批量设置{label}'):
+            self.finding_store.update_rows(rows, {field: value})
+        self.log_message(f"已批量设置{label}: {value}，共 {len(rows)} 个漏洞")
+    
+    def bulk_move_vulnerabilities(self):
+        """批量将选中漏洞移动到另一系统"""
+        rows = self.selected_vulnerability_rows()
+        if not rows:
+            QMessageBox.warning(self, '警告', '请选择要移动的漏洞')
+            return
+        
+        targets = [(ui, si, f"{unit['unit']} / {system['system']}")
+                   for ui, unit in enumerate(self.vulnerability_data)
+                   for si, system in enumerate(unit['systems'])]
+        labels = [target[2] for target in targets]
+        label, ok = QInputDialog.getItem(self, '移动到系统', '目标系统:', labels, 0, False)
+        if not ok:
+            return
+        
+        ui, si, _ = targets[labels.index(label)]
+        self.finding_store.move_rows(rows, ui, si)
+        self.vuln_table.clearSelection()
+        self.log_message(f"已移动 {len(rows)} 个漏洞到: {label}")
+    
+    def import_vulnerability_data(self):
+        """导入漏洞数据（项目文件或vuln_tree.json格式）"""
+        if not self.check_library_ready():
+            return
+        
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, '导入漏洞数据', 'config', 'JSON文件 (*.json)'
+        )
+        if not file_path:
+            return
+        
+        try:
+            template, imported = load_engagement(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'导入漏洞数据失败: {e}')
+            return
+        if template:
+            self.fill_basic_info(template)
+        
+        # 批量解析漏洞名称，只有未能精确命中的名称需要人工确认
+        names = [vuln.get('name', '')
+                 for unit in imported
+                 for system in unit.get('systems', [])
+                 for vuln in system.get('vulns', [])
+                 if vuln.get('name')]
+        results = self.vuln_manager.resolve_names(names)
+        pending = {name: result for name, result in results.items()
+                   if name not in self.vuln_manager.vulnerabilities and result[1] < 1.0}
+        if pending and not self.show_name_mapping_dialog(pending):
+            return
+        
+        # 合并到数据源（同名单位、系统合并），整体作为一个事务提交
+        store = self.finding_store
+        with store.transaction('导入漏洞数据'):
+            for unit in imported:
+                ui = store.find_unit(unit.get('unit', ''))
+                if ui < 0:
+                    ui = store.add_unit(unit.get('unit', ''))
+                for system in unit.get('systems', []):
+                    si = store.find_system(ui, system.get('system', ''))
+                    if si < 0:
+                        si = store.add_system(ui, system.get('system', ''))
+                    if system.get('vulns'):
+                        store.add_vulnerabilities(ui, si, [dict(vuln) for vuln in system['vulns']])
+        
+        resolved = sum(1 for name in results if self.vuln_manager.get_vulnerability(name))
+        self.log_message(f"已导入漏洞数据: {file_path}，共 {len(names)} 个漏洞，"
+                         f"{resolved}/{len(results)} 个名称已匹配漏洞库")
+        # 单独作为一个撤销项，撤销合并不会撤销导入
+        if self.dedup_import_check.isChecked():
+            self.apply_deduplication('合并导入的重复漏洞')
+    
+    def finding_deduplicator(self):
+        """按当前合并策略创建重复漏洞合并器"""
+        return FindingDeduplicator(self.vuln_manager.canonical_name, self.vuln_manager.risk_level,
+                                   self.dedup_risk_policy, self.dedup_status_policy)
+    
+    def merge_duplicate_vulnerabilities(self):
+        """检测重复漏洞，选择合并策略后合并"""
+        if not self.check_library_ready():
+            return
+        from PyQt5.QtWidgets import QDialog, QFormLayout, QDialogButtonBox
+        
+        groups = self.finding_deduplicator().find(self.vulnerability_data)
+        if not groups:
+            QMessageBox.information(self, '合并重复漏洞', '未发现重复漏洞')
+            return
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle('合并重复漏洞')
+        dialog.setModal(True)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(f'发现 {len(groups)} 组重复漏洞，共 '
+                                f'{sum(len(group) - 1 for group in groups)} 个重复项。\n'
+                                '同一系统中漏洞类型相同（按漏洞库归一）的漏洞视为重复，'
+                                '每组保留最先出现的漏洞。'))
+        form = QFormLayout()
+        risk_combo = QComboBox()
+        for key, label in FindingDeduplicator.RISK_POLICIES.items():
+            risk_combo.addItem(label, key)
+        risk_combo.setCurrentIndex(risk_combo.findData(self.dedup_risk_policy))
+        form.addRow('风险等级:', risk_combo)
+        status_combo = QComboBox()
+        for key, label in FindingDeduplicator.STATUS_POLICIES.items():
+            status_combo.addItem(label, key)
+        status_combo.setCurrentIndex(status_combo.findData(self.dedup_status_policy))
+        form.addRow('修复状态:', status_combo)
+        layout.addLayout(form)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        
+        self.dedup_risk_policy = risk_combo.currentData()
+        self.dedup_status_policy = status_combo.currentData()
+        self.apply_deduplication('合并重复漏洞')
+    
+    def apply_deduplication(self, label):
+        """合并重复漏洞并显示合并明细"""
+        merged = self.finding_deduplicator().merge(self.finding_store, label)
+        if not merged:
+            return merged
+        summary = FindingDeduplicator.summary(merged)
+        self.log_message(f"已{summary}")
+        
+        from PyQt5.QtWidgets import QDialog, QDialogButtonBox
+        dialog = QDialog(self)
+        dialog.setWindowTitle('重复漏洞合并结果')
+        dialog.resize(700, 400)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(f'已{summary}（可撤销）:'))
+        table = QTableWidget(len(merged), 4)
+        table.setHorizontalHeaderLabels(['单位', '系统', '漏洞名称', '合并数量'])
+        table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        for row, item in enumerate(merged):
+            for column, value in enumerate(item):
+                table.setItem(row, column, QTableWidgetItem(str(value)))
+        layout.addWidget(table)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        dialog.exec_()
+        return merged
+    
+    def show_name_mapping_dialog(self, pending):
+        """确认漏洞名称映射，确认结果写入别名缓存"""
+        from PyQt5.QtWidgets import QDialog, QDialogButtonBox
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle('确认漏洞名称映射')
+        dialog.setModal(True)
+        dialog.resize(700, 400)
+        
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel('以下漏洞名称未能精确匹配漏洞库，请确认对应条目:'))
+        
+        table = QTableWidget(len(pending), 3)
+        table.setHorizontalHeaderLabels(['导入名称', '漏洞库条目', '相似度'])
+        table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        all_vulns = self.vuln_manager.get_all_vulnerabilities()
+        combos = {}
+        for row, (name, (target, score, candidates)) in enumerate(pending.items()):
+            table.setItem(row, 0, QTableWidgetItem(name))
+            combo = QComboBox()
+            combo.addItem('(不映射)')
+            # 候选条目排在前面，其余漏洞库条目供手动选择
+            candidate_names = [candidate for candidate, _ in candidates]
+            combo.addItems(candidate_names)
+            combo.addItems([vuln for vuln in all_vulns if vuln not in candidate_names])
+            if target:
+                combo.setCurrentText(target)
+            table.setCellWidget(row, 1, combo)
+            table.setItem(row, 2, QTableWidgetItem(f'{score:.2f}'))
+            combos[name] = combo
+        layout.addWidget(table)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        
+        if dialog.exec_() != QDialog.Accepted:
+            return False
+        
+        mapping = {name: combo.currentText() for name, combo in combos.items()
+                   if combo.currentIndex() > 0}
+        self.vuln_manager.resolver.learn(mapping)
+        return True
+    
+    def clear_vulnerability_data(self):
+        """清空所有单位、系统和漏洞，并删除自动保存数据"""
+        reply = QMessageBox.question(
+            self,
+            '确认清空',
+            '确定要清空所有漏洞数据吗？此操作无法恢复。',
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply == QMessageBox.Yes:
+            # 经 FindingStore 删除，行索引和各视图随操作更新；之后清空日志和撤销栈
+            store = self.finding_store
+            with store.transaction('清空漏洞数据'):
+                for ui in reversed(range(len(store.data))):
+                    store.apply({'op': 'remove_unit', 'index': ui, 'name': store.data[ui]['unit']})
+            self.journal.reset()
+            self.undo_stack.clear()
+            self.update_undo_actions()
+            self.log_message("已清空漏洞数据")
+    
+    def undo(self):
+        """撤销"""
+        label = self.undo_stack.undo()
+        if label is not None:
+            self.log_message(f"已撤销: {label or '修改'}")
+        self.update_undo_actions()
+    
+    def redo(self):
+        """重做"""
+        label = self.undo_stack.redo()
+        if label is not None:
+            self.log_message(f"已重做: {label or '修改'}")
+        self.update_undo_actions()
+    
+    def update_undo_actions(self):
+        """更新撤销/重做菜单状态"""
+        self.undo_action.setEnabled(self.undo_stack.can_undo())
+        self.redo_action.setEnabled(self.undo_stack.can_redo())
+    
+    def closeEvent(self, event):
+        """关闭窗口时压缩操作日志"""
+        self.journal.close()
+        super().closeEvent(event)
     
     def update_vulnerability_table(self):
         """更新漏洞表格"""
-        self.vuln_table.setRowCount(0)
-        
-        for unit in self.vulnerability_data:
-            for system in unit['systems']:
-                for vuln in system['vulns']:
-                    row = self.vuln_table.rowCount()
-                    self.vuln_table.insertRow(row)
-                    
-                    self.vuln_table.setItem(row, 0, QTableWidgetItem(unit['unit']))
-                    self.vuln_table.setItem(row, 1, QTableWidgetItem(system['system']))
-                    self.vuln_table.setItem(row, 2, QTableWidgetItem(vuln['name']))
-                    
-                    # 获取风险等级（优先使用用户设置的值）
-                    risk_level = vuln.get('risk_level')
-                    if not risk_level:
-                        # 如果没有用户设置的值，从漏洞库获取
-                        vuln_info = self.vuln_manager.get_vulnerability(vuln['name'])
-                        risk_level = vuln_info.get('risklevel', '未知')
-                    self.vuln_table.setItem(row, 3, QTableWidgetItem(risk_level))
-                    self.vuln_table.setItem(row, 4, QTableWidgetItem(vuln.get('repaired', '未修复')))
-                    
-                    # 操作按钮
-                    edit_btn = QPushButton('编辑')
-                    edit_btn.clicked.connect(lambda checked, row=row: self.edit_vulnerability())
-                    self.vuln_table.setCellWidget(row, 5, edit_btn)
+        if hasattr(self, 'vuln_model'):
+            self.vuln_model.refresh()
+            self.vuln_tree_model.refresh()
+        if hasattr(self, 'report_preview'):
+            self.report_preview.refresh()
+            self.preview_timer.start()
+    
+    def update_preview(self):
+        """刷新报告预览（报告生成标签页不可见时推迟到切换过来时）"""
+        if self.tab_widget.currentWidget() is not self.preview_tab:
+            return
+        html, anchor = self.report_preview.render(self.collect_basic_info())
+        scroll = self.preview_browser.verticalScrollBar().value()
+        self.preview_browser.setHtml(html)
+        if anchor:
+            self.preview_browser.scrollToAnchor(anchor)
+        else:
+            self.preview_browser.verticalScrollBar().setValue(scroll)
     
     def browse_output_path(self):
         """浏览输出路径"""
@@ -973,8 +6041,17 @@ class MainWindow(QMainWindow):
         if file_path:
             self.output_path_edit.setText(file_path)
     
+    def browse_baseline_path(self):
+        """选择初测项目文件"""
+        file_path, _ = QFileDialog.getOpenFileName(self, '选择初测项目', '', 'JSON文件 (*.json)')
+        if file_path:
+            self.baseline_path_edit.setText(file_path)
+    
     def generate_report(self):
         """生成报告"""
+        if not self.check_library_ready():
+            return
+        
         if not self.output_path_edit.text():
             QMessageBox.warning(self, '警告', '请选择输出路径')
             return
@@ -989,13 +6066,33 @@ class MainWindow(QMainWindow):
             
             self.log_message("开始生成报告...")
             
+            # 主报告及勾选的附加版本（<文件名>_internal.docx、<文件名>_en.docx）
+            output = Path(output_path)
+            variants = [ReportVariant(output_path)]
+            for preset, check in self.variant_checks.items():
+                if check.isChecked():
+                    variant_path = str(output.with_name(f'{output.stem}_{preset}{output.suffix}'))
+                    variants.append(ReportVariant.preset(preset, variant_path))
+            for variant in variants:
+                variant.split_units = self.split_units_check.isChecked()
+            
+            # 复测对比的初测数据
+            baseline = None
+            if self.baseline_path_edit.text():
+                baseline = load_engagement(self.baseline_path_edit.text())[1]
+            elif self.collect_basic_info().get('isFirstTest') == '复测':
+                self.log_message("未选择初测项目，报告中不包含复测对比")
+            
             # 生成报告
-            result_path = self.report_generator.generate_report(
+            results = self.report_generator.generate_variants(
                 template_name, 
                 self.vulnerability_data, 
-                output_path
+                variants,
+                baseline=baseline
             )
             
+            result_path = '\n'.join('\n'.join(result) if isinstance(result, list) else result
+                                    for result in results)
             self.log_message(f"报告生成成功: {result_path}")
             QMessageBox.information(self, '成功', f'报告已生成: {result_path}')
             
@@ -1006,7 +6103,11 @@ class MainWindow(QMainWindow):
     def log_message(self, message):
         """添加日志消息"""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.log_text.append(f"[{timestamp}] {message}")
+        if hasattr(self, 'log_text'):
+            self.log_text.append(f"[{timestamp}] {message}")
+        else:
+            # 报告生成标签页尚未构建，先缓存日志
+            self.pending_logs.append(f"[{timestamp}] {message}")
     
     def show_about(self):
         """显示关于对话框"""
@@ -1220,8 +6321,20 @@ WeChat: rggboom
         
         dialog.exec_()
 
+# 命令行子命令，python main.py <命令> ...
+CLI_COMMANDS = {
+    'analytics': analytics_cli,
+    'daemon': daemon_cli,
+    'dedup': dedup_cli,
+    'retest': retest_cli,
+    'search': search_cli,
+}
+
 def main():
     """主函数"""
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        sys.exit(CLI_COMMANDS[sys.argv[1]](sys.argv[2:]))
+    
     app = QApplication(sys.argv)
     
     # 设置应用程序信息
@@ -1233,6 +6346,11 @@ def main():
     window = MainWindow()
     window.show()
     
+    # 设置 SSREPORT_WATCHDOG 时检测界面卡顿
+    watchdog = EventLoopWatchdog.from_environment()
+    if watchdog is not None:
+        watchdog.start()
+    
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
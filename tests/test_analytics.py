@@ -0,0 +1,23 @@
+from main import FindingAnalytics, save_engagement
+
+
+def engagement(client, vulns):
+    template = {'clientName': client, 'testDate': '2025年8月1日-2025年8月8日'}
+    return template, [{'unit': '测试单位', 'systems': [{'system': 'OA系统', 'vulns': vulns}]}]
+
+
+def test_query_falls_back_to_unique_when_key_overflows(tmp_path):
+    save_engagement(tmp_path / 'a.json', *engagement('甲公司', [
+        {'name': 'SQL注入', 'risk_level': '高危'}, {'name': 'SQL注入', 'risk_level': '高危', 'repaired': '已修复'},
+        {'name': '弱口令', 'risk_level': '中危'}]))
+    save_engagement(tmp_path / 'b.json', *engagement('乙公司', [{'name': 'SQL注入', 'risk_level': '高危'}]))
+    analytics = FindingAnalytics(tmp_path / 'store')
+    assert analytics.ingest([tmp_path]) == 4
+    
+    expected = analytics.query(FindingAnalytics.COLUMNS, top=None)
+    assert analytics.query(['vuln'], {'client': '甲公司'}) == [(('SQL注入',), 2, 1, 0.5), (('弱口令',), 1, 0, 0.0)]
+    
+    # 未使用的编码只增大组合编码空间，不改变结果
+    for column in FindingAnalytics.COLUMNS:
+        analytics.vocab[column].extend(f'{column}{k}' for k in range(300))
+    assert analytics.query(FindingAnalytics.COLUMNS, top=None) == expected
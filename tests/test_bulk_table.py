@@ -0,0 +1,40 @@
+from docx import Document
+from docx.oxml.ns import qn
+
+from main import add_bulk_table, xml_run
+
+
+def test_xml_run_escapes_and_preserves_whitespace():
+    assert xml_run('a<b>&c') == '<w:r><w:t>a&lt;b&gt;&amp;c</w:t></w:r>'
+    assert xml_run(' 前导空格') == '<w:r><w:t xml:space="preserve"> 前导空格</w:t></w:r>'
+    # 换行转为 <w:br/>，空行不生成 <w:t>
+    assert xml_run('第一行\n\n第三行') == '<w:r><w:t>第一行</w:t><w:br/><w:br/><w:t>第三行</w:t></w:r>'
+    # XML 不允许的控制字符删除
+    assert xml_run('a\x00b\x1fc\td') == '<w:r><w:t>abc\td</w:t></w:r>'
+    assert xml_run(42) == '<w:r><w:t>42</w:t></w:r>'
+
+
+def test_bulk_table_round_trips_cell_text(tmp_path):
+    doc = Document()
+    rows = [('<script>alert("x")</script>', 'A & B', ' 缩进 '),
+            ('多行\n文本', None, ''),
+            (1, 2.5, '控制\x07字符')]
+    table = add_bulk_table(doc, rows, header=('名称', '值', '备注'), widths=(2, 1, 1))
+    path = tmp_path / 'table.docx'
+    doc.save(path)
+    
+    loaded = Document(path).tables[0]
+    assert len(loaded.rows) == 4 and len(table.columns) == 3
+    assert loaded.rows[0]._tr.trPr.find(qn('w:tblHeader')) is not None
+    texts = [[cell.text for cell in row.cells] for row in loaded.rows[1:]]
+    assert texts == [['<script>alert("x")</script>', 'A & B', ' 缩进 '],
+                     ['多行\n文本', '', ''],
+                     ['1', '2.5', '控制字符']]
+    widths = [int(col.get(qn('w:w'))) for col in loaded._tbl.tblGrid.findall(qn('w:gridCol'))]
+    assert widths[0] == 2 * widths[1] and widths[1] == widths[2]
+
+
+def test_bulk_table_without_columns_adds_nothing():
+    doc = Document()
+    assert add_bulk_table(doc, []) is None
+    assert doc.tables == []
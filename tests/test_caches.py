@@ -0,0 +1,150 @@
+import os
+
+import pytest
+
+import main
+from main import (ChartCache, EvidenceCache, MappedLibrary, ReportGenerator, ReportVariant, SectionCache,
+                  VulnerabilityManager, prune_cache_dir)
+
+
+def write(path, size, mtime):
+    path.write_bytes(b'x' * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_prune_cache_dir_removes_least_recently_used(tmp_path):
+    for k in range(5):
+        write(tmp_path / f'{k}.bin', 100, 1000 + k)
+    write(tmp_path / 'other.tmp', 1000, 0)
+    
+    assert prune_cache_dir(tmp_path, '*.bin', 250, keep=[tmp_path / '0.bin']) == 200
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['0.bin', '4.bin', 'other.tmp']
+
+
+def test_section_cache_disk_size_is_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(SectionCache, 'DISK_LIMIT', 4096)
+    cache = SectionCache(str(tmp_path))
+    for k in range(50):
+        cache.put(f'{k:040x}', {'xml': os.urandom(200).hex(), 'headings': [], 'images': []})
+    assert sum(path.stat().st_size for path in tmp_path.glob('*.bin')) <= 4096
+    assert cache.get(f'{49:040x}') is not None
+
+
+def test_write_image_removes_stale_images(tmp_path):
+    vuln_file = tmp_path / 'VulnWiki.yml'
+    vuln_file.write_text('vulnerabilities:\n- name: SQL注入\n  risklevel: 高危\n', encoding='utf-8')
+    cache_dir = tmp_path / 'vulnwiki'
+    cache_dir.mkdir()
+    (cache_dir / 'stale.bin').write_bytes(b'old')
+    manager = VulnerabilityManager(str(vuln_file), str(tmp_path / 'alias.json'))
+    
+    path = manager.write_image(str(cache_dir))
+    
+    assert [p.name for p in cache_dir.iterdir()] == [os.path.basename(path)]
+    assert MappedLibrary(path)['SQL注入']['risklevel'] == '高危'
+
+
+@pytest.mark.skipif(not EvidenceCache.available(), reason='需要 Pillow')
+def test_evidence_cache_processes_dedups_and_reuses(tmp_path, monkeypatch):
+    from PIL import Image
+    sources = tmp_path / 'shots'
+    sources.mkdir()
+    Image.new('RGBA', (3000, 1000), (255, 0, 0, 128)).save(sources / 'a.png')
+    (sources / 'copy.png').write_bytes((sources / 'a.png').read_bytes())
+    Image.new('RGB', (200, 100), 'blue').save(sources / 'small.png')
+    paths = [str(sources / name) for name in ('a.png', 'copy.png', 'small.png', 'missing.png')]
+    cache = EvidenceCache(str(tmp_path / 'evidence'))
+    
+    mapping = cache.process(paths, max_workers=1)
+    
+    assert set(mapping) == set(paths[:3])
+    assert mapping[paths[0]] == mapping[paths[1]]
+    assert len(list((tmp_path / 'evidence').glob('*.jpg'))) == 2
+    with Image.open(mapping[paths[0]]) as image:
+        assert image.format == 'JPEG' and image.mode == 'RGB'
+        assert image.width == EvidenceCache.MAX_WIDTH
+    with Image.open(mapping[paths[2]]) as image:
+        assert image.size == (200, 100)
+    
+    # 已缓存的截图不再处理
+    def fail(*args):
+        raise AssertionError('不应重新处理')
+    monkeypatch.setattr(main, 'process_evidence_image', fail)
+    assert cache.process(paths, max_workers=1) == mapping
+
+
+@pytest.mark.skipif(not EvidenceCache.available(), reason='需要 Pillow')
+def test_evidence_cache_disk_size_is_capped(tmp_path, monkeypatch):
+    from PIL import Image
+    cache_dir = tmp_path / 'evidence'
+    cache_dir.mkdir()
+    for k in range(5):
+        write(cache_dir / f'old{k}.jpg', 1000, 1000 + k)
+    source = tmp_path / 'shot.png'
+    Image.new('RGB', (50, 50), 'green').save(source)
+    monkeypatch.setattr(EvidenceCache, 'DISK_LIMIT', 2500)
+    
+    cache = EvidenceCache(str(cache_dir))
+    assert sorted(path.name for path in cache_dir.iterdir()) == ['old3.jpg', 'old4.jpg']
+    mapping = cache.process([str(source)], max_workers=1)
+    
+    assert os.path.exists(mapping[str(source)])
+    assert sum(path.stat().st_size for path in cache_dir.glob('*.jpg')) <= 2500
+
+
+def counting_renders(monkeypatch, cache):
+    calls = []
+    for kind in ('risk_by_unit', 'status'):
+        render = getattr(cache, f'render_{kind}')
+        monkeypatch.setattr(cache, f'render_{kind}',
+                            lambda data, labels, kind=kind, render=render: calls.append(kind) or render(data, labels))
+    return calls
+
+
+@pytest.mark.skipif(not ChartCache.available(), reason='需要 matplotlib')
+def test_chart_cache_reuses_memory_and_disk(tmp_path, monkeypatch):
+    data = [['单位A', [1, 2, 0, 1]], ['单位B', [0, 1, 3, 0]]]
+    labels = {'title': '风险分布', 'levels': list(ChartCache.RISK_LEVELS)}
+    cache = ChartCache(str(tmp_path / 'charts'))
+    calls = counting_renders(monkeypatch, cache)
+    
+    png = cache.get('risk_by_unit', data, labels)
+    assert png.startswith(b'\x89PNG')
+    assert cache.get('risk_by_unit', data, labels) is png
+    # 文字标签不同（如英文版）时重新绘制
+    cache.get('risk_by_unit', data, dict(labels, title='Risk'))
+    assert calls == ['risk_by_unit', 'risk_by_unit']
+    assert len(list((tmp_path / 'charts').glob('*.png'))) == 2
+    
+    # 新实例（如下次启动或子进程）从磁盘读取
+    reloaded = ChartCache(str(tmp_path / 'charts'))
+    assert counting_renders(monkeypatch, reloaded) == [] and reloaded.get('risk_by_unit', data, labels) == png
+    assert not list((tmp_path / 'charts').glob('*.tmp'))
+
+
+def test_chart_cache_prunes_on_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(ChartCache, 'DISK_LIMIT', 250)
+    for k in range(4):
+        write(tmp_path / f'{k}.png', 100, 1000 + k)
+    ChartCache(str(tmp_path))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['2.png', '3.png']
+
+
+@pytest.mark.skipif(not ChartCache.available(), reason='需要 matplotlib')
+def test_charts_merge_units_beyond_limit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generator = ReportGenerator(VulnerabilityManager(alias_file='alias.json', load=False), None)
+    requests = []
+    monkeypatch.setattr(generator.chart_cache, 'get', lambda kind, data, labels: requests.append((kind, data)))
+    vuln = {'name': 'SQL注入', 'level': '高危'}
+    data = [{'unit': f'单位{k:02d}', 'systems': [{'system': 'OA系统', 'vulns': [vuln] * (k + 1)}]}
+            for k in range(ChartCache.MAX_UNITS + 2)]
+    
+    generator.render_charts(generator.build_report_model({}, data), ReportVariant('report.docx'))
+    
+    kind, by_unit = requests[0]
+    assert kind == 'risk_by_unit' and len(by_unit) == ChartCache.MAX_UNITS
+    # 漏洞最多的单位在前，其余合并为最后一项
+    assert by_unit[0] == ['单位16', [17, 0, 0, 0]]
+    assert by_unit[-1][1] == [sum(range(1, 4)), 0, 0, 0]
+    assert requests[1] == ('status', [('未修复', sum(range(1, ChartCache.MAX_UNITS + 3)))])
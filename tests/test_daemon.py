@@ -0,0 +1,118 @@
+import os
+import signal
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import main
+from main import ReportDaemon, daemon_render_worker, init_daemon_worker, save_engagement
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VULN_FILE = os.path.join(REPO, 'config', 'VulnWiki.yml')
+TEMPLATE_DIR = os.path.join(REPO, 'config', 'templates')
+
+
+def write_project(path, client='测试公司', vulns=({'name': 'SQL注入'},)):
+    save_engagement(path, {'clientName': client},
+                    [{'unit': '测试单位', 'systems': [{'system': 'OA系统', 'vulns': list(vulns)}]}])
+
+
+class ImmediatePool:
+    """同步执行任务的进程池替身，记录提交的项目文件"""
+    
+    def __init__(self):
+        self.submitted = []
+    
+    def submit(self, fn, path, digest, *args):
+        self.submitted.append(os.path.basename(path))
+        future = Future()
+        future.set_result(([], None))
+        return future
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    inbox, outbox = tmp_path / 'inbox', tmp_path / 'outbox'
+    inbox.mkdir()
+    daemon = ReportDaemon(str(inbox), str(outbox), settle=2.0)
+    daemon.pool = ImmediatePool()
+    return daemon
+
+
+def test_waits_for_file_to_settle(daemon):
+    path = os.path.join(daemon.inbox, 'a.json')
+    write_project(path)
+    assert daemon.poll_once(0.0)
+    assert daemon.poll_once(1.0)
+    # 仍在写入：大小或修改时间变化后重新计时
+    write_project(path, client='测试公司（修改）')
+    assert daemon.poll_once(1.5)
+    daemon.poll_once(3.0)
+    assert daemon.pool.submitted == []
+    daemon.poll_once(3.6)
+    assert daemon.pool.submitted == ['a.json']
+
+
+def test_skips_unchanged_content(daemon):
+    path = os.path.join(daemon.inbox, 'a.json')
+    write_project(path)
+    daemon.poll_once(0.0)
+    daemon.poll_once(3.0)
+    daemon.poll_once(4.0)  # 收集结果，记录内容哈希
+    assert daemon.pool.submitted == ['a.json']
+    
+    # 只改修改时间不改内容：不重新生成（重启后同样按保存的状态跳过）
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    restarted = ReportDaemon(daemon.inbox, daemon.outbox, settle=2.0)
+    restarted.pool = ImmediatePool()
+    for now in (0.0, 3.0, 4.0):
+        restarted.poll_once(now)
+    assert restarted.pool.submitted == []
+    
+    write_project(path, client='其他公司')
+    for now in (5.0, 8.0):
+        restarted.poll_once(now)
+    assert restarted.pool.submitted == ['a.json']
+
+
+def test_outputs_do_not_collide_and_are_moved_atomically(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    init_daemon_worker(VULN_FILE, TEMPLATE_DIR)
+    outbox = tmp_path / 'outbox'
+    sources = [tmp_path / 'foo.json', tmp_path / 'foo_en.json']
+    for source in sources:
+        write_project(source, client=source.stem)
+    
+    outputs = [daemon_render_worker(str(source), ReportDaemon.file_digest(source), str(outbox), None, ('en',))[0]
+               for source in sources]
+    
+    names = [sorted(os.path.relpath(path, outbox) for path in paths) for paths in outputs]
+    assert names == [[os.path.join('foo', 'foo.docx'), os.path.join('foo', 'foo_en.docx')],
+                     [os.path.join('foo_en', 'foo_en.docx'), os.path.join('foo_en', 'foo_en_en.docx')]]
+    assert all(os.path.exists(path) for paths in outputs for path in paths)
+    assert os.listdir(outbox / '.partial') == []
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason='需要 SIGKILL')
+def test_recovers_from_killed_worker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inbox, outbox = tmp_path / 'inbox', tmp_path / 'outbox'
+    inbox.mkdir()
+    daemon = ReportDaemon(str(inbox), str(outbox), workers=1, settle=0.0,
+                          vuln_file=VULN_FILE, template_dir=TEMPLATE_DIR)
+    daemon.log = lambda message: None
+    daemon.start_pool()
+    try:
+        for pid in list(daemon.pool._processes):
+            os.kill(pid, signal.SIGKILL)
+        time.sleep(0.5)
+        write_project(inbox / 'a.json')
+        deadline = time.monotonic() + 120
+        while 'a.json' not in daemon.done and time.monotonic() < deadline:
+            daemon.poll_once(time.monotonic())
+            time.sleep(0.1)
+        assert 'a.json' in daemon.done
+        assert (outbox / 'a' / 'a.docx').exists()
+    finally:
+        daemon.pool.shutdown(wait=True)
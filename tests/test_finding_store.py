@@ -0,0 +1,146 @@
+import copy
+
+import pytest
+
+from main import (FindingDeduplicator, FindingFilterProxyModel, FindingStore, FindingTableModel,
+                  FindingTreeModel, OperationJournal, ReportPreview, UndoStack, VulnerabilityManager)
+
+
+@pytest.fixture
+def vuln_manager(tmp_path):
+    manager = VulnerabilityManager(alias_file=str(tmp_path / 'alias.json'), load=False)
+    manager.vulnerabilities = {
+        'SQL注入': {'name': 'SQL注入', 'risklevel': '高危', 'description': 'SQL注入描述'},
+        '弱口令': {'name': '弱口令', 'risklevel': '中危', 'description': '弱口令描述'},
+    }
+    return manager
+
+
+@pytest.fixture
+def views(qapp, tmp_path, vuln_manager):
+    """挂载全部 FindingStore 监听者"""
+    def attach(data):
+        journal = OperationJournal(str(tmp_path / 'autosave'))
+        store = FindingStore(journal.recover())
+        store.listeners.append(journal.record)
+        with store.transaction('导入漏洞数据'):
+            for unit in copy.deepcopy(data):
+                ui = store.add_unit(unit['unit'])
+                for system in unit['systems']:
+                    si = store.add_system(ui, system['system'])
+                    store.add_vulnerabilities(ui, si, system['vulns'])
+        table = FindingTableModel(store, vuln_manager)
+        proxy = FindingFilterProxyModel()
+        proxy.setSourceModel(table)
+        tree = FindingTreeModel(store, vuln_manager)
+        for ui, unit in enumerate(store.data):
+            for si in range(len(unit['systems'])):
+                parent = tree.index(si, 0, tree.index(ui, 0))
+                while tree.canFetchMore(parent):
+                    tree.fetchMore(parent)
+        preview = ReportPreview(store, vuln_manager)
+        undo = UndoStack(store)
+        return store, table, proxy, tree, preview, undo, journal
+    return attach
+
+
+def engagement(*systems):
+    return [{'unit': '测试单位', 'systems': [{'system': name, 'vulns': vulns} for name, vulns in systems]}]
+
+
+def deduplicator(vuln_manager):
+    return FindingDeduplicator(vuln_manager.canonical_name, vuln_manager.risk_level)
+
+
+def assert_views_consistent(store, table, proxy, tree, preview, vuln_manager):
+    rows = [row[2] for row in store.rows]
+    assert table.rowCount() == len(rows)
+    assert proxy.rowCount() == len(rows)
+    assert tree.root.counts == [sum(counts) for counts in zip([0] * 5, *map(tree.vuln_counts, rows))]
+    assert tree.rowCount() == len(store.data)
+    for ui, unit in enumerate(store.data):
+        assert tree.rowCount(tree.index(ui, 0)) == len(unit['systems'])
+    assert sorted(preview.entries) == sorted(map(id, rows))
+    levels = [vuln_manager.risk_level(vuln) for vuln in rows]
+    assert {level: count for level, count in preview.risk_counts.items() if count} == \
+        {level: levels.count(level) for level in set(levels)}
+    assert preview.render({})[0]
+
+
+def test_merge_mixed_update_and_remove(views, vuln_manager, tmp_path):
+    # 删除的重复项位于另一组保留漏洞之前：修改与删除在同一事务中提交
+    data = engagement(('OA系统', [{'name': 'SQL注入', 'risk_level': '低危'}, {'name': 'SQL注入'},
+                                 {'name': '弱口令'}, {'name': '弱口令', 'repaired': '已修复'}]))
+    store, table, proxy, tree, preview, undo, journal = views(data)
+    
+    merged = deduplicator(vuln_manager).merge(store)
+    
+    assert [item[2:] for item in merged] == [('SQL注入', 1), ('弱口令', 1)]
+    vulns = store.data[0]['systems'][0]['vulns']
+    assert vulns == [{'name': 'SQL注入', 'risk_level': '高危'}, {'name': '弱口令', 'repaired': '已修复'}]
+    assert_views_consistent(store, table, proxy, tree, preview, vuln_manager)
+    assert preview.risk_counts.get('低危', 0) == 0
+    
+    journal.close()
+    recovered = OperationJournal(str(tmp_path / 'autosave')).recover()
+    assert recovered == store.data
+    
+    undo.undo()
+    assert store.data == data
+    assert_views_consistent(store, table, proxy, tree, preview, vuln_manager)
+
+
+def test_merge_removes_emptied_systems(views, vuln_manager):
+    data = engagement(('OA系统', [{'name': 'SQL注入'}]),
+                      ('OA系统', [{'name': 'SQL注入', 'images': ['a.png']}, {'name': '弱口令'}]),
+                      ('oa系统', [{'name': '弱口令'}]))
+    store, table, proxy, tree, preview, undo, journal = views(data)
+    
+    deduplicator(vuln_manager).merge(store)
+    
+    assert store.data == engagement(('OA系统', [{'name': 'SQL注入', 'images': ['a.png']}]),
+                                    ('OA系统', [{'name': '弱口令'}]))
+    assert_views_consistent(store, table, proxy, tree, preview, vuln_manager)
+    
+    undo.undo()
+    assert store.data == data
+    assert_views_consistent(store, table, proxy, tree, preview, vuln_manager)
+    journal.close()
+
+
+def test_remove_all_units(views, vuln_manager):
+    data = engagement(('OA系统', [{'name': 'SQL注入'}]), ('门户网站', [{'name': '弱口令'}]))
+    store, table, proxy, tree, preview, undo, journal = views(data)
+    
+    with store.transaction('清空漏洞数据'):
+        for ui in reversed(range(len(store.data))):
+            store.apply({'op': 'remove_unit', 'index': ui, 'name': store.data[ui]['unit']})
+    
+    assert store.data == [] and store.rows == [] and store.row_of == {}
+    assert_views_consistent(store, table, proxy, tree, preview, vuln_manager)
+    journal.close()
+
+
+def test_undo_remove_non_empty_unit_and_system(views, vuln_manager, tmp_path):
+    data = [{'unit': '测试单位', 'systems': [{'system': 'OA系统', 'vulns': [{'name': 'SQL注入'}]},
+                                         {'system': '门户网站', 'vulns': [{'name': '弱口令'}]}]},
+            {'unit': '分公司', 'systems': [{'system': '邮件系统', 'vulns': [{'name': 'SQL注入'}, {'name': '弱口令'}]}]}]
+    store, table, proxy, tree, preview, undo, journal = views(data)
+    
+    with store.transaction('删除单位和系统'):
+        store.apply({'op': 'remove_unit', 'index': 1})
+        store.apply({'op': 'remove_system', 'unit': 0, 'index': 0})
+    assert store.data == [{'unit': '测试单位', 'systems': [{'system': '门户网站', 'vulns': [{'name': '弱口令'}]}]}]
+    assert_views_consistent(store, table, proxy, tree, preview, vuln_manager)
+    
+    undo.undo()
+    assert store.data == data
+    assert_views_consistent(store, table, proxy, tree, preview, vuln_manager)
+    
+    undo.redo()
+    undo.undo()
+    assert store.data == data
+    assert_views_consistent(store, table, proxy, tree, preview, vuln_manager)
+    
+    journal.close()
+    assert OperationJournal(str(tmp_path / 'autosave')).recover() == store.data
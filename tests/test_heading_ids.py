@@ -0,0 +1,25 @@
+from docx import Document
+from docx.oxml.ns import qn
+
+from main import HeadingIds
+
+
+def test_headings_get_unique_ids_and_toc_entries():
+    doc = Document()
+    ids = HeadingIds()
+    title = doc.add_heading('报告', 0)
+    ids.mark(title._p, 0, '报告')
+    headings = [doc.add_heading(f'系统{k}', 1 + k % 3) for k in range(6)]
+    for k, heading in enumerate(headings):
+        ids.mark(heading._p, 1 + k % 3, f'系统{k}')
+    
+    para_ids = [p._p.get(qn('w14:paraId')) for p in [title] + headings]
+    assert len(set(para_ids)) == len(para_ids)
+    bookmarks = [p._p.find(qn('w:bookmarkStart')) for p in headings]
+    assert len({b.get(qn('w:id')) for b in bookmarks}) == len(headings)
+    assert title._p.find(qn('w:bookmarkStart')) is None
+    
+    toc = ids.toc_xml(2)
+    assert toc.count('<w:hyperlink') == 4
+    shown = [b.get(qn('w:name')) for k, b in enumerate(bookmarks) if 1 + k % 3 <= 2]
+    assert all(f'w:anchor="{name}"' in toc for name in shown)
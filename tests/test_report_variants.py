@@ -0,0 +1,167 @@
+import os
+import tracemalloc
+
+from docx import Document
+
+import main
+from main import METRICS, MemoryTracker, ReportGenerator, ReportVariant, TemplateManager, VulnerabilityManager
+
+
+def test_english_variant_uses_optional_en_fields(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vuln_manager = VulnerabilityManager(alias_file='alias.json', load=False)
+    vuln_manager.vulnerabilities = {
+        'SQL注入': {'name': 'SQL注入', 'risklevel': '高危', 'description': 'SQL注入描述',
+                  'name_en': 'SQL Injection', 'description_en': 'SQL injection description'},
+        '弱口令': {'name': '弱口令', 'risklevel': '中危', 'description': '弱口令描述'},
+    }
+    generator = ReportGenerator(vuln_manager, TemplateManager(load=False))
+    data = [{'unit': '测试单位', 'systems': [{'system': 'OA系统', 'vulns': [
+        {'name': 'SQL注入'}, {'name': '弱口令', 'repaired': '已修复'}]}]}]
+    model = generator.build_report_model({'clientName': '测试公司'}, data)
+    variant = ReportVariant(str(tmp_path / 'report_en.docx'), language='en', charts=False)
+    
+    generator.render_variant(model, variant)
+    
+    text = '\n'.join(p.text for p in Document(variant.output_path).paragraphs)
+    assert '3.1.1.1 SQL Injection' in text
+    assert 'SQL injection description' in text
+    # 未填写英文字段时沿用中文
+    assert '3.1.1.2 弱口令' in text and '弱口令描述' in text
+    assert 'Fixed' in text
+
+
+def test_memory_budget_logs_parts_that_stay_over_budget(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vuln_manager = VulnerabilityManager(alias_file='alias.json', load=False)
+    budget = ReportGenerator.BASE_MEMORY + 10 * ReportGenerator.FINDING_MEMORY
+    logs = []
+    generator = ReportGenerator(vuln_manager, TemplateManager(load=False), memory_budget=budget, log=logs.append)
+    data = [{'unit': '测试单位', 'systems': [
+        {'system': '小系统', 'vulns': [{'name': f'漏洞{k}'} for k in range(5)]},
+        {'system': '大系统', 'vulns': [{'name': f'漏洞{k}'} for k in range(30)]}]}]
+    model = generator.build_report_model({'clientName': '测试公司'}, data)
+    variant = ReportVariant(str(tmp_path / 'report.docx'), charts=False)
+    
+    paths = generator.render_variant(model, variant)
+    
+    assert [p.rsplit('_', 1)[1] for p in paths] == ['part1.docx', 'part2.docx']
+    assert any('第 2 部分' in line and '大系统' in line and '30 个漏洞' in line for line in logs)
+    assert not any('第 1 部分' in line for line in logs)
+
+
+def test_split_run_records_document_metrics(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(METRICS, 'enabled', True)
+    METRICS.drain()
+    generator = ReportGenerator(VulnerabilityManager(alias_file='alias.json', load=False), TemplateManager(load=False))
+    data = [{'unit': f'单位{k}', 'systems': [{'system': 'OA系统', 'vulns': [{'name': 'SQL注入'}] * 3}]}
+            for k in range(2)]
+    variant = ReportVariant(str(tmp_path / 'report.docx'), charts=False, split_units=True)
+    
+    generator.render_variants({'clientName': '测试公司'}, data, [variant], max_workers=1)
+    
+    values, histograms = METRICS.drain()
+    assert values[('ssreport_documents_total', ())] == 3
+    assert values[('ssreport_findings_total', ())] == 6
+    assert histograms[('ssreport_document_seconds', ())][2] == 3
+    assert histograms[('ssreport_document_rss_bytes', ())][2] == 3
+
+
+def test_memory_budget_splits_large_unit_documents(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    budget = ReportGenerator.BASE_MEMORY + 10 * ReportGenerator.FINDING_MEMORY
+    logs = []
+    generator = ReportGenerator(VulnerabilityManager(alias_file='alias.json', load=False), TemplateManager(load=False),
+                                memory_budget=budget, log=logs.append)
+    data = [{'unit': '小单位', 'systems': [{'system': 'OA系统', 'vulns': [{'name': 'SQL注入'}] * 3}]},
+            {'unit': '大单位', 'systems': [{'system': f'系统{k}', 'vulns': [{'name': 'SQL注入'}] * 8}
+                                         for k in range(3)]}]
+    variant = ReportVariant(str(tmp_path / 'report.docx'), charts=False, split_units=True)
+    
+    result = generator.render_variants({'clientName': '测试公司'}, data, [variant], max_workers=4)[0]
+    
+    names = [os.path.relpath(path, tmp_path) for path in result]
+    assert names[0] == 'report.docx'
+    assert len(names) == 1 + 1 + 3
+    assert sum('_part' in name for name in names) == 3
+    assert any(line.startswith('大单位 估算内存') and '拆分为 3 个文档' in line for line in logs)
+    assert not tracemalloc.is_tracing()
+    assert any(line.startswith('内存统计') and 'RSS增量' in line for line in logs)
+
+
+def test_memory_tracker_traces_python_only_on_request():
+    tracker = MemoryTracker(enabled=True)
+    tracker.start()
+    with tracker.stage('阶段'):
+        assert not tracemalloc.is_tracing()
+    tracker.stop()
+    assert tracker.stages[0][1] is None
+    
+    tracker = MemoryTracker(enabled=True, trace_python=True)
+    tracker.start()
+    with tracker.stage('阶段'):
+        data = [object() for _ in range(1000)]
+    tracker.stop()
+    assert tracker.stages[0][1] > 0 and not tracemalloc.is_tracing()
+    del data
+
+
+def test_section_cache_directory_setting(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vuln_manager = VulnerabilityManager(alias_file='alias.json', load=False)
+    data = [{'unit': '测试单位', 'systems': [{'system': 'OA系统', 'vulns': [{'name': 'SQL注入'}]}]}]
+    
+    monkeypatch.setenv('SSREPORT_SECTION_CACHE', 'off')
+    generator = ReportGenerator(vuln_manager, TemplateManager(load=False))
+    generator.render_variant(generator.build_report_model({}, data),
+                             ReportVariant(str(tmp_path / 'off.docx'), charts=False))
+    assert generator.section_cache is None
+    assert not os.path.exists('cache/sections')
+    
+    monkeypatch.setenv('SSREPORT_SECTION_CACHE', str(tmp_path / 'private'))
+    generator = ReportGenerator(vuln_manager, TemplateManager(load=False))
+    generator.render_variant(generator.build_report_model({}, data),
+                             ReportVariant(str(tmp_path / 'moved.docx'), charts=False))
+    assert os.listdir(tmp_path / 'private')
+    assert not os.path.exists('cache/sections')
+
+
+def test_render_worker_reuses_generator(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, '_render_generator', None)
+    generator = ReportGenerator(VulnerabilityManager(alias_file='alias.json', load=False), TemplateManager(load=False))
+    data = [{'unit': '测试单位', 'systems': [{'system': 'OA系统', 'vulns': [{'name': 'SQL注入'}]}]}]
+    model = generator.build_report_model({}, data)
+    
+    main.init_render_worker(None, 'worker_sections')
+    worker_generator = main._render_generator
+    main.render_variant_worker(model, ReportVariant(str(tmp_path / 'a.docx'), charts=False))
+    # 第二个任务直接使用第一个任务留下的章节缓存，不再渲染
+    monkeypatch.setattr(worker_generator, 'render_section', None)
+    main.render_variant_worker(model, ReportVariant(str(tmp_path / 'b.docx'), charts=False))
+    
+    assert main._render_generator is worker_generator
+    assert os.listdir('worker_sections')
+    assert os.path.exists(tmp_path / 'b.docx')
+
+
+def test_cleared_text_overrides_library(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vuln_manager = VulnerabilityManager(alias_file='alias.json', load=False)
+    vuln_manager.vulnerabilities = {
+        'SQL注入': {'name': 'SQL注入', 'risklevel': '高危', 'description': 'SQL注入描述', 'harm': 'SQL注入危害'}}
+    # 导入数据中的空字符串表示未填写，cleared 中的字段为有意清空
+    imported = {'name': 'SQL注入', 'desc': '', 'harm': ''}
+    cleared = {'name': 'SQL注入', 'cleared': ['desc']}
+    assert vuln_manager.resolve_finding(imported)['description'] == 'SQL注入描述'
+    assert vuln_manager.resolve_finding(cleared)['description'] == ''
+    assert vuln_manager.resolve_finding(cleared)['harm'] == 'SQL注入危害'
+    
+    generator = ReportGenerator(vuln_manager, TemplateManager(load=False))
+    data = [{'unit': '测试单位', 'systems': [{'system': 'OA系统', 'vulns': [imported, cleared]}]}]
+    variant = ReportVariant(str(tmp_path / 'report.docx'), charts=False)
+    generator.render_variant(generator.build_report_model({}, data), variant)
+    
+    text = '\n'.join(p.text for p in Document(variant.output_path).paragraphs)
+    assert text.count('SQL注入描述') == 1 and text.count('SQL注入危害') == 2
@@ -0,0 +1,55 @@
+from main import RetestDiff
+
+
+def engagement(vulns):
+    return [{'unit': '测试单位', 'systems': [{'system': 'OA系统', 'vulns': vulns}]}]
+
+
+def test_retest_categories():
+    baseline = engagement([
+        {'name': 'SQL注入'}, {'name': '弱口令'}, {'name': 'XSS', 'repaired': '已修复'},
+        {'name': '越权', 'repaired': '已修复'}, {'name': '信息泄露', 'repaired': '不适用'}, {'name': 'SSRF'},
+        {'name': 'CSRF'}])
+    retest = engagement([
+        {'name': 'SQL注入', 'repaired': '已修复'}, {'name': '弱口令'}, {'name': 'XSS'},
+        {'name': '越权', 'repaired': '已修复'}, {'name': '文件上传'}, {'name': 'CSRF', 'repaired': '不适用'}])
+    
+    diff = RetestDiff(baseline, retest)
+    
+    names = {category: sorted(key[2] for key, _, _ in items) for category, items in diff.results.items()}
+    assert names == {'fixed': ['CSRF', 'SQL注入', 'SSRF'], 'regressed': ['XSS'], 'new': ['文件上传'],
+                     'unchanged': ['弱口令'], 'closed': ['信息泄露', '越权']}
+    assert diff.summary() == '已修复 3，重新出现 1，新发现 1，未修复 1，此前已修复 2'
+    assert len(diff.rows()) == 8
+
+
+def test_reordered_findings_match_on_content():
+    baseline = engagement([
+        {'name': 'SQL注入', 'desc': '登录接口 username 参数'},
+        {'name': 'SQL注入', 'desc': '查询接口 id 参数', 'repaired': '已修复'},
+        {'name': 'SQL注入', 'desc': '导出接口 order 参数'}])
+    # 复测时同类漏洞顺序调整：按描述配对，而不是按同类序号
+    retest = engagement([
+        {'name': 'SQL注入', 'desc': '查询接口 id 参数', 'repaired': '已修复'},
+        {'name': 'SQL注入', 'desc': '登录接口 username 参数', 'repaired': '已修复'},
+        {'name': 'SQL注入', 'desc': '导出接口 order 参数'}])
+    
+    diff = RetestDiff(baseline, retest)
+    
+    descs = {category: [old['desc'] for _, old, _ in items] for category, items in diff.results.items() if items}
+    assert descs == {'fixed': ['登录接口 username 参数'], 'closed': ['查询接口 id 参数'],
+                     'unchanged': ['导出接口 order 参数']}
+    assert [key[3] for key, _, _ in diff.results['fixed']] == [1]
+
+
+def test_unmatched_content_falls_back_to_order():
+    baseline = engagement([{'name': '弱口令', 'desc': '后台 admin/admin'}, {'name': '弱口令'}])
+    retest = engagement([{'name': '弱口令', 'desc': '后台 admin/123456', 'repaired': '已修复'}, {'name': '弱口令'},
+                         {'name': '弱口令', 'desc': 'FTP 匿名登录'}])
+    
+    diff = RetestDiff(baseline, retest)
+    
+    assert [(key[3], old, new['desc']) for key, old, new in diff.results['fixed']] == \
+        [(1, {'name': '弱口令', 'desc': '后台 admin/admin'}, '后台 admin/123456')]
+    assert [key[3] for key, _, _ in diff.results['unchanged']] == [2]
+    assert [(key[3], new['desc']) for key, _, new in diff.results['new']] == [(3, 'FTP 匿名登录')]
@@ -0,0 +1,80 @@
+import os
+
+from docx import Document
+
+from main import ReportSearchIndex
+
+
+def write_report(path, findings, mtime=None):
+    doc = Document()
+    doc.add_heading('3. 漏洞详情', 1)
+    for name, text in findings:
+        doc.add_heading(name, 2)
+        doc.add_paragraph(text)
+    doc.save(path)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def found(index, query):
+    return sorted((os.path.basename(result['path']), result['headings'][-1])
+                  for result in index.search(query)[0])
+
+
+def segment_files(index_dir):
+    return sorted(name for name in os.listdir(index_dir) if name.startswith('seg-'))
+
+
+def test_incremental_update(tmp_path):
+    reports = tmp_path / 'reports'
+    reports.mkdir()
+    write_report(reports / '甲公司渗透测试报告.docx', [('SQL注入', '登录接口存在SQL注入'), ('弱口令', '后台弱口令')], 1000)
+    write_report(reports / '乙公司渗透测试报告.docx', [('跨站脚本', '搜索框存在反射型XSS')], 2000)
+    index = ReportSearchIndex(tmp_path / 'index')
+    
+    assert index.update([reports], max_workers=1) == (2, 0)
+    assert found(index, '登录接口') == [('甲公司渗透测试报告.docx', 'SQL注入')]
+    assert found(index, 'xss') == [('乙公司渗透测试报告.docx', '跨站脚本')]
+    assert index.search('弱口令')[0][0]['client'] == '甲公司'
+    assert index.update([reports], max_workers=1) == (0, 0)
+    
+    # 只修改了时间、内容未变的文件不重新索引
+    os.utime(reports / '乙公司渗透测试报告.docx', (3000, 3000))
+    assert index.update([reports], max_workers=1) == (0, 0)
+    assert segment_files(tmp_path / 'index') == ['seg-000001.idx', 'seg-000001.txt']
+    
+    # 修改的文件写入新段，旧段中该文件的章节失效
+    write_report(reports / '甲公司渗透测试报告.docx', [('SQL注入', '订单接口存在SQL注入')], 4000)
+    assert index.update([reports], max_workers=1) == (1, 0)
+    assert found(index, '登录接口') == [] and found(index, '弱口令') == []
+    assert found(index, '订单接口') == [('甲公司渗透测试报告.docx', 'SQL注入')]
+    assert found(index, 'SQL注入') == [('甲公司渗透测试报告.docx', 'SQL注入')]
+    assert index.section_count == 4  # 每份报告另有"3. 漏洞详情"章节
+    
+    # 删除的文件从索引中移除，不再有有效文件的段一并删除
+    os.remove(reports / '乙公司渗透测试报告.docx')
+    assert index.update([reports], max_workers=1) == (0, 1)
+    assert found(index, 'xss') == []
+    assert segment_files(tmp_path / 'index') == ['seg-000002.idx', 'seg-000002.txt']
+    
+    reloaded = ReportSearchIndex(tmp_path / 'index')
+    assert found(reloaded, '订单接口') == [('甲公司渗透测试报告.docx', 'SQL注入')]
+    assert reloaded.update([reports], max_workers=1) == (0, 0)
+
+
+def test_segments_compact_beyond_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(ReportSearchIndex, 'MAX_SEGMENTS', 2)
+    reports = tmp_path / 'reports'
+    reports.mkdir()
+    index = ReportSearchIndex(tmp_path / 'index')
+    for k in range(3):
+        write_report(reports / f'客户{k}渗透测试报告.docx', [('信息泄露', f'接口泄露了第{k}号配置')], 1000 + k)
+        index.update([reports], max_workers=1)
+    
+    assert len(index.segment_ids) == 1
+    assert segment_files(tmp_path / 'index') == [f'seg-{index.segment_ids[0]:06d}.idx',
+                                                 f'seg-{index.segment_ids[0]:06d}.txt']
+    assert found(index, '信息泄露') == [(f'客户{k}渗透测试报告.docx', '信息泄露') for k in range(3)]
+    # 结果按报告修改时间从新到旧排列
+    assert [os.path.basename(result['path']) for result in index.search('配置')[0]] == \
+        [f'客户{k}渗透测试报告.docx' for k in reversed(range(3))]
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from main import VulnNameResolver
+
+
+NAMES = ['SQL注入', '跨站脚本攻击(XSS)', '跨站请求伪造（CSRF）', '弱口令', '文件上传漏洞']
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    return VulnNameResolver(NAMES, str(tmp_path / 'alias.json'))
+
+
+def test_normalize_strips_owasp_prefix_punctuation_and_suffixes():
+    assert VulnNameResolver.normalize('A03:2021-Injection') == 'injection'
+    assert VulnNameResolver.normalize(' SQL 注入漏洞 ') == 'sql注入'
+    assert VulnNameResolver.normalize('跨站脚本攻击') == '跨站脚本'
+    # 名称只有后缀时保留
+    assert VulnNameResolver.normalize('漏洞') == '漏洞'
+
+
+def test_lookup_exact_and_bracketed_aliases(resolver):
+    assert resolver.lookup('sql注入漏洞') == 'SQL注入'
+    assert resolver.lookup('文件上传') == '文件上传漏洞'
+    # 括号内的缩写和括号前的主体都可命中
+    assert resolver.lookup('XSS') == '跨站脚本攻击(XSS)'
+    assert resolver.lookup('跨站脚本') == '跨站脚本攻击(XSS)'
+    assert resolver.lookup('csrf') == '跨站请求伪造（CSRF）'
+    assert resolver.lookup('命令执行') is None
+
+
+def test_suggest_ranks_by_dice_similarity(resolver):
+    candidates = resolver.suggest('SQL注入点')
+    assert candidates[0][0] == 'SQL注入'
+    # 规范化后 sql注入 与 sql注入点 分别有4个和5个二元组，共有4个
+    assert candidates[0][1] == pytest.approx(2 * 4 / (4 + 5))
+    assert all(score >= 0.4 for _, score in candidates)
+    assert resolver.suggest('完全无关') == []
+    assert resolver.suggest('') == []
+
+
+def test_resolve_many_deduplicates_names(resolver):
+    results = resolver.resolve_many(['SQL注入', 'SQL注入', 'SQL注入点', '完全无关'])
+    assert list(results) == ['SQL注入', 'SQL注入点', '完全无关']
+    assert results['SQL注入'] == ('SQL注入', 1.0, [('SQL注入', 1.0)])
+    assert results['SQL注入点'][0] == 'SQL注入'
+    assert results['完全无关'] == (None, 0.0, [])
+
+
+def test_learned_aliases_persist(resolver, tmp_path):
+    resolver.learn({'口令强度不足': '弱口令', 'SQL注入': 'SQL注入', '未匹配': None})
+    
+    with open(tmp_path / 'alias.json', encoding='utf-8') as f:
+        assert json.load(f) == {'口令强度不足': '弱口令'}
+    reloaded = VulnNameResolver(NAMES, str(tmp_path / 'alias.json'))
+    assert reloaded.lookup('口令强度不足') == '弱口令'
+    assert reloaded.resolve_many(['口令强度不足'])['口令强度不足'][1] == 1.0
@@ -0,0 +1,55 @@
+import time
+
+from PyQt5.QtCore import QEventLoop, QTimer
+
+from main import EventLoopWatchdog
+
+
+def test_from_environment(monkeypatch):
+    monkeypatch.delenv('SSREPORT_WATCHDOG', raising=False)
+    assert EventLoopWatchdog.from_environment() is None
+    
+    monkeypatch.setenv('SSREPORT_WATCHDOG', '300')
+    monkeypatch.setenv('SSREPORT_WATCHDOG_REPORT', 'stalls.txt')
+    watchdog = EventLoopWatchdog.from_environment()
+    assert watchdog.threshold == 0.3 and watchdog.report_path == 'stalls.txt'
+    
+    for value in ('1', 'yes'):
+        monkeypatch.setenv('SSREPORT_WATCHDOG', value)
+        assert EventLoopWatchdog.from_environment().threshold == 0.2
+
+
+def test_slot_name_skips_nested_event_loops():
+    stack = [('main.py', 10, 'MainWindow.edit_vulnerability', 'if dialog.exec_() == QDialog.Accepted:'),
+             ('main.py', 20, 'MainWindow.on_accept', 'self.save_all()'),
+             ('main.py', 30, 'MainWindow.save_all', 'json.dump(data, f)')]
+    assert EventLoopWatchdog.slot_name(stack) == 'MainWindow.on_accept'
+    assert EventLoopWatchdog.slot_name(stack[1:]) == 'MainWindow.on_accept'
+
+
+def blocking_slot():
+    time.sleep(0.4)
+
+
+def run_event_loop(seconds):
+    loop = QEventLoop()
+    QTimer.singleShot(int(seconds * 1000), loop.quit)
+    loop.exec_()
+
+
+def test_stall_is_attributed_to_blocking_slot(qapp, tmp_path):
+    report_path = tmp_path / 'stall_report.txt'
+    watchdog = EventLoopWatchdog(threshold=0.1, report_path=str(report_path))
+    watchdog.start()
+    try:
+        QTimer.singleShot(100, blocking_slot)
+        run_event_loop(0.8)
+    finally:
+        watchdog.stop()
+    
+    assert list(watchdog.stalls) == ['blocking_slot']
+    entry = watchdog.stalls['blocking_slot']
+    assert entry['count'] == 1 and 0.2 < entry['max'] < 0.6
+    assert max(watchdog.latencies) > 0.2
+    report = report_path.read_text(encoding='utf-8')
+    assert '1. blocking_slot: 1 次' in report and 'time.sleep(0.4)' in report